@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""Controller-side latency and throughput benchmark against FakeControlServer.
+
+Measures TorShield's controller code paths without Tor: connecting and
+authenticating with tor_utils.create_controller(), GETINFO round trips,
+NEWNYM until the ExitResolver sees the new exit, and how fast
+BandwidthMonitor consumes a burst of BW events. --latency, --jitter and
+--failure-rate are passed to the fake server to see how those paths
+behave on a slow or flaky control port.
+
+    python benchmarks/control_benchmark.py --iterations 200 --output control.json
+    python benchmarks/control_benchmark.py --latency 0.005 --failure-rate 0.05 --baseline control.json
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARK_DIR))
+
+from benchmarks.fake_control import FakeControlServer
+from benchmarks.run_benchmarks import summarize, print_report, git_revision
+from src.utils.tor_utils import create_controller
+from src.utils.bandwidth import BandwidthMonitor
+from src.utils.exit_resolver import ExitResolver
+
+def timed(samples, errors, metric, function):
+    started = time.perf_counter()
+    try:
+        result = function()
+    except Exception:
+        errors[metric] = errors.get(metric, 0) + 1
+        return None
+    samples.setdefault(metric, []).append(time.perf_counter() - started)
+    return result
+
+def run(args):
+    server = FakeControlServer(latency=args.latency, jitter=args.jitter, failure_rate=args.failure_rate,
+                               circuit_delay=args.circuit_delay, seed=1)
+    port = server.start()
+    server.build_circuit()
+    samples, errors, throughput = {}, {}, {}
+    try:
+        for _ in range(min(args.iterations, 20)):
+            controller = timed(samples, errors, 'connect', lambda: create_controller(port))
+            if controller:
+                controller.close()
+
+        controller = create_controller(port)
+        try:
+            started = time.perf_counter()
+            for _ in range(args.iterations):
+                timed(samples, errors, 'getinfo', lambda: controller.get_info('traffic/read'))
+            throughput['getinfo_per_second'] = args.iterations / (time.perf_counter() - started)
+
+            resolver = ExitResolver()
+            resolver.attach(controller)
+            for _ in range(min(args.iterations, 50)):
+                def rotate():
+                    requested_at = time.monotonic()
+                    resolver.expect_new_exit()
+                    controller.signal('NEWNYM')
+                    if not resolver.wait_for_exit(5, since=requested_at):
+                        raise Exception('No new exit')
+                timed(samples, errors, 'newnym', rotate)
+            resolver.detach()
+
+            monitor = BandwidthMonitor()
+            monitor.attach(controller)
+            server.wait_for_subscriber('BW')
+            started = time.perf_counter()
+            for _ in range(args.events):
+                server.emit('BW', '1 1')
+            deadline = time.monotonic() + 30
+            while monitor.total_read < args.events and time.monotonic() < deadline:
+                time.sleep(0.001)
+            elapsed = time.perf_counter() - started
+            monitor.detach()
+            if monitor.total_read < args.events:
+                errors['bw_event'] = args.events - monitor.total_read
+            throughput['bw_events_per_second'] = monitor.total_read / elapsed
+        finally:
+            controller.close()
+    finally:
+        server.stop()
+
+    return {
+        'metadata': {
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'timestamp': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'iterations': args.iterations,
+            'events': args.events,
+            'latency': args.latency,
+            'jitter': args.jitter,
+            'failure_rate': args.failure_rate,
+            'circuit_delay': args.circuit_delay,
+            'commands': dict(server.command_counts),
+            'errors': errors,
+            'failures': sum(errors.values())
+        },
+        'throughput': throughput,
+        'metrics': {metric: summarize(values) for metric, values in samples.items()}
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark controller code paths against a fake control port')
+    parser.add_argument('--iterations', type=int, default=200, help='GETINFO round trips (default: 200)')
+    parser.add_argument('--events', type=int, default=5000, help='BW events in the burst (default: 5000)')
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds added to every control reply')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Random extra seconds added to every reply')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='Fraction of commands that fail')
+    parser.add_argument('--circuit-delay', type=float, default=0.0, help='Seconds per fake circuit build')
+    parser.add_argument('--output', help='Write the JSON report to this file')
+    parser.add_argument('--baseline', help='Compare medians with a previous JSON report')
+    args = parser.parse_args()
+
+    report = run(args)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+    for name, value in report['throughput'].items():
+        print(f'{name}: {value:.0f}')
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=4)
+        print(f'Report written to {args.output}')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,446 @@
+#!/usr/bin/env python3
+"""In-process stand-in for Tor's control port.
+
+FakeControlServer implements the part of the control protocol TorShield
+uses: PROTOCOLINFO, AUTHENTICATE, GETINFO, GETCONF/SETCONF/RESETCONF,
+SETEVENTS, SIGNAL (NEWNYM builds a new circuit), TAKEOWNERSHIP,
+EXTENDCIRCUIT, CLOSECIRCUIT and QUIT. Events (CIRC, BW, STATUS_CLIENT,
+STREAM, ...) go to every connection that subscribed to them, either
+emitted directly with emit() or played from a script of
+(delay, event_type, body) tuples.
+
+Replies can be slowed down (latency, jitter) and failures injected per
+command or GETINFO key, at random (failure_rate) or by dropping the
+connection (drop_rate), so controller code can be load- and
+regression-tested without Tor or a network. Run this file directly to
+serve a standalone control port:
+
+    python benchmarks/fake_control.py --port 9051 --latency 0.01 --bw-interval 1
+"""
+import argparse
+import base64
+import hashlib
+import os
+import random
+import re
+import socket
+import threading
+import time
+
+VERSION = '0.4.8.10'
+COUNTRIES = ('de', 'nl', 'us', 'fr', 'se', 'ch', 'ro', 'ca')
+BOOTSTRAP_DONE = (100, 'done', 'Done')
+# KEY, KEY=value or KEY="quoted value" in SETCONF/RESETCONF arguments
+CONF_ITEM = re.compile(r'([^\s=]+)(?:=("(?:[^"\\]|\\.)*"|\S*))?')
+
+def make_relays(count, seed=42):
+    """Deterministic fake relays with TEST-NET-2 addresses"""
+    rng = random.Random(seed)
+    relays = []
+    for index in range(count):
+        fingerprint = ''.join(rng.choice('0123456789ABCDEF') for _ in range(40))
+        relays.append({
+            'fingerprint': fingerprint,
+            'nickname': f'stub{index}',
+            'address': f'198.51.100.{index % 254 + 1}',
+            'country': COUNTRIES[index % len(COUNTRIES)],
+            'flags': ['Fast', 'Running', 'Stable', 'Valid'] + (['Guard'] if index % 2 else ['Exit'])
+        })
+    return relays
+
+class FakeControlServer:
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, jitter=0.0, failures=None, failure_rate=0.0,
+                 drop_rate=0.0, circuit_delay=0.05, relay_count=64, script=None, seed=None):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.jitter = jitter
+        # {'SIGNAL': (552, 'Unrecognized signal'), 'GETINFO traffic/read': (551, 'Internal error')}
+        self.failures = dict(failures or {})
+        self.failure_rate = failure_rate
+        self.drop_rate = drop_rate
+        self.circuit_delay = circuit_delay
+        self.script = script
+        self.relays = make_relays(relay_count)
+        self.relays_by_fingerprint = {relay['fingerprint']: relay for relay in self.relays}
+        self.random = random.Random(seed)
+        self.conf = {}
+        self.bootstrap = BOOTSTRAP_DONE
+        self.circuits = {}
+        self.current_exit = None
+        self.socks_port = None
+        self.traffic_read = 0
+        self.traffic_written = 0
+        self.command_counts = {}
+        self.attached_streams = {}
+        self.on_shutdown = None
+        self.on_owner_closed = None
+        self._next_circuit_id = 1
+        self._connections = []
+        self._socket = None
+        self._lock = threading.RLock()
+        self._stopping = threading.Event()
+
+    # -- lifecycle --
+
+    def start(self):
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._socket.bind((self.host, self.port))
+        self._socket.listen(64)
+        self.port = self._socket.getsockname()[1]
+        threading.Thread(target=self._accept_loop, daemon=True).start()
+        if self.script:
+            self.play(self.script)
+        return self.port
+
+    def stop(self):
+        self._stopping.set()
+        if self._socket:
+            try:
+                self._socket.close()
+            except OSError:
+                pass
+        with self._lock:
+            connections = list(self._connections)
+        for connection in connections:
+            try:
+                connection['socket'].shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def _accept_loop(self):
+        while not self._stopping.is_set():
+            try:
+                client, _ = self._socket.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._serve, args=(client,), daemon=True).start()
+
+    # -- events --
+
+    def emit(self, event_type, body):
+        """Send '650 <event_type> <body>' to every connection subscribed to event_type"""
+        with self._lock:
+            connections = [c for c in self._connections if event_type in c['events']]
+        for connection in connections:
+            self._send(connection, f'650 {event_type} {body}\r\n')
+        return len(connections)
+
+    def play(self, script, repeat=1):
+        """Emit (delay, event_type, body) entries in a background thread; repeat=0 loops until stop()"""
+        def run():
+            iteration = 0
+            while not self._stopping.is_set() and (repeat == 0 or iteration < repeat):
+                for delay, event_type, body in script:
+                    if self._stopping.wait(delay):
+                        return
+                    self.emit(event_type, body)
+                iteration += 1
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        return thread
+
+    def set_bootstrap(self, progress, tag, summary):
+        with self._lock:
+            self.bootstrap = (progress, tag, summary)
+        self.emit('STATUS_CLIENT', f'NOTICE BOOTSTRAP PROGRESS={progress} TAG={tag} SUMMARY="{summary}"')
+
+    def add_traffic(self, read=0, written=0):
+        with self._lock:
+            self.traffic_read += read
+            self.traffic_written += written
+
+    def wait_for_subscriber(self, event_type, timeout=5):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            with self._lock:
+                if any(event_type in c['events'] for c in self._connections):
+                    return True
+            time.sleep(0.01)
+        return False
+
+    # -- circuits --
+
+    def _path_string(self, path):
+        return ','.join(f"${relay['fingerprint']}~{relay['nickname']}" for relay in path)
+
+    def build_circuit(self, purpose='GENERAL', path=None, build_flags=None):
+        """Launch a circuit through path (relay fingerprints) or three random relays; BUILT follows after circuit_delay
+
+        build_flags (e.g. ['ONEHOP_TUNNEL'] or ['IS_INTERNAL']) are reported in the CIRC events and circuit-status;
+        like in Tor, such circuits never become the exit that streams use.
+        """
+        with self._lock:
+            circuit_id = str(self._next_circuit_id)
+            self._next_circuit_id += 1
+            if path:
+                path = [self.relays_by_fingerprint[fingerprint.lstrip('$').split('~')[0].upper()] for fingerprint in path]
+            else:
+                path = self.random.sample(self.relays, 3)
+            flags = f" BUILD_FLAGS={','.join(build_flags)}" if build_flags else ''
+            self.circuits[circuit_id] = {'status': 'LAUNCHED', 'path': path, 'purpose': purpose, 'flags': flags}
+        self.emit('CIRC', f'{circuit_id} LAUNCHED{flags} PURPOSE={purpose}')
+
+        def finish():
+            if self.circuit_delay:
+                time.sleep(self.circuit_delay)
+            with self._lock:
+                circuit = self.circuits.get(circuit_id)
+                if not circuit:
+                    return
+                circuit['status'] = 'BUILT'
+                if purpose in ('GENERAL', 'CONFLUX_LINKED') and not build_flags and len(path) >= 3:
+                    self.current_exit = path[-1]
+            self.emit('CIRC', f'{circuit_id} BUILT {self._path_string(path)}{flags} PURPOSE={purpose}')
+
+        threading.Thread(target=finish, daemon=True).start()
+        return circuit_id
+
+    def close_circuit(self, circuit_id):
+        with self._lock:
+            circuit = self.circuits.pop(circuit_id, None)
+        if circuit:
+            self.emit('CIRC', f"{circuit_id} CLOSED {self._path_string(circuit['path'])}{circuit['flags']} "
+                              f"PURPOSE={circuit['purpose']} REASON=REQUESTED")
+        return circuit is not None
+
+    def exit_address(self):
+        with self._lock:
+            return self.current_exit['address'] if self.current_exit else None
+
+    # -- protocol --
+
+    def _send(self, connection, data):
+        with connection['lock']:
+            try:
+                connection['socket'].sendall(data.encode())
+            except OSError:
+                pass
+
+    def _serve(self, sock):
+        connection = {'socket': sock, 'events': set(), 'lock': threading.Lock(), 'owner': False}
+        with self._lock:
+            self._connections.append(connection)
+        reader = sock.makefile('rb')
+        try:
+            for raw in reader:
+                line = raw.decode('utf-8', errors='replace').rstrip('\r\n')
+                if not line:
+                    continue
+                keyword, _, arguments = line.partition(' ')
+                keyword = keyword.upper()
+                with self._lock:
+                    self.command_counts[keyword] = self.command_counts.get(keyword, 0) + 1
+                if self.drop_rate and self.random.random() < self.drop_rate:
+                    break
+                if self.latency or self.jitter:
+                    time.sleep(self.latency + self.random.uniform(0, self.jitter))
+                reply = self._injected_failure(keyword, arguments) or self.handle_command(connection, keyword, arguments)
+                if reply:
+                    self._send(connection, reply)
+                if keyword == 'QUIT' or self._stopping.is_set():
+                    break
+        except OSError:
+            pass
+        finally:
+            with self._lock:
+                if connection in self._connections:
+                    self._connections.remove(connection)
+            try:
+                sock.close()
+            except OSError:
+                pass
+            if connection['owner'] and self.on_owner_closed:
+                self.on_owner_closed()
+
+    def _injected_failure(self, keyword, arguments):
+        # Authentication must succeed or stem never gets far enough to exercise anything else
+        if keyword in ('PROTOCOLINFO', 'AUTHENTICATE', 'QUIT'):
+            return None
+        failure = self.failures.get(keyword)
+        if failure is None and keyword == 'GETINFO':
+            failure = next((self.failures[f'GETINFO {key}'] for key in arguments.split()
+                            if f'GETINFO {key}' in self.failures), None)
+        if failure is None and self.failure_rate and self.random.random() < self.failure_rate:
+            failure = (551, 'Injected failure')
+        if failure is None:
+            return None
+        code, message = failure
+        return f'{code} {message}\r\n'
+
+    def handle_command(self, connection, keyword, arguments):
+        if keyword == 'PROTOCOLINFO':
+            return f'250-PROTOCOLINFO 1\r\n250-AUTH METHODS=NULL\r\n250-VERSION Tor="{VERSION}"\r\n250 OK\r\n'
+        if keyword == 'AUTHENTICATE':
+            return '250 OK\r\n'
+        if keyword == 'SETEVENTS':
+            connection['events'] = {event for event in arguments.split() if event != 'EXTENDED'}
+            return '250 OK\r\n'
+        if keyword == 'GETINFO':
+            return self._getinfo(arguments.split())
+        if keyword == 'GETCONF':
+            lines = []
+            for key in arguments.split():
+                value = self.conf.get(key)
+                values = value if isinstance(value, list) else [value]
+                lines += [f'{key}={item}' if item is not None else key for item in values]
+            return ''.join(f'250-{line}\r\n' for line in lines[:-1]) + f'250 {lines[-1]}\r\n'
+        if keyword in ('SETCONF', 'RESETCONF'):
+            values = {}
+            for key, value in CONF_ITEM.findall(arguments):
+                if value.startswith('"'):
+                    value = value[1:-1].replace('\\"', '"').replace('\\\\', '\\')
+                values.setdefault(key, [])
+                if value:
+                    values[key].append(value)
+            for key, items in values.items():
+                if keyword == 'SETCONF' and items:
+                    self.conf[key] = items if len(items) > 1 else items[0]
+                else:
+                    self.conf.pop(key, None)
+            return '250 OK\r\n'
+        if keyword == 'SIGNAL':
+            signal = arguments.strip().upper()
+            if signal == 'NEWNYM':
+                self.build_circuit()
+            elif signal in ('SHUTDOWN', 'HALT', 'TERM', 'INT'):
+                self._send(connection, '250 OK\r\n')
+                if self.on_shutdown:
+                    self.on_shutdown()
+                return None
+            return '250 OK\r\n'
+        if keyword == 'TAKEOWNERSHIP':
+            connection['owner'] = True
+            return '250 OK\r\n'
+        if keyword == 'EXTENDCIRCUIT':
+            purpose, path = 'GENERAL', None
+            for item in arguments.split()[1:]:
+                if item.lower().startswith('purpose='):
+                    purpose = item.split('=', 1)[1].upper()
+                else:
+                    path = item.split(',')
+            try:
+                return f'250 EXTENDED {self.build_circuit(purpose, path)}\r\n'
+            except KeyError:
+                return '552 No such router\r\n'
+        if keyword == 'CLOSECIRCUIT':
+            circuit_id = arguments.split()[0] if arguments.split() else ''
+            if self.close_circuit(circuit_id):
+                return '250 OK\r\n'
+            return f'552 Unknown circuit "{circuit_id}"\r\n'
+        if keyword == 'ATTACHSTREAM':
+            stream_id, circuit_id = (arguments.split() + ['', ''])[:2]
+            with self._lock:
+                self.attached_streams[stream_id] = circuit_id
+            return '250 OK\r\n'
+        if keyword == 'QUIT':
+            return '250 closing connection\r\n'
+        return f'510 Unrecognized command "{keyword}"\r\n'
+
+    def _getinfo(self, keys):
+        lines = []
+        for key in keys:
+            value = self.getinfo_value(key)
+            if value is None:
+                return f'552 Unrecognized key "{key}"\r\n'
+            if '\n' in value:
+                body = value.replace('\n', '\r\n')
+                lines.append(f'250+{key}=\r\n{body}\r\n.\r\n')
+            else:
+                lines.append(f'250-{key}={value}\r\n')
+        return ''.join(lines) + '250 OK\r\n'
+
+    def getinfo_value(self, key):
+        with self._lock:
+            if key == 'version':
+                return VERSION
+            if key == 'status/bootstrap-phase':
+                progress, tag, summary = self.bootstrap
+                return f'NOTICE BOOTSTRAP PROGRESS={progress} TAG={tag} SUMMARY="{summary}"'
+            if key == 'status/circuit-established':
+                return '1' if self.bootstrap[0] == 100 else '0'
+            if key == 'net/listeners/socks':
+                return f'"127.0.0.1:{self.socks_port}"' if self.socks_port else ''
+            if key == 'net/listeners/control':
+                return f'"{self.host}:{self.port}"'
+            if key == 'traffic/read':
+                return str(self.traffic_read)
+            if key == 'traffic/written':
+                return str(self.traffic_written)
+            if key == 'circuit-status':
+                entries = []
+                for circuit_id, circuit in self.circuits.items():
+                    path = f" {self._path_string(circuit['path'])}" if circuit['status'] == 'BUILT' else ''
+                    entries.append(f"{circuit_id} {circuit['status']}{path}{circuit['flags']} PURPOSE={circuit['purpose']}")
+                return '\n'.join(entries)
+            if key == 'ns/all':
+                return '\n'.join(_router_status_entry(relay) for relay in self.relays)
+            if key.startswith('ns/id/'):
+                relay = self.relays_by_fingerprint.get(key[6:].lstrip('$').upper())
+                return _router_status_entry(relay) if relay else None
+            if key.startswith('ip-to-country/'):
+                address = key[len('ip-to-country/'):]
+                for relay in self.relays:
+                    if relay['address'] == address:
+                        return relay['country']
+                return '??'
+        return None
+
+def write_cached_consensus(data_dir, relays, valid_after='2026-01-01 00:00:00'):
+    """Write cached-microdesc-consensus and cached-microdescs for relays, as Tor keeps them in its data directory"""
+    microdescs = []
+    consensus = ['network-status-version 3 microdesc', 'vote-status consensus', f'valid-after {valid_after}',
+                 f'fresh-until {valid_after}', 'valid-until 2099-01-01 00:00:00']
+    for relay in relays:
+        policy = relay.get('policy') or ('accept 80,443,1024-65535' if 'Exit' in relay['flags'] else 'reject 1-65535')
+        microdesc = f"onion-key\nntor-onion-key {relay['nickname']}\np {policy}\n"
+        digest = base64.b64encode(hashlib.sha256(microdesc.encode()).digest()).decode().rstrip('=')
+        identity = base64.b64encode(bytes.fromhex(relay['fingerprint'])).decode().rstrip('=')
+        microdescs.append(f'@last-listed {valid_after}\n{microdesc}')
+        consensus += [f"r {relay['nickname']} {identity} 2026-01-01 00:00:00 {relay['address']} 9001 0",
+                      f'm {digest}', f"s {' '.join(sorted(relay['flags']))}", 'w Bandwidth=1000']
+    consensus += ['directory-footer', 'bandwidth-weights Wgg=5000 Wmm=10000 Wee=10000']
+    with open(os.path.join(data_dir, 'cached-microdescs'), 'w') as f:
+        f.write(''.join(microdescs))
+    with open(os.path.join(data_dir, 'cached-microdesc-consensus'), 'w') as f:
+        f.write('\n'.join(consensus) + '\n')
+
+def _router_status_entry(relay):
+    identity = base64.b64encode(bytes.fromhex(relay['fingerprint'])).decode().rstrip('=')
+    return (f"r {relay['nickname']} {identity} {identity} 2026-01-01 00:00:00 {relay['address']} 9001 0\n"
+            f"s {' '.join(sorted(relay['flags']))}\nw Bandwidth=1000")
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve a fake Tor control port')
+    parser.add_argument('--port', type=int, default=9051)
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds added to every reply')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Random extra seconds added to every reply')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='Fraction of commands answered with 551')
+    parser.add_argument('--drop-rate', type=float, default=0.0, help='Fraction of commands that drop the connection')
+    parser.add_argument('--bw-interval', type=float, default=1.0, help='Seconds between BW events (0 disables)')
+    args = parser.parse_args()
+
+    server = FakeControlServer(port=args.port, latency=args.latency, jitter=args.jitter,
+                               failure_rate=args.failure_rate, drop_rate=args.drop_rate)
+    server.start()
+    server.build_circuit()
+    if args.bw_interval:
+        server.play([(args.bw_interval, 'BW', '1024 512')], repeat=0)
+    print(f'Fake control port listening on 127.0.0.1:{server.port}')
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.stop()
+
+if __name__ == '__main__':
+    main()
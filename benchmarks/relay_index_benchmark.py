@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""Build and query times of RelayIndex over a synthetic consensus.
+
+Writes a cached-microdesc-consensus and cached-microdescs with --relays
+fake relays (see fake_control.write_cached_consensus), then times the
+initial build, an unchanged-input rebuild and the common queries.
+
+    python benchmarks/relay_index_benchmark.py --relays 8000 --output relays.json
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARK_DIR))
+
+from benchmarks.fake_control import make_relays, write_cached_consensus
+from benchmarks.run_benchmarks import summarize, print_report, git_revision
+from src.utils.relay_index import RelayIndex
+
+def measure(samples, metric, function, repeat):
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        samples.setdefault(metric, []).append(time.perf_counter() - started)
+
+def run(args):
+    data_dir = tempfile.mkdtemp(prefix='torshield-relays-')
+    samples = {}
+    try:
+        relays = make_relays(args.relays)
+        write_cached_consensus(data_dir, relays)
+        countries = {relay['address']: relay['country'] for relay in relays}
+        index = RelayIndex(data_dir, lambda addresses: [countries.get(address) for address in addresses])
+        measure(samples, 'build', lambda: index.refresh(force=True), 1)
+        measure(samples, 'rebuild', lambda: index.refresh(force=True), 5)
+        fingerprint = relays[len(relays) // 2]['fingerprint']
+        measure(samples, 'lookup', lambda: index.lookup(fingerprint), args.repeat)
+        measure(samples, 'exits_country_port', lambda: index.exits('DE', 443), args.repeat)
+        measure(samples, 'pick_exit', lambda: index.pick_exit('DE', 443), args.repeat)
+        measure(samples, 'countries_with_exits', index.countries_with_exits, 20)
+        memory = index.memory_usage()
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+    return {
+        'metadata': {
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'timestamp': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'relays': args.relays,
+            'repeat': args.repeat,
+            'array_bytes': memory,
+            'failures': 0
+        },
+        'metrics': {metric: summarize(values) for metric, values in samples.items()}
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark RelayIndex build and query times')
+    parser.add_argument('--relays', type=int, default=8000, help='Relays in the synthetic consensus (default: 8000)')
+    parser.add_argument('--repeat', type=int, default=200, help='Repetitions per query (default: 200)')
+    parser.add_argument('--output', help='Write the JSON report to this file')
+    parser.add_argument('--baseline', help='Compare medians with a previous JSON report')
+    args = parser.parse_args()
+
+    report = run(args)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+    print(f"Array storage: {report['metadata']['array_bytes'] / 1024:.0f} KiB for {args.relays} relays")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=4)
+        print(f'Report written to {args.output}')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+"""End-to-end connect/rotate/disconnect benchmark for TorSession.
+
+Runs the real session pipeline (TorInstance, stem controller, exit
+resolver, optional HTTP verification) against benchmarks/stub_tor.py and a
+local check endpoint, so results depend only on TorShield's own code and
+not on the Tor network. Per-phase timings are collected over many
+iterations and written as a JSON report that can be compared with a
+report from another version via --baseline.
+
+    python benchmarks/run_benchmarks.py --iterations 20 --output report.json
+    python benchmarks/run_benchmarks.py --baseline report.json
+
+--profile selects the torrc profile and --download times a download through
+the SOCKS port after each connect. Profiles only change how the real Tor
+behaves, so compare them with --tor-path pointing at a real tor binary
+(which also uses the real check endpoint and needs --download-url):
+
+    python benchmarks/run_benchmarks.py --tor-path tor/tor --profile low-latency \
+        --download-url https://example.com/10MB.bin --output low-latency.json
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCHMARK_DIR)
+sys.path.insert(0, ROOT_DIR)
+
+from src.controllers.tor_session import TorSession, CHECK_URL
+from src.utils.torrc import PROFILES, DEFAULT_PROFILE
+
+STUB_TOR = os.path.join(BENCHMARK_DIR, 'stub_tor.py')
+# Phases reported by TorInstance.start() and TorSession._connect(), in pipeline order
+PHASES = ('cleanup', 'config', 'launch', 'controller', 'bootstrap', 'proxy', 'verify')
+TOTALS = ('connect', 'download', 'rotate', 'disconnect')
+DOWNLOAD_CHUNK = 64 * 1024
+
+class CheckHandler(BaseHTTPRequestHandler):
+    """Stands in for check.torproject.org/api/ip, reporting the exit address stub_tor adds"""
+
+    def do_GET(self):
+        if self.path.startswith('/bytes/'):
+            return self._send_bytes(int(self.path.split('/')[2]))
+        body = json.dumps({
+            'IsTor': True,
+            'IP': self.headers.get('X-Forwarded-For', self.client_address[0])
+        }).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_bytes(self, size):
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Content-Length', str(size))
+        self.end_headers()
+        chunk = b'\0' * DOWNLOAD_CHUNK
+        while size > 0:
+            self.wfile.write(chunk[:size])
+            size -= DOWNLOAD_CHUNK
+
+    def log_message(self, format, *args):
+        pass
+
+def start_check_server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), CheckHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def write_tor_wrapper(directory):
+    """Create an executable named like tor that runs stub_tor.py with this interpreter"""
+    if os.name == 'nt':
+        path = os.path.join(directory, 'tor.cmd')
+        with open(path, 'w') as f:
+            f.write(f'@"{sys.executable}" "{STUB_TOR}" %*\r\n')
+    else:
+        path = os.path.join(directory, 'tor')
+        with open(path, 'w') as f:
+            f.write(f'#!/bin/sh\nexec "{sys.executable}" "{STUB_TOR}" "$@"\n')
+        os.chmod(path, 0o755)
+    return path
+
+def download(socks_port, url):
+    """Seconds and bytes to fetch url through the SOCKS port"""
+    import requests
+    session = requests.Session()
+    session.trust_env = False
+    proxy = f'socks5h://127.0.0.1:{socks_port}'
+    started = time.perf_counter()
+    with session.get(url, proxies={'http': proxy, 'https': proxy}, timeout=120, stream=True) as response:
+        response.raise_for_status()
+        size = sum(len(chunk) for chunk in response.iter_content(DOWNLOAD_CHUNK))
+    return time.perf_counter() - started, size
+
+def run_iteration(tor_path, data_dir, settings, check_url, download_url=None):
+    session = TorSession(settings, tor_path=tor_path, data_dir=data_dir, use_system_proxy=False,
+                         check_url=check_url)
+    sample = {}
+    started = time.perf_counter()
+    if not session.connect():
+        raise Exception(f'Connect failed: {session.error}')
+    sample['connect'] = time.perf_counter() - started
+    sample.update(session.timings)
+
+    try:
+        if download_url:
+            sample['download'], sample['download_bytes'] = download(session.socks_port, download_url)
+        started = time.perf_counter()
+        if not session.change_ip():
+            raise Exception('IP change failed')
+        sample['rotate'] = time.perf_counter() - started
+    finally:
+        started = time.perf_counter()
+        session.disconnect()
+        sample['disconnect'] = time.perf_counter() - started
+    return sample
+
+def summarize(values):
+    values = sorted(values)
+    return {
+        'min': values[0],
+        'median': statistics.median(values),
+        'p90': values[min(len(values) - 1, int(round(0.9 * (len(values) - 1))))],
+        'max': values[-1],
+        'mean': statistics.mean(values),
+        'samples': len(values)
+    }
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT_DIR, capture_output=True,
+                              text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+def run(args):
+    settings = {
+        'rotation_mode': args.mode,
+        'verify_exit_ip': args.verify,
+        'persistent_data_dir': True,
+        'torrc_profile': args.profile
+    }
+    os.environ.setdefault('STUB_TOR_BOOTSTRAP_DELAY', str(args.bootstrap_delay))
+    os.environ.setdefault('STUB_TOR_CIRCUIT_DELAY', str(args.circuit_delay))
+
+    work_dir = tempfile.mkdtemp(prefix='torshield-bench-')
+    server = start_check_server()
+    check_url = f'http://127.0.0.1:{server.server_address[1]}/api/ip'
+    download_url = f'http://127.0.0.1:{server.server_address[1]}/bytes/{args.download}' if args.download else None
+    if args.tor_path:
+        check_url, download_url = CHECK_URL, args.download_url
+    samples = {}
+    failures = []
+    download_bytes = None
+    try:
+        tor_path = args.tor_path or write_tor_wrapper(work_dir)
+        data_dir = os.path.join(work_dir, 'data')
+        os.makedirs(data_dir)
+        for iteration in range(args.warmup + args.iterations):
+            try:
+                sample = run_iteration(tor_path, data_dir, settings, check_url, download_url)
+            except Exception as e:
+                failures.append(str(e))
+                print(f'iteration {iteration + 1}: {e}')
+                continue
+            download_bytes = sample.pop('download_bytes', download_bytes)
+            if iteration < args.warmup:
+                continue
+            for metric, value in sample.items():
+                samples.setdefault(metric, []).append(value)
+            if not args.quiet:
+                print(f"iteration {iteration + 1}: connect {sample['connect'] * 1000:.1f} ms, "
+                      f"rotate {sample.get('rotate', 0) * 1000:.1f} ms")
+    finally:
+        server.shutdown()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    order = [metric for metric in PHASES + TOTALS if metric in samples]
+    order += sorted(metric for metric in samples if metric not in order)
+    return {
+        'metadata': {
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'timestamp': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'iterations': args.iterations,
+            'warmup': args.warmup,
+            'mode': args.mode,
+            'profile': args.profile,
+            'tor': 'real' if args.tor_path else 'stub',
+            'download_bytes': download_bytes,
+            'verify_exit_ip': args.verify,
+            'bootstrap_delay': float(os.environ['STUB_TOR_BOOTSTRAP_DELAY']),
+            'circuit_delay': float(os.environ['STUB_TOR_CIRCUIT_DELAY']),
+            'failures': len(failures)
+        },
+        'metrics': {metric: summarize(samples[metric]) for metric in order}
+    }
+
+def print_report(report, baseline=None):
+    header = f"{'metric':<20} {'median ms':>10} {'p90 ms':>10} {'max ms':>10}"
+    if baseline:
+        header += f" {'baseline':>10} {'change':>8}"
+    print(header)
+    for metric, stats in report['metrics'].items():
+        line = f"{metric:<20} {stats['median'] * 1000:>10.1f} {stats['p90'] * 1000:>10.1f} {stats['max'] * 1000:>10.1f}"
+        previous = (baseline or {}).get('metrics', {}).get(metric)
+        if previous:
+            change = (stats['median'] - previous['median']) / previous['median'] * 100 if previous['median'] else 0
+            line += f" {previous['median'] * 1000:>10.1f} {change:>+7.1f}%"
+        print(line)
+    if report['metadata']['failures']:
+        print(f"{report['metadata']['failures']} failure(s)")
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark TorSession connect/rotate/disconnect against a stub Tor')
+    parser.add_argument('--iterations', type=int, default=10, help='Measured iterations (default: 10)')
+    parser.add_argument('--warmup', type=int, default=1, help='Unmeasured warm-up iterations (default: 1)')
+    parser.add_argument('--mode', choices=('newnym', 'reserve'), default='newnym', help='IP rotation mode')
+    parser.add_argument('--verify', action='store_true', help='Verify exit IPs through the check endpoint')
+    parser.add_argument('--profile', choices=PROFILES, default=DEFAULT_PROFILE, help='torrc performance profile')
+    parser.add_argument('--download', type=int, default=0, help='Bytes to download from the stub endpoint after each connect')
+    parser.add_argument('--tor-path', help='Benchmark a real tor binary instead of the stub (uses the real network)')
+    parser.add_argument('--download-url', help='URL to download after each connect when using --tor-path')
+    parser.add_argument('--bootstrap-delay', type=float, default=0.2, help='Stub Tor bootstrap time in seconds')
+    parser.add_argument('--circuit-delay', type=float, default=0.05, help='Stub Tor circuit build time in seconds')
+    parser.add_argument('--output', help='Write the JSON report to this file')
+    parser.add_argument('--baseline', help='Compare medians with a previous JSON report')
+    parser.add_argument('--quiet', action='store_true', help='Only print the summary')
+    args = parser.parse_args()
+
+    report = run(args)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+    download = report['metrics'].get('download')
+    if download and report['metadata']['download_bytes']:
+        print(f"Download throughput: {report['metadata']['download_bytes'] / download['median'] / 1024:.0f} KiB/s (median)")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=4)
+        print(f'Report written to {args.output}')
+    return 1 if report['metadata']['failures'] else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
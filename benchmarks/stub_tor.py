@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""Stand-in for the tor executable, used by the benchmark suite.
+
+Accepts `-f torrc` and honours DataDirectory, SocksPort, ControlPort
+(numbers or 'auto'), ControlPortWriteToFile and __OwningControllerProcess.
+The control port is a FakeControlServer (see fake_control.py); this
+script adds Tor-style log output, a bootstrap sequence, BW events and a
+SOCKS listener. The SOCKS listener connects directly to the requested
+target and adds an X-Forwarded-For header carrying the current exit
+address to plain HTTP requests, so a local check endpoint can report
+the "exit IP".
+
+Timing and failures are controlled through environment variables:
+STUB_TOR_BOOTSTRAP_DELAY (seconds for the full bootstrap, default 0.2),
+STUB_TOR_CIRCUIT_DELAY (seconds per circuit build, default 0.05),
+STUB_TOR_LATENCY (seconds added to every control reply, default 0) and
+STUB_TOR_FAILURE_RATE (fraction of control commands that fail, default 0).
+"""
+import os
+import select
+import socket
+import struct
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_control import FakeControlServer, VERSION, write_cached_consensus
+
+BOOTSTRAP_PHASES = (
+    (5, 'conn', 'Connecting to a relay'),
+    (10, 'conn_done', 'Connected to a relay'),
+    (15, 'handshake_done', 'Handshake with a relay done'),
+    (75, 'enough_dirinfo', 'Loaded enough directory info to build circuits'),
+    (90, 'ap_handshake_done', 'Handshake finished with a relay to build circuits'),
+    (95, 'circuit_create', 'Establishing a Tor circuit'),
+    (100, 'done', 'Done'),
+)
+
+def log(level, domain, message):
+    stamp = time.strftime('%b %d %H:%M:%S', time.localtime()) + '.000'
+    print(f'{stamp} [{level}] {{{domain}}} {message}', flush=True)
+
+def parse_torrc(path):
+    options = {}
+    with open(path, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                key, _, value = line.partition(' ')
+                options[key] = value.strip()
+    return options
+
+def parse_port(value):
+    port = value.split()[0]
+    return 0 if port == 'auto' else int(port)
+
+class StubTor:
+    def __init__(self, options):
+        self.options = options
+        self.bootstrap_delay = float(os.environ.get('STUB_TOR_BOOTSTRAP_DELAY', '0.2'))
+        self.control = FakeControlServer(
+            port=parse_port(options.get('ControlPort', '9051')),
+            latency=float(os.environ.get('STUB_TOR_LATENCY', '0')),
+            failure_rate=float(os.environ.get('STUB_TOR_FAILURE_RATE', '0')),
+            circuit_delay=float(os.environ.get('STUB_TOR_CIRCUIT_DELAY', '0.05'))
+        )
+        self.control.bootstrap = (0, 'starting', 'Starting')
+        self.control.on_shutdown = lambda: self._exit('Interrupt: exiting cleanly.')
+        self.control.on_owner_closed = lambda: self._exit('Owning controller connection has closed -- exiting now.')
+        self.stopping = threading.Event()
+
+    def run(self):
+        control_port = self.control.start()
+        self.socks = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.socks.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.socks.bind(('127.0.0.1', parse_port(self.options.get('SocksPort', '9050'))))
+        self.socks.listen(64)
+        self.control.socks_port = self.socks.getsockname()[1]
+        log('notice', 'GENERAL', f'Tor {VERSION} (stub) running')
+        log('notice', 'NET', f'Opened Socks listener connection (ready) on 127.0.0.1:{self.control.socks_port}')
+        log('notice', 'NET', f'Opened Control listener connection (ready) on 127.0.0.1:{control_port}')
+
+        port_file = self.options.get('ControlPortWriteToFile')
+        if port_file:
+            tmp_path = port_file + '.tmp'
+            with open(tmp_path, 'w') as f:
+                f.write(f'PORT=127.0.0.1:{control_port}\n')
+            os.replace(tmp_path, port_file)
+
+        threading.Thread(target=self._accept_loop, daemon=True).start()
+        threading.Thread(target=self._bootstrap_loop, daemon=True).start()
+        threading.Thread(target=self._bandwidth_loop, daemon=True).start()
+        owner = self.options.get('__OwningControllerProcess')
+        if owner:
+            threading.Thread(target=self._watch_owner, args=(int(owner),), daemon=True).start()
+
+        self.stopping.wait()
+        self.control.stop()
+        os._exit(0)
+
+    def _exit(self, message):
+        log('notice', 'GENERAL', message)
+        self.stopping.set()
+
+    def _accept_loop(self):
+        while not self.stopping.is_set():
+            try:
+                client, _ = self.socks.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._serve_socks, args=(client,), daemon=True).start()
+
+    def _watch_owner(self, pid):
+        while not self.stopping.wait(1):
+            try:
+                os.kill(pid, 0)
+            except ProcessLookupError:
+                self._exit('Owning controller process has vanished -- exiting now.')
+            except OSError:
+                return
+
+    def _bootstrap_loop(self):
+        step = self.bootstrap_delay / len(BOOTSTRAP_PHASES)
+        for progress, tag, summary in BOOTSTRAP_PHASES:
+            time.sleep(step)
+            if progress == 75 and self.options.get('DataDirectory'):
+                write_cached_consensus(self.options['DataDirectory'], self.control.relays)
+            if progress == 100:
+                self.control.build_circuit()
+            log('notice', 'BOOTSTRAP', f'Bootstrapped {progress}% ({tag}): {summary}')
+            self.control.set_bootstrap(progress, tag, summary)
+
+    def _bandwidth_loop(self):
+        last_read, last_written = 0, 0
+        while not self.stopping.wait(1):
+            read, written = self.control.traffic_read, self.control.traffic_written
+            self.control.emit('BW', f'{read - last_read} {written - last_written}')
+            last_read, last_written = read, written
+
+    # -- SOCKS --
+
+    def _serve_socks(self, client):
+        upstream = None
+        try:
+            version, count = client.recv(2)
+            client.recv(count)
+            client.sendall(b'\x05\x00')
+            header = client.recv(4)
+            atyp = header[3]
+            if atyp == 1:
+                host = socket.inet_ntoa(client.recv(4))
+            elif atyp == 3:
+                host = client.recv(client.recv(1)[0]).decode()
+            else:
+                host = socket.inet_ntop(socket.AF_INET6, client.recv(16))
+            port = struct.unpack('>H', client.recv(2))[0]
+            try:
+                upstream = socket.create_connection((host, port), timeout=10)
+            except OSError:
+                client.sendall(b'\x05\x05\x00\x01' + b'\x00' * 6)
+                return
+            client.sendall(b'\x05\x00\x00\x01' + b'\x00' * 6)
+            self._pump(client, upstream)
+        except (OSError, ValueError, IndexError):
+            pass
+        finally:
+            for sock in (client, upstream):
+                if sock is not None:
+                    try:
+                        sock.close()
+                    except OSError:
+                        pass
+
+    def _pump(self, client, upstream):
+        first = True
+        sockets = [client, upstream]
+        while not self.stopping.is_set():
+            readable, _, _ = select.select(sockets, [], [], 30)
+            if not readable:
+                return
+            for sock in readable:
+                data = sock.recv(65536)
+                if not data:
+                    return
+                if sock is client:
+                    if first and b'\r\n' in data and data.split(b' ', 1)[0].isalpha():
+                        exit_address = self.control.exit_address() or '0.0.0.0'
+                        request_line, rest = data.split(b'\r\n', 1)
+                        data = request_line + f'\r\nX-Forwarded-For: {exit_address}'.encode() + b'\r\n' + rest
+                    first = False
+                    upstream.sendall(data)
+                    self.control.add_traffic(written=len(data))
+                else:
+                    client.sendall(data)
+                    self.control.add_traffic(read=len(data))
+
+def main(argv):
+    if '-f' not in argv:
+        print('usage: stub_tor.py -f torrc', file=sys.stderr)
+        return 1
+    options = parse_torrc(argv[argv.index('-f') + 1])
+    StubTor(options).run()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
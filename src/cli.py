@@ -0,0 +1,450 @@
+import argparse
+import json
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.utils.system_utils import get_app_data_dir, CREATE_NO_WINDOW
+from src.utils.socks_balancer import STRATEGIES
+from src.utils.torrc import PROFILES
+
+COMMANDS = ('connect', 'status', 'rotate', 'disconnect', 'pool', 'stats', 'bridges')
+DAEMON_STATE_FILE = 'daemon.json'
+DAEMON_LOG_FILE = 'daemon.log'
+DAEMON_ROTATE_FILE = 'daemon_rotate.json'
+DAEMON_STOP_FILE = 'daemon_stop.json'
+DAEMON_START_TIMEOUT = 180
+DAEMON_STOP_TIMEOUT = 15
+# Generous on top of the session's own IP change timeout, which includes NEWNYM rate limiting
+DAEMON_ROTATE_TIMEOUT = 45
+DAEMON_POLL_INTERVAL = 0.5
+
+def load_settings():
+    from src.models.settings_store import get_settings_store
+    return get_settings_store().as_dict()
+
+def _state_path():
+    return os.path.join(get_app_data_dir(), DAEMON_STATE_FILE)
+
+def _pid_alive(pid):
+    import psutil
+    return psutil.pid_exists(pid)
+
+def read_daemon_state():
+    try:
+        with open(_state_path(), 'r') as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not _pid_alive(state.get('pid', -1)):
+        remove_daemon_state()
+        return None
+    return state
+
+def write_daemon_state(state):
+    path = _state_path()
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f, indent=4)
+    os.replace(tmp_path, path)
+
+def remove_daemon_state():
+    try:
+        os.unlink(_state_path())
+    except OSError:
+        pass
+
+def _request_path(name):
+    return os.path.join(get_app_data_dir(), name)
+
+def send_request(name):
+    """Leave a request file (DAEMON_ROTATE_FILE, DAEMON_STOP_FILE) for the daemon and return its id"""
+    request_id = f'{os.getpid()}-{time.time()}'
+    path = _request_path(name)
+    with open(path + '.tmp', 'w') as f:
+        json.dump({'id': request_id}, f)
+    os.replace(path + '.tmp', path)
+    return request_id
+
+def take_request(name):
+    """Id of a pending daemon request, removing it, or None"""
+    path = _request_path(name)
+    try:
+        with open(path, 'r') as f:
+            request = json.load(f)
+    except (OSError, ValueError):
+        return None
+    finally:
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+    return request.get('id') if isinstance(request, dict) else None
+
+def _print_event(event, value):
+    if event == 'status':
+        print(value, flush=True)
+    elif event == 'state':
+        print(f'State: {value}', flush=True)
+    elif event == 'log' and value.is_warning:
+        print(f'Tor: {value}', flush=True)
+
+def run_daemon(args):
+    from src.controllers.tor_session import TorSession
+    from src.models.connection_history import ConnectionHistory
+
+    settings = load_settings()
+    if args.exit_country is not None:
+        settings['exit_country'] = args.exit_country.upper()
+    if args.transport is not None:
+        settings['bridge_transport'] = args.transport
+    if args.profile is not None:
+        settings['torrc_profile'] = args.profile
+
+    session = TorSession(settings, tor_path=args.tor_path, data_dir=args.data_dir, use_system_proxy=False)
+    session.add_listener(_print_event)
+
+    stop = threading.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda *_: stop.set())
+
+    state = {'pid': os.getpid(), 'state': 'connecting'}
+    state_lock = threading.Lock()
+    write_daemon_state(state)
+    take_request(DAEMON_ROTATE_FILE)
+    take_request(DAEMON_STOP_FILE)
+
+    def publish(**extra):
+        instance = session.instance
+        if not session.is_connected or not instance:
+            return
+        control_host, control_port = instance.control_address
+        with state_lock:
+            state.update({
+                'state': 'connected',
+                'control_host': control_host,
+                'control_port': control_port,
+                'socks_port': session.socks_port,
+                'data_dir': session.data_dir,
+                'exit_ip': session.exit_ip,
+                'exit_country': session.exit_country(),
+                'rotations': session.rotations,
+                'connected_at': session.connected_at
+            }, **extra)
+            write_daemon_state(state)
+
+    # The exit can also change without a rotation (circuit expiry, exit country change), keep status current
+    session.add_listener(lambda event, value: publish() if event == 'ip' else None)
+    try:
+        if not session.connect():
+            print(f'Connection failed: {session.error}', flush=True)
+            state.update({'state': 'error', 'error': session.error})
+            write_daemon_state(state)
+            return 1
+
+        publish()
+        print(f'Connected. SOCKS proxy on 127.0.0.1:{session.socks_port}, exit IP {session.exit_ip}', flush=True)
+
+        rotate_interval = None
+        if settings.get('auto_ip_change', False):
+            rotate_interval = settings.get('ip_change_interval', 15) * 60
+        next_rotation = time.monotonic() + rotate_interval if rotate_interval else None
+
+        reason = 'stopped'
+        while not stop.wait(DAEMON_POLL_INTERVAL):
+            if not session.is_alive():
+                print('Tor process exited.', flush=True)
+                reason = 'tor-exited'
+                break
+            if take_request(DAEMON_STOP_FILE):
+                reason = 'user'
+                break
+            request_id = take_request(DAEMON_ROTATE_FILE)
+            if request_id:
+                new_ip = session.change_ip()
+                print(f'Rotated to {new_ip}' if new_ip else 'Could not change the exit IP', flush=True)
+                publish(rotate_request=request_id, rotate_result=new_ip)
+            if next_rotation and time.monotonic() >= next_rotation:
+                session.change_ip()
+                next_rotation = time.monotonic() + rotate_interval
+        # `disconnect` leaves a request before its SIGTERM, which tells it apart from a system shutdown
+        if reason == 'stopped' and take_request(DAEMON_STOP_FILE):
+            reason = 'user'
+
+        if settings.get('save_history', True) and session.connected_at:
+            ConnectionHistory().add_connection(**session.session_record(), disconnect_reason=reason)
+        session.disconnect()
+        return 0
+    finally:
+        remove_daemon_state()
+
+def _daemon_command(args):
+    command = [sys.executable, os.path.abspath(__file__), 'connect', '--foreground']
+    if args.exit_country is not None:
+        command += ['--exit-country', args.exit_country]
+    if args.transport is not None:
+        command += ['--transport', args.transport]
+    if args.profile is not None:
+        command += ['--profile', args.profile]
+    if args.tor_path:
+        command += ['--tor-path', args.tor_path]
+    if args.data_dir:
+        command += ['--data-dir', args.data_dir]
+    return command
+
+def cmd_connect(args):
+    state = read_daemon_state()
+    if state:
+        print(f"Already running (pid {state['pid']}, {state.get('state')}).")
+        return 0
+
+    if args.foreground:
+        return run_daemon(args)
+
+    log_path = os.path.join(get_app_data_dir(), DAEMON_LOG_FILE)
+    with open(log_path, 'a') as log:
+        if sys.platform == 'win32':
+            process = subprocess.Popen(_daemon_command(args), stdout=log, stderr=subprocess.STDOUT,
+                                       stdin=subprocess.DEVNULL,
+                                       creationflags=CREATE_NO_WINDOW | subprocess.CREATE_NEW_PROCESS_GROUP)
+        else:
+            process = subprocess.Popen(_daemon_command(args), stdout=log, stderr=subprocess.STDOUT,
+                                       stdin=subprocess.DEVNULL, start_new_session=True)
+
+    deadline = time.monotonic() + DAEMON_START_TIMEOUT
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            print(f'Daemon exited with code {process.returncode}, see {log_path}')
+            return 1
+        state = read_daemon_state()
+        if state and state.get('state') == 'connected':
+            print(f"Connected (pid {state['pid']}). SOCKS proxy on 127.0.0.1:{state['socks_port']}, "
+                  f"exit IP {state.get('exit_ip')}")
+            return 0
+        if state and state.get('state') == 'error':
+            print(f"Connection failed: {state.get('error')}")
+            return 1
+        time.sleep(0.2)
+    print(f'Timed out waiting for the daemon, see {log_path}')
+    return 1
+
+def _open_controller(state):
+    from stem.control import Controller
+    controller = Controller.from_port(address=state['control_host'], port=state['control_port'])
+    controller.authenticate()
+    return controller
+
+def cmd_status(args):
+    state = read_daemon_state()
+    if not state:
+        print(json.dumps({'state': 'disconnected'}) if args.json else 'Disconnected')
+        return 3
+
+    if state.get('state') == 'connected':
+        try:
+            with _open_controller(state) as controller:
+                state['bootstrap_phase'] = controller.get_info('status/bootstrap-phase')
+                state['traffic_read'] = int(controller.get_info('traffic/read'))
+                state['traffic_written'] = int(controller.get_info('traffic/written'))
+        except Exception as e:
+            state['error'] = f'Controller unavailable: {e}'
+        if state.get('connected_at'):
+            state['duration'] = int(time.time() - state['connected_at'])
+
+    if args.json:
+        print(json.dumps(state, indent=4))
+    else:
+        for key, value in state.items():
+            print(f'{key}: {value}')
+    return 0
+
+def cmd_rotate(args):
+    state = read_daemon_state()
+    if not state or state.get('state') != 'connected':
+        print('Not connected.')
+        return 1
+
+    # The daemon's session does the rotation, so reserve mode, status and the history record all see it
+    request_id = send_request(DAEMON_ROTATE_FILE)
+
+    deadline = time.monotonic() + DAEMON_ROTATE_TIMEOUT
+    while time.monotonic() < deadline:
+        state = read_daemon_state()
+        if not state:
+            print('Daemon stopped.')
+            return 1
+        if state.get('rotate_request') == request_id:
+            if not state.get('rotate_result'):
+                print('Could not change the exit IP.')
+                return 1
+            print(f"New exit IP {state['rotate_result']}")
+            return 0
+        time.sleep(0.2)
+    print('Timed out waiting for the daemon to rotate.')
+    return 1
+
+def cmd_disconnect(args):
+    state = read_daemon_state()
+    if not state:
+        print('Not connected.')
+        return 0
+
+    # The daemon records the session as a user disconnect; Windows has no SIGTERM, so it polls for the request
+    send_request(DAEMON_STOP_FILE)
+    if sys.platform != 'win32':
+        os.kill(state['pid'], signal.SIGTERM)
+
+    deadline = time.monotonic() + DAEMON_STOP_TIMEOUT
+    while time.monotonic() < deadline:
+        if not _pid_alive(state['pid']):
+            print('Disconnected.')
+            return 0
+        time.sleep(0.1)
+    print(f"Daemon (pid {state['pid']}) did not stop in time.")
+    return 1
+
+def _print_pool_stats(stats):
+    print(f"{'instance':<10} {'healthy':<8} {'active':>6} {'total':>7} {'fail':>5} {'latency':>9} "
+          f"{'down/s':>10} {'up/s':>10}", flush=True)
+    for backend in stats:
+        latency = f"{backend['latency_ms']}ms" if backend['latency_ms'] is not None else '-'
+        print(f"{backend['name']:<10} {str(backend['healthy']):<8} {backend['active']:>6} {backend['total']:>7} "
+              f"{backend['failures']:>5} {latency:>9} {backend.get('read_rate', 0):>10} "
+              f"{backend.get('write_rate', 0):>10}", flush=True)
+
+def cmd_pool(args):
+    from src.controllers.tor_pool import TorPool
+
+    settings = load_settings()
+    if args.exit_country is not None:
+        settings['exit_country'] = args.exit_country.upper()
+    if args.transport is not None:
+        settings['bridge_transport'] = args.transport
+    if args.profile is not None:
+        settings['torrc_profile'] = args.profile
+
+    pool = TorPool(args.size, settings, tor_path=args.tor_path, data_root=args.data_dir, port=args.port,
+                   strategy=args.strategy, status_callback=lambda message: print(message, flush=True))
+    stop = threading.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda *_: stop.set())
+
+    try:
+        pool.start()
+    except Exception as e:
+        print(f'Pool failed to start: {e}', flush=True)
+        pool.stop()
+        return 1
+
+    try:
+        while not stop.wait(args.stats_interval):
+            _print_pool_stats(pool.stats())
+    finally:
+        pool.stop()
+    return 0
+
+def cmd_stats(args):
+    from src.models.connection_history import ConnectionHistory
+
+    history = ConnectionHistory()
+    stats = {
+        'sessions': history.count(),
+        'duration_percentiles': history.percentiles('duration'),
+        'connect_time_percentiles': history.percentiles('bootstrap_time'),
+        'countries': history.country_stats(),
+        'exits': history.exit_stats(args.limit)
+    }
+    if args.json:
+        print(json.dumps(stats, indent=4))
+        return 0
+
+    print(f"Sessions: {stats['sessions']}")
+    print(f"Session duration (s) p50/p90/p99: {stats['duration_percentiles']}")
+    print(f"Connect time (s) p50/p90/p99: {stats['connect_time_percentiles']}")
+    print(f"\n{'country':<8} {'sessions':>8} {'avg duration':>13} {'avg connect':>12}")
+    for row in stats['countries']:
+        connect = f"{row['average_bootstrap_time']:.1f}s" if row['average_bootstrap_time'] else '-'
+        print(f"{row['country']:<8} {row['sessions']:>8} {round(row['average_duration']):>12}s {connect:>12}")
+    print(f"\n{'exit':<40} {'country':<8} {'sessions':>8} {'avg duration':>13} {'longest':>9}")
+    for row in stats['exits']:
+        print(f"{row['ip']:<40} {row['country']:<8} {row['sessions']:>8} {round(row['average_duration']):>12}s "
+              f"{row['longest_duration']:>8}s")
+    return 0
+
+def cmd_bridges(args):
+    from src.utils.bridges import BridgeProber
+
+    prober = BridgeProber(args.tor_path)
+    rankings = {transport: prober.rankings(transport, refresh=args.refresh)
+                for transport in ([args.transport] if args.transport else prober.transports())}
+    if args.json:
+        print(json.dumps({transport: [{'bridge': line, 'latency': seconds} for line, seconds in results]
+                          for transport, results in rankings.items()}, indent=4))
+        return 0
+
+    for transport, results in rankings.items():
+        print(f"{transport}:")
+        for line, seconds in results:
+            latency = f"{seconds * 1000:.0f}ms" if seconds is not None else 'unreachable'
+            print(f"  {latency:>12}  {' '.join(line.split()[:2])}")
+    return 0
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='torshield', description='Headless TorShield control')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    connect = subparsers.add_parser('connect', help='start Tor and keep the session running')
+    connect.add_argument('--foreground', action='store_true', help='run in the foreground (e.g. under systemd)')
+    connect.add_argument('--exit-country', help="two-letter exit country code or 'auto' for the fastest measured one, overrides the settings file")
+    connect.add_argument('--transport', help="bridge transport from pt_config.json (e.g. obfs4, snowflake), 'auto' to race direct and bridge connections, '' for a direct connection")
+    connect.add_argument('--profile', choices=PROFILES, help='torrc performance profile, overrides the settings file')
+    connect.add_argument('--tor-path', help='path to the tor executable')
+    connect.add_argument('--data-dir', help='Tor data directory')
+    connect.set_defaults(handler=cmd_connect)
+
+    status = subparsers.add_parser('status', help='show the state of the running session')
+    status.add_argument('--json', action='store_true', help='print machine-readable output')
+    status.set_defaults(handler=cmd_status)
+
+    rotate = subparsers.add_parser('rotate', help='switch the running session to a new exit')
+    rotate.set_defaults(handler=cmd_rotate)
+
+    disconnect = subparsers.add_parser('disconnect', help='stop the running session')
+    disconnect.set_defaults(handler=cmd_disconnect)
+
+    pool = subparsers.add_parser('pool', help='run several Tor instances behind one SOCKS listener')
+    pool.add_argument('--size', type=int, default=2, help='number of Tor instances')
+    pool.add_argument('--port', type=int, default=9050, help='front SOCKS port')
+    pool.add_argument('--strategy', choices=STRATEGIES, default='round-robin', help='load-balancing strategy')
+    pool.add_argument('--stats-interval', type=int, default=30, help='seconds between statistics reports')
+    pool.add_argument('--exit-country', help="two-letter exit country code or 'auto' for the fastest measured one, overrides the settings file")
+    pool.add_argument('--transport', help="bridge transport from pt_config.json (e.g. obfs4, snowflake), '' for a direct connection")
+    pool.add_argument('--profile', choices=PROFILES, help='torrc performance profile, overrides the settings file')
+    pool.add_argument('--tor-path', help='path to the tor executable')
+    pool.add_argument('--data-dir', help='root directory for the per-instance data directories')
+    pool.set_defaults(handler=cmd_pool)
+
+    stats = subparsers.add_parser('stats', help='show session statistics by exit country and exit relay')
+    stats.add_argument('--json', action='store_true', help='print machine-readable output')
+    stats.add_argument('--limit', type=int, default=20, help='number of exit relays to list')
+    stats.set_defaults(handler=cmd_stats)
+
+    bridges = subparsers.add_parser('bridges', help='probe the configured bridges and show them fastest first')
+    bridges.add_argument('--transport', help='only probe bridges of this transport')
+    bridges.add_argument('--refresh', action='store_true', help='probe again even if saved rankings are still fresh')
+    bridges.add_argument('--json', action='store_true', help='print machine-readable output')
+    bridges.add_argument('--tor-path', help='path to the tor executable')
+    bridges.set_defaults(handler=cmd_bridges)
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    return args.handler(args)
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,198 @@
+import threading
+from collections import deque
+from stem import CircStatus, StreamStatus
+from stem.control import EventType
+
+CIRCUIT_BUILD_TIMEOUT = 60
+MAX_BUILD_ATTEMPTS = 5
+REFILL_RETRY_INTERVAL = 30
+STOP_TIMEOUT = 5
+
+class CircuitReserve:
+    """Keeps pre-built circuits through distinct exits and routes new streams onto one of them.
+
+    While running, Tor leaves new streams unattached and this class attaches
+    them to the current circuit, so switching identity is a local pointer
+    swap instead of a NEWNYM followed by fresh circuit builds. With size=0
+    nothing is built and only pinned streams are routed; everything else is
+    left to Tor. change_callback(circuit_id) is called when a circuit becomes
+    current without rotate(), e.g. because Tor closed the previous one.
+    """
+
+    def __init__(self, controller, size=3, status_callback=None, change_callback=None):
+        self.controller = controller
+        self.size = size
+        self.status_callback = status_callback
+        self.change_callback = change_callback
+        self.current = None
+        self._reserve = deque()
+        self._exits = {}
+        self._pinned = {}
+        self._lock = threading.Lock()
+        self._current_changed = threading.Condition(self._lock)
+        self._refill = threading.Event()
+        self._running = False
+        self._thread = None
+
+    def _status(self, message):
+        if self.status_callback:
+            self.status_callback(message)
+
+    def start(self):
+        self.controller.set_conf('__LeaveStreamsUnattached', '1')
+        self.controller.add_event_listener(self._on_stream, EventType.STREAM)
+        self.controller.add_event_listener(self._on_circuit, EventType.CIRC)
+        self._running = True
+        self._refill.set()
+        self._thread = threading.Thread(target=self._refill_loop, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        self._refill.set()
+        # Hand new streams back to Tor first, even if the listeners can't be removed
+        try:
+            self.controller.reset_conf('__LeaveStreamsUnattached')
+        except Exception:
+            pass
+        try:
+            self.controller.remove_event_listener(self._on_stream)
+            self.controller.remove_event_listener(self._on_circuit)
+        except Exception:
+            pass
+        # A build in flight closes its circuit itself once it sees the reserve stopped
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join(timeout=STOP_TIMEOUT)
+        self._thread = None
+        with self._lock:
+            reserved = list(self._reserve)
+            self._reserve.clear()
+            self.current = None
+            self._current_changed.notify_all()
+        for circuit_id in reserved:
+            try:
+                self.controller.close_circuit(circuit_id)
+            except Exception:
+                pass
+
+    @property
+    def available(self):
+        with self._lock:
+            return len(self._reserve)
+
+    def exit_fingerprint(self, circuit_id=None):
+        with self._lock:
+            return self._exits.get(circuit_id or self.current)
+
+    def wait_for_current(self, timeout):
+        """ID of the circuit new streams go to, waiting up to timeout for the first one to be built"""
+        with self._current_changed:
+            self._current_changed.wait_for(lambda: self.current is not None or not self._running or not self.size,
+                                          timeout)
+            return self.current
+
+    def pin(self, source_port, circuit_id):
+        """Attach the stream coming from a local source port to a specific circuit"""
+        with self._lock:
+            self._pinned[source_port] = circuit_id
+
+    def unpin(self, source_port):
+        with self._lock:
+            self._pinned.pop(source_port, None)
+
+    def rotate(self):
+        """Switch new streams to the next reserved circuit; returns its ID or None"""
+        with self._lock:
+            if not self._reserve:
+                return None
+            self.current = self._reserve.popleft()
+            circuit_id = self.current
+        self._refill.set()
+        return circuit_id
+
+    def release_current(self):
+        """Let Tor pick circuits for new streams until the reserve provides a new one"""
+        with self._lock:
+            self.current = None
+        self._refill.set()
+
+    def _on_stream(self, event):
+        if event.circ_id or event.status not in (StreamStatus.NEW, StreamStatus.NEWRESOLVE, StreamStatus.DETACHED):
+            return
+        with self._lock:
+            target = self._pinned.get(event.source_port, self.current)
+        try:
+            self.controller.attach_stream(event.id, target or '0')
+        except Exception:
+            try:
+                self.controller.attach_stream(event.id, '0')
+            except Exception as e:
+                print(f"Error attaching stream {event.id}: {e}")
+
+    def _changed(self, circuit_id):
+        if circuit_id and self.change_callback:
+            self.change_callback(circuit_id)
+
+    def _on_circuit(self, event):
+        if event.status not in (CircStatus.FAILED, CircStatus.CLOSED):
+            return
+        promoted = None
+        with self._lock:
+            if event.id in self._reserve:
+                self._reserve.remove(event.id)
+            if event.id == self.current:
+                self.current = promoted = self._reserve.popleft() if self._reserve else None
+                self._current_changed.notify_all()
+            self._exits.pop(event.id, None)
+        self._refill.set()
+        self._changed(promoted)
+
+    def _used_exits(self):
+        with self._lock:
+            return {self._exits.get(circuit_id) for circuit_id in list(self._reserve) + [self.current]}
+
+    def _build_circuit(self):
+        used_exits = self._used_exits()
+        for _ in range(MAX_BUILD_ATTEMPTS):
+            circuit_id = self.controller.new_circuit(await_build=True, timeout=CIRCUIT_BUILD_TIMEOUT)
+            circuit = self.controller.get_circuit(circuit_id)
+            exit_fingerprint = circuit.path[-1][0] if circuit.path else None
+            if exit_fingerprint and exit_fingerprint not in used_exits:
+                return circuit_id, exit_fingerprint
+            self.controller.close_circuit(circuit_id)
+        return None
+
+    def _refill_loop(self):
+        while self._running:
+            self._refill.wait(REFILL_RETRY_INTERVAL)
+            self._refill.clear()
+            while self._running:
+                with self._lock:
+                    if len(self._reserve) >= self.size and (self.current is not None or not self.size):
+                        break
+                try:
+                    built = self._build_circuit()
+                except Exception as e:
+                    print(f"Circuit reserve build failed: {e}")
+                    break
+                if not built:
+                    break
+                circuit_id, exit_fingerprint = built
+                promoted = None
+                with self._lock:
+                    stopped = not self._running
+                    if not stopped:
+                        self._exits[circuit_id] = exit_fingerprint
+                        if self.current is None:
+                            self.current = promoted = circuit_id
+                            self._current_changed.notify_all()
+                        else:
+                            self._reserve.append(circuit_id)
+                if stopped:
+                    # stop() ran during the build, so nothing else will close this circuit
+                    try:
+                        self.controller.close_circuit(circuit_id)
+                    except Exception:
+                        pass
+                    return
+                self._changed(promoted)
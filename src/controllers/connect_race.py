@@ -0,0 +1,128 @@
+import json
+import os
+import threading
+import time
+from src.utils.system_utils import get_app_data_dir
+
+AUTO_TRANSPORT = 'auto'
+DIRECT = 'direct'
+RACE_TRANSPORTS = ('obfs4', 'snowflake')
+RACE_FILE = 'connect_race.json'
+# Head start of each strategy over the next one, as in happy eyeballs
+RACE_STAGGER = 3
+
+def is_auto_transport(transport):
+    return str(transport or '').lower() == AUTO_TRANSPORT
+
+def race_data_dir(data_dir, strategy):
+    """Data directory of a race strategy; the direct one shares the regular data directory"""
+    return data_dir if strategy == DIRECT else f'{data_dir}-{strategy}'
+
+def race_data_dirs(data_dir):
+    return [race_data_dir(data_dir, strategy) for strategy in (DIRECT,) + RACE_TRANSPORTS]
+
+class ConnectRace:
+    """Bootstraps several connection strategies in parallel and keeps the first to reach 100%.
+
+    create_instance(strategy) returns an unstarted TorInstance with its own
+    data directory and ports, for 'direct' or a bridge transport. The winner
+    of the previous race starts first and every other strategy joins
+    RACE_STAGGER seconds later (or as soon as all running ones have failed),
+    so on an open network only one Tor is ever launched. Losers are cancelled
+    and the winner is remembered in connect_race.json.
+    """
+
+    def __init__(self, create_instance, strategies=None, path=None, stagger=RACE_STAGGER, status_callback=None):
+        self.create_instance = create_instance
+        self.strategies = list(strategies or (DIRECT,) + RACE_TRANSPORTS)
+        self.path = path or os.path.join(get_app_data_dir(), RACE_FILE)
+        self.stagger = stagger
+        self.status_callback = status_callback
+        self.winner = None
+        self.errors = {}
+        self._instances = {}
+        self._lock = threading.Lock()
+        self._changed = threading.Event()
+
+    def _status(self, message):
+        if self.status_callback:
+            self.status_callback(message)
+
+    def load(self):
+        try:
+            with open(self.path, 'r') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        return state if isinstance(state, dict) else {}
+
+    def save(self, strategy, seconds):
+        state = self.load()
+        state['winner'] = strategy
+        state['updated'] = time.time()
+        state.setdefault('bootstrap_time', {})[strategy] = round(seconds, 2)
+        tmp_path = self.path + '.tmp'
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(state, f, indent=4)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"Error saving connect race result: {e}")
+
+    def order(self):
+        """Strategies in start order, last winner first"""
+        winner = self.load().get('winner')
+        if winner in self.strategies:
+            return [winner] + [strategy for strategy in self.strategies if strategy != winner]
+        return list(self.strategies)
+
+    def run(self):
+        """Start the strategies one after another and return (strategy, instance) of the first to bootstrap"""
+        started = time.monotonic()
+        pending = self.order()
+        next_start = started
+        while True:
+            self._changed.clear()
+            with self._lock:
+                winner = self.winner
+                running = len(self._instances) - len(self.errors)
+            if winner:
+                break
+            if not pending and not running:
+                reasons = '; '.join(f'{strategy}: {error}' for strategy, error in self.errors.items())
+                raise Exception(f'All connection strategies failed ({reasons})')
+            if pending and (time.monotonic() >= next_start or not running):
+                self._start(pending.pop(0))
+                next_start = time.monotonic() + self.stagger
+            self._changed.wait(max(0.05, next_start - time.monotonic()) if pending else None)
+
+        strategy, instance = winner
+        for loser in list(self._instances.values()):
+            if loser is not instance:
+                loser.cancel()
+        self.save(strategy, time.monotonic() - started)
+        self._status(f'Connected via {strategy}.')
+        return winner
+
+    def _start(self, strategy):
+        self._status(f'Trying {strategy} connection...')
+        instance = self.create_instance(strategy)
+        with self._lock:
+            self._instances[strategy] = instance
+        threading.Thread(target=self._attempt, args=(strategy, instance), daemon=True).start()
+
+    def _attempt(self, strategy, instance):
+        try:
+            instance.start()
+        except Exception as e:
+            with self._lock:
+                self.errors[strategy] = str(e)
+            self._changed.set()
+            return
+        with self._lock:
+            won = self.winner is None
+            if won:
+                self.winner = (strategy, instance)
+        if not won:
+            instance.stop()
+        self._changed.set()
@@ -22,9 +22,9 @@ class TorController(MainWindow):
             return
             
         try:
-            if not self.controller or not self.controller.is_alive():
-                self.disconnect_from_tor()
+            if not self.session.is_alive():
+                self.disconnect_from_tor('tor-exited')
                 if self.settings.get('auto_reconnect', 0) > 0:
                     self.auto_reconnect_timer.start(self.settings.get('auto_reconnect', 0) * 60 * 1000)
         except:
-            self.disconnect_from_tor()
\ No newline at end of file
+            self.disconnect_from_tor('error')
\ No newline at end of file
@@ -0,0 +1,196 @@
+import os
+import time
+from stem.control import Listener
+from src.utils.tor_utils import create_tor_config, launch_tor, create_controller, prepare_data_dir, wait_for_port
+from src.utils.bootstrap import (BootstrapTracker, wait_for_control_port, CONTROL_PORT_FILE,
+                                 CONTROL_PORT_TIMEOUT, BOOTSTRAP_TIMEOUT)
+from src.utils.bandwidth import BandwidthMonitor
+from src.utils.bridges import BridgeProber, DEFAULT_BRIDGE_COUNT
+from src.utils.relay_index import RelayIndex
+from src.utils.tor_log import TorLog
+from src.utils.tor_process import stop_orphaned_tor, write_pid_file, remove_pid_file, shutdown_tor
+
+class TorInstance:
+    """A single Tor process together with its controller and event trackers"""
+
+    def __init__(self, tor_path, data_dir, exit_country=None, persistent=True, status_callback=None,
+                 bootstrap_callback=None, log_callback=None, socks_port='auto', control_port='auto',
+                 transport=None, bridge_count=DEFAULT_BRIDGE_COUNT, profile=None, bandwidth_limit=0):
+        self.tor_path = tor_path
+        self.data_dir = data_dir
+        self.exit_country = exit_country
+        self.transport = transport or None
+        self.bridge_count = bridge_count
+        self.profile = profile
+        self.bandwidth_limit = bandwidth_limit
+        self.persistent = persistent
+        self.status_callback = status_callback
+        self.bootstrap_callback = bootstrap_callback
+        self.process = None
+        self.controller = None
+        self.control_address = None
+        self.requested_socks_port = socks_port
+        self.requested_control_port = control_port
+        self.socks_port = None
+        self.control_port = None
+        self.bootstrap = None
+        self.bandwidth = BandwidthMonitor()
+        self.relays = RelayIndex(data_dir)
+        self.timings = {}
+        self.log = TorLog(record_callback=log_callback)
+        self.cancelled = False
+
+    def _status(self, message):
+        if self.status_callback:
+            self.status_callback(message)
+
+    def _on_bootstrap_progress(self, progress, summary):
+        self._status(f'Bootstrapping {progress}%: {summary}')
+        if self.bootstrap_callback:
+            self.bootstrap_callback(progress, summary)
+
+    def _phase(self, name, started):
+        """Record the seconds spent in a startup phase and return the start of the next one"""
+        now = time.perf_counter()
+        self.timings[name] = now - started
+        return now
+
+    def start(self, bootstrap_timeout=BOOTSTRAP_TIMEOUT):
+        self.timings = {}
+        started = time.perf_counter()
+        if stop_orphaned_tor(self.data_dir, self.tor_path):
+            self._status('Stopped a Tor process left over from a previous run.')
+
+        cache_state = prepare_data_dir(self.data_dir, self.persistent)
+        if cache_state == 'warm':
+            self._status('Reusing cached Tor directory data...')
+        elif cache_state == 'stale':
+            self._status('Cached Tor directory data expired, refreshing...')
+        started = self._phase('cleanup', started)
+
+        bridge_lines = None
+        if self.transport:
+            prober = BridgeProber(self.tor_path, status_callback=self.status_callback)
+            bridge_lines = prober.torrc_lines(self.transport, self.bridge_count)
+            self._status(f'Connecting through the fastest {self.transport} bridges...')
+            started = self._phase('bridges', started)
+
+        if self.exit_country:
+            self._status(f'Creating Tor configuration (via {self.exit_country})...')
+        else:
+            self._status('Creating Tor configuration...')
+        tor_config = create_tor_config(self.tor_path, self.data_dir, self.exit_country,
+                                       self.requested_socks_port, self.requested_control_port,
+                                       owner_pid=os.getpid(), bridge_lines=bridge_lines,
+                                       profile=self.profile, bandwidth_limit=self.bandwidth_limit)
+        if not tor_config:
+            raise Exception('Failed to create Tor configuration!')
+        started = self._phase('config', started)
+
+        if self.cancelled:
+            raise Exception('Tor start was cancelled')
+        self._status('Starting Tor service...')
+        self.process = launch_tor(self.tor_path, tor_config, self.status_callback)
+        if not self.process:
+            raise Exception('Failed to start Tor!')
+        write_pid_file(self.data_dir, self.process.pid)
+        self.log.clear()
+        self.log.attach(self.process)
+
+        try:
+            if self.cancelled:
+                raise Exception('Tor start was cancelled')
+            self.control_address = wait_for_control_port(os.path.join(self.data_dir, CONTROL_PORT_FILE),
+                                                         CONTROL_PORT_TIMEOUT, self.process)
+            if not self.control_address:
+                raise Exception(f"Tor control port did not come up!{self._last_error()}")
+            self.control_port = self.control_address[1]
+            started = self._phase('launch', started)
+
+            self._status('Creating Tor controller...')
+            self.controller = self._connect_controller()
+            self.socks_port = self._socks_listener_port()
+            if not wait_for_port(self.socks_port, timeout=CONTROL_PORT_TIMEOUT, process=self.process):
+                raise Exception(f'Tor SOCKS port {self.socks_port} is not accepting connections!')
+            started = self._phase('controller', started)
+
+            self.bandwidth.reset()
+            self.bandwidth.attach(self.controller)
+
+            self.bootstrap = BootstrapTracker(self._on_bootstrap_progress)
+            self.bootstrap.attach(self.controller)
+            try:
+                if not self.bootstrap.wait(bootstrap_timeout, process=self.process):
+                    last_warning = self.log.last_warning()
+                    reason = self.bootstrap.warning or (last_warning and last_warning.message) or \
+                             f'stalled at {self.bootstrap.progress}%'
+                    raise Exception(f'Tor bootstrap failed: {reason}')
+            finally:
+                self.bootstrap.detach()
+            self._phase('bootstrap', started)
+            self.relays.attach(self.controller)
+        except Exception:
+            self.stop()
+            if self.cancelled:
+                raise Exception('Tor start was cancelled')
+            raise
+
+        self._status('Tor controller ready.')
+
+    def cancel(self):
+        """Abort a start() running on another thread; that thread cleans up and raises"""
+        self.cancelled = True
+        process = self.process
+        if process and process.poll() is None:
+            process.terminate()
+
+    def _last_error(self):
+        if self.process and self.process.poll() is not None:
+            self.log.join(1)
+        last_warning = self.log.last_warning()
+        return f' ({last_warning.message})' if last_warning else ''
+
+    def _connect_controller(self):
+        host, port = self.control_address
+        deadline = time.monotonic() + CONTROL_PORT_TIMEOUT
+        while True:
+            try:
+                controller = create_controller(port, host)
+                if not controller.is_authenticated():
+                    raise Exception('Controller authentication failed!')
+                if not controller.is_alive():
+                    raise Exception('Controller is not responding!')
+                return controller
+            except Exception as e:
+                if time.monotonic() >= deadline or self.process.poll() is not None:
+                    raise Exception(f'Tor controller error: {str(e)}')
+                time.sleep(0.1)
+
+    def _socks_listener_port(self):
+        for address, port in self.controller.get_listeners(Listener.SOCKS):
+            if address in ('127.0.0.1', 'localhost', '::1'):
+                return port
+        raise Exception('Tor has no local SOCKS listener!')
+
+    def is_alive(self):
+        return bool(self.controller and self.controller.is_alive()
+                    and self.process and self.process.poll() is None)
+
+    def stop(self, timeout=5):
+        self.bandwidth.detach()
+        self.relays.detach()
+        if self.process:
+            if not shutdown_tor(self.process, self.controller, timeout):
+                print(f"Tor process {self.process.pid} did not exit")
+            else:
+                remove_pid_file(self.data_dir)
+            self.process = None
+        self.socks_port = None
+        self.control_port = None
+
+        if self.controller:
+            try:
+                self.controller.close()
+            except Exception:
+                pass
+            self.controller = None
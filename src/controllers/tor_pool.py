@@ -0,0 +1,135 @@
+import os
+import threading
+from src.controllers.tor_instance import TorInstance
+from src.controllers.connect_race import ConnectRace, DIRECT, is_auto_transport
+from src.utils.socks_balancer import SocksBalancer, Backend
+from src.utils.exit_selector import ExitSelector, is_auto_country
+from src.utils.system_utils import get_tor_path, get_tor_data_dir
+from src.utils.torrc import DEFAULT_PROFILE
+
+HEALTH_CHECK_INTERVAL = 5
+
+class TorPool:
+    """Runs several Tor instances behind one load-balancing SOCKS listener"""
+
+    def __init__(self, size=2, settings=None, tor_path=None, data_root=None, host='127.0.0.1', port=9050,
+                 strategy='round-robin', status_callback=None):
+        self.size = size
+        self.settings = settings if settings is not None else {}
+        self.tor_path = tor_path or get_tor_path()
+        self.data_root = data_root or get_tor_data_dir() + '_pool'
+        self.status_callback = status_callback
+        self.instances = {}
+        self.balancer = SocksBalancer(host=host, port=port, strategy=strategy)
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._monitor = None
+
+    def _status(self, message):
+        if self.status_callback:
+            self.status_callback(message)
+
+    def _exit_country(self):
+        exit_country = self.settings.get('exit_country', '')
+        if is_auto_country(exit_country):
+            # The pool does not probe; it uses the fastest country measured by earlier sessions
+            return ExitSelector().best() or ''
+        return exit_country
+
+    def _transport(self):
+        transport = self.settings.get('bridge_transport', '')
+        if is_auto_transport(transport):
+            # Likewise the pool does not race; it uses whatever won the last session's race
+            winner = ConnectRace(None).load().get('winner')
+            return '' if winner in (None, DIRECT) else winner
+        return transport
+
+    def _create_instance(self, index):
+        name = f'tor-{index}'
+        return name, TorInstance(
+            self.tor_path,
+            os.path.join(self.data_root, name),
+            exit_country=self._exit_country(),
+            persistent=self.settings.get('persistent_data_dir', True),
+            status_callback=lambda message: self._status(f'[{name}] {message}'),
+            transport=self._transport(),
+            bridge_count=self.settings.get('bridge_count', 3),
+            profile=self.settings.get('torrc_profile', DEFAULT_PROFILE),
+            bandwidth_limit=self.settings.get('bandwidth_limit', 0)
+        )
+
+    def start(self):
+        if not self.tor_path:
+            raise Exception('Tor executable not found!')
+
+        errors = []
+
+        def start_instance(index):
+            name, instance = self._create_instance(index)
+            try:
+                instance.start()
+            except Exception as e:
+                errors.append(f'{name}: {e}')
+                return
+            with self._lock:
+                self.instances[name] = instance
+            self.balancer.add_backend(Backend(name, '127.0.0.1', instance.socks_port))
+
+        threads = [threading.Thread(target=start_instance, args=(index,), daemon=True) for index in range(self.size)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        for error in errors:
+            self._status(f'Instance failed to start: {error}')
+        if not self.instances:
+            raise Exception('No Tor instance could be started!')
+
+        self.balancer.start()
+        self._stop.clear()
+        self._monitor = threading.Thread(target=self._monitor_health, daemon=True)
+        self._monitor.start()
+        self._status(f'Pool ready: {len(self.instances)}/{self.size} instances behind '
+                     f'{self.balancer.host}:{self.balancer.port} ({self.balancer.strategy})')
+
+    def _monitor_health(self):
+        while not self._stop.wait(HEALTH_CHECK_INTERVAL):
+            with self._lock:
+                instances = list(self.instances.items())
+            for name, instance in instances:
+                healthy = instance.is_alive()
+                self.balancer.set_healthy(name, healthy)
+
+    def stats(self):
+        with self._lock:
+            instances = dict(self.instances)
+        report = []
+        for backend in self.balancer.stats():
+            instance = instances.get(backend['name'])
+            if instance:
+                read, written = instance.bandwidth.average(5)
+                backend['read_rate'] = round(read)
+                backend['write_rate'] = round(written)
+                backend['total_read'] = instance.bandwidth.total_read
+                backend['total_written'] = instance.bandwidth.total_written
+            report.append(backend)
+        return report
+
+    def new_identity(self):
+        with self._lock:
+            instances = list(self.instances.values())
+        for instance in instances:
+            try:
+                instance.controller.signal('NEWNYM')
+            except Exception as e:
+                print(f"Error requesting new identity: {e}")
+
+    def stop(self):
+        self._stop.set()
+        self.balancer.stop()
+        with self._lock:
+            instances = list(self.instances.values())
+            self.instances = {}
+        for instance in instances:
+            instance.stop()
@@ -0,0 +1,600 @@
+import socket
+import threading
+import time
+from src.utils.geoip import get_geoip, warm_geoip
+from src.utils.torrc import DEFAULT_PROFILE
+from src.utils.system_utils import set_system_proxy, get_tor_path, get_tor_data_dir
+
+CHECK_URL = 'https://check.torproject.org/api/ip'
+VERIFY_TIMEOUT = 45
+VERIFY_RETRY_DELAY = 1
+IP_CHANGE_TIMEOUT = 30
+EXIT_RESOLVE_TIMEOUT = 10
+# Settings that reconfigure() can push to a running Tor
+LIVE_SETTINGS = ('exit_country', 'bridge_transport', 'bridge_count', 'torrc_profile', 'bandwidth_limit')
+
+class SessionState:
+    DISCONNECTED = 'disconnected'
+    CONNECTING = 'connecting'
+    CONNECTED = 'connected'
+    DISCONNECTING = 'disconnecting'
+    ERROR = 'error'
+
+class TorSession:
+    """GUI-free Tor connection engine.
+
+    connect(), disconnect() and change_ip() block and are meant to be called
+    from a worker thread. Listeners registered with add_listener() are called
+    as callback(event, value) from whichever thread produced the event, with
+    event being one of 'state', 'status', 'bootstrap', 'ip' or 'log' (a
+    TorLogRecord parsed from Tor's output).
+
+    The controller, proxy and HTTP stacks (stem, psutil, PySocks, requests)
+    are imported on first connect so constructing a session stays cheap.
+    """
+
+    def __init__(self, settings=None, tor_path=None, data_dir=None, use_system_proxy=True,
+                 patch_socket=False, check_url=CHECK_URL):
+        self.settings = settings if settings is not None else {}
+        self.tor_path = tor_path or get_tor_path()
+        self.data_dir = data_dir or get_tor_data_dir()
+        self.use_system_proxy = use_system_proxy
+        self.patch_socket = patch_socket
+        self.check_url = check_url
+        self.instance = None
+        self.reserve = None
+        self.exit_resolver = None
+        self.exit_selector = None
+        self.strategy = None
+        self.exit_ip = None
+        self._exit_country = None
+        self.error = None
+        self.connected_at = None
+        self.connect_time = None
+        self.rotations = 0
+        self.timings = {}
+        self._state = SessionState.DISCONNECTED
+        self._listeners = []
+        self._lock = threading.RLock()
+        self._operation_lock = threading.Lock()
+        self._original_socket = None
+        self._race_progress = 0
+
+    def add_listener(self, callback):
+        with self._lock:
+            self._listeners.append(callback)
+
+    def remove_listener(self, callback):
+        with self._lock:
+            if callback in self._listeners:
+                self._listeners.remove(callback)
+
+    def _notify(self, event, value):
+        with self._lock:
+            listeners = list(self._listeners)
+        for callback in listeners:
+            try:
+                callback(event, value)
+            except Exception as e:
+                print(f"Error in session listener: {str(e)}")
+
+    def _status(self, message):
+        self._notify('status', message)
+
+    def _set_state(self, state):
+        with self._lock:
+            if self._state == state:
+                return
+            self._state = state
+        self._notify('state', state)
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state
+
+    @property
+    def is_connected(self):
+        return self.state == SessionState.CONNECTED
+
+    @property
+    def controller(self):
+        instance = self.instance
+        return instance.controller if instance else None
+
+    @property
+    def bandwidth(self):
+        instance = self.instance
+        return instance.bandwidth if instance else None
+
+    @property
+    def log(self):
+        instance = self.instance
+        return instance.log if instance else None
+
+    @property
+    def socks_port(self):
+        instance = self.instance
+        return instance.socks_port if instance else None
+
+    @property
+    def duration(self):
+        if not self.connected_at:
+            return 0
+        return int(time.time() - self.connected_at)
+
+    def exit_country(self):
+        """Country of the current exit IP, looked up when the exit changed so this never blocks"""
+        return self._exit_country
+
+    def _lookup_country(self, address):
+        if not address:
+            return None
+        country = get_geoip().country(address)
+        if country:
+            return country
+        controller = self.controller
+        if not controller:
+            return None
+        try:
+            country = controller.get_info(f'ip-to-country/{address}')
+        except Exception:
+            return None
+        return country.upper() if country and country != '??' else None
+
+    def session_record(self):
+        """Details of the current session in the form ConnectionHistory.add_connection() takes"""
+        bandwidth = self.bandwidth
+        return {
+            'ip': self.exit_ip or 'Unknown',
+            'duration': self.duration,
+            'bootstrap_time': self.connect_time,
+            'exit_country': self.exit_country(),
+            'exit_fingerprint': self.exit_resolver.exit_fingerprint() if self.exit_resolver else None,
+            'bytes_read': bandwidth.total_read if bandwidth else 0,
+            'bytes_written': bandwidth.total_written if bandwidth else 0,
+            'rotations': self.rotations
+        }
+
+    def is_alive(self):
+        instance = self.instance
+        return bool(instance and instance.is_alive())
+
+    def connect(self):
+        if not self._operation_lock.acquire(blocking=False):
+            return False
+        try:
+            if self.state == SessionState.CONNECTED:
+                return True
+            self.error = None
+            self.rotations = 0
+            self.timings = {}
+            self._set_state(SessionState.CONNECTING)
+            started = time.monotonic()
+            try:
+                self._connect()
+            except Exception as e:
+                self.error = str(e)
+                self._teardown()
+                self._set_state(SessionState.ERROR)
+                return False
+            self.connect_time = round(time.monotonic() - started, 2)
+            self.connected_at = time.time()
+            if hasattr(self.settings, 'subscribe'):
+                self.settings.subscribe(self._on_settings_changed, LIVE_SETTINGS)
+            self._set_state(SessionState.CONNECTED)
+            self._notify('ip', self.exit_ip)
+            return True
+        finally:
+            self._operation_lock.release()
+
+    def _connect(self):
+        from src.controllers.tor_instance import TorInstance
+        from src.controllers.circuit_reserve import CircuitReserve
+        from src.controllers.connect_race import ConnectRace, DIRECT, is_auto_transport
+        from src.utils.exit_resolver import ExitResolver
+        from src.utils.exit_selector import ExitSelector, is_auto_country
+
+        if not self.tor_path:
+            raise Exception('Tor executable not found!')
+        # Ready by the time the exit IP is known, so the GUI never builds the table itself
+        warm_geoip()
+
+        if self.use_system_proxy:
+            self._status('Disabling Windows proxy settings...')
+            set_system_proxy(False)
+
+        exit_country = self.settings.get('exit_country', '')
+        if is_auto_country(exit_country):
+            self.exit_selector = ExitSelector(probe_url=self.check_url, status_callback=self._status,
+                                              change_callback=self._on_fastest_country)
+            exit_country = self.exit_selector.best() or ''
+
+        self._status('Starting Tor...')
+        transport = self.settings.get('bridge_transport', '')
+        if is_auto_transport(transport):
+            self._race_progress = 0
+            race = ConnectRace(lambda strategy: self._race_instance(strategy, exit_country),
+                               status_callback=self._status)
+            self.strategy, self.instance = race.run()
+        else:
+            self.instance = TorInstance(
+                self.tor_path,
+                self.data_dir,
+                exit_country=exit_country,
+                persistent=self.settings.get('persistent_data_dir', True),
+                status_callback=self._status,
+                socks_port=self.settings.get('socks_port', 'auto'),
+                transport=transport,
+                bridge_count=self.settings.get('bridge_count', 3),
+                profile=self.settings.get('torrc_profile', DEFAULT_PROFILE),
+                bandwidth_limit=self.settings.get('bandwidth_limit', 0),
+                bootstrap_callback=lambda progress, summary: self._notify('bootstrap', progress),
+                log_callback=lambda record: self._notify('log', record)
+            )
+            self.instance.start()
+            self.strategy = transport or DIRECT
+        self.timings.update(self.instance.timings)
+        self.exit_resolver = ExitResolver(self._on_exit_changed)
+        self.exit_resolver.attach(self.controller)
+
+        if self.settings.get('rotation_mode', 'newnym') == 'reserve':
+            self._status('Building circuit reserve...')
+            self.reserve = CircuitReserve(self.controller, self.settings.get('circuit_reserve_size', 3), self._status,
+                                          change_callback=self._on_reserve_changed)
+            self.reserve.start()
+
+        if self.exit_selector:
+            self.exit_selector.start(self.controller, self.socks_port, self.instance.relays, self.reserve,
+                                     current=exit_country)
+
+        started = time.perf_counter()
+        if self.patch_socket:
+            import socks
+            self._status('Setting up SOCKS proxy...')
+            self._original_socket = socket.socket
+            socket._original_socket = self._original_socket
+            socks.set_default_proxy(socks.SOCKS5, '127.0.0.1', self.socks_port)
+            socket.socket = socks.socksocket
+
+        if self.use_system_proxy:
+            self._status('Setting up system proxy...')
+            if not set_system_proxy(True, '127.0.0.1', str(self.socks_port)):
+                raise Exception('System Proxy Error!')
+        self.timings['proxy'] = time.perf_counter() - started
+
+        started = time.perf_counter()
+        exit_ip = self._resolve_exit_ip()
+        self._exit_country = self._lookup_country(exit_ip)
+        self.exit_ip = exit_ip
+        self.timings['verify'] = time.perf_counter() - started
+
+    def _race_instance(self, strategy, exit_country):
+        """Unstarted TorInstance for one ConnectRace strategy, in its own data directory and on automatic ports"""
+        from src.controllers.tor_instance import TorInstance
+        from src.controllers.connect_race import DIRECT, race_data_dir
+
+        def on_bootstrap(progress, summary):
+            # Report the furthest strategy so the progress bar doesn't jump back and forth
+            self._race_progress = max(progress, self._race_progress)
+            self._notify('bootstrap', self._race_progress)
+
+        return TorInstance(
+            self.tor_path,
+            race_data_dir(self.data_dir, strategy),
+            exit_country=exit_country,
+            persistent=self.settings.get('persistent_data_dir', True),
+            status_callback=lambda message: self._status(f'[{strategy}] {message}'),
+            transport=None if strategy == DIRECT else strategy,
+            bridge_count=self.settings.get('bridge_count', 3),
+            profile=self.settings.get('torrc_profile', DEFAULT_PROFILE),
+            bandwidth_limit=self.settings.get('bandwidth_limit', 0),
+            bootstrap_callback=on_bootstrap,
+            log_callback=lambda record: self._notify('log', record)
+        )
+
+    def _resolve_exit_ip(self):
+        if not self.settings.get('verify_exit_ip', False):
+            self._status('Resolving exit IP...')
+            exit_ip = self._reserve_exit_ip() if self.reserve else None
+            exit_ip = exit_ip or self.exit_resolver.wait_for_exit(EXIT_RESOLVE_TIMEOUT)
+            if exit_ip:
+                return exit_ip
+        return self._verify_connection()
+
+    def _reserve_exit_ip(self):
+        """Exit IP of the reserve circuit new streams are attached to"""
+        circuit_id = self.reserve.wait_for_current(EXIT_RESOLVE_TIMEOUT)
+        if not circuit_id:
+            return None
+        self.exit_resolver.select(circuit_id)
+        return self.exit_resolver.address(circuit_id)
+
+    def _on_exit_changed(self, address):
+        if not self.is_connected or (self.reserve and self.reserve.current):
+            return
+        self._set_exit_ip(address)
+
+    def _on_reserve_changed(self, circuit_id):
+        # Tor closed the reserve's current circuit and new streams now go to the next one
+        if not self.is_connected or not self.exit_resolver:
+            return
+        self.exit_resolver.select(circuit_id)
+        address = self.exit_resolver.address(circuit_id)
+        if address:
+            self._set_exit_ip(address)
+
+    def _set_exit_ip(self, address):
+        if address == self.exit_ip:
+            return
+        country = self._lookup_country(address)
+        with self._lock:
+            if address == self.exit_ip:
+                return
+            self.exit_ip = address
+            self._exit_country = country
+        self._notify('ip', address)
+
+    def _verify_connection(self):
+        deadline = time.monotonic() + VERIFY_TIMEOUT
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                self._status('Testing Tor connection...')
+                if not self.is_alive():
+                    raise Exception('Tor service is not responding!')
+
+                data = self.check_ip(timeout=max(1, min(15, deadline - time.monotonic())))
+                if data.get('IsTor', False):
+                    return data.get('IP', 'Unknown')
+                raise Exception('Tor connection could not be verified!')
+            except Exception as e:
+                error_msg = str(e)
+                if deadline - time.monotonic() <= VERIFY_RETRY_DELAY:
+                    raise Exception(f'Connection error: {error_msg}')
+                self._status(f'Connection attempt {attempt + 1}... ({error_msg})')
+                time.sleep(VERIFY_RETRY_DELAY)
+
+    def check_ip(self, timeout=15):
+        import requests
+        session = requests.Session()
+        session.trust_env = False
+        proxy = f'socks5h://127.0.0.1:{self.socks_port}'
+        try:
+            response = session.get(self.check_url, timeout=timeout, verify=True,
+                                   proxies={'http': proxy, 'https': proxy})
+        except requests.exceptions.RequestException as e:
+            error_msg = "Connection timed out" if isinstance(e, requests.exceptions.Timeout) else \
+                        "Connection refused" if isinstance(e, requests.exceptions.ConnectionError) else \
+                        "SSL/TLS error" if isinstance(e, requests.exceptions.SSLError) else \
+                        f"Connection error: {str(e)}"
+            raise Exception(error_msg)
+        if response.status_code != 200:
+            raise Exception(f'Could not get IP address! Status code: {response.status_code}')
+        return response.json()
+
+    def change_ip(self, timeout=IP_CHANGE_TIMEOUT):
+        if not self._operation_lock.acquire(blocking=False):
+            return None
+        try:
+            controller = self.controller
+            if not self.is_connected or not controller:
+                return None
+
+            if self.reserve:
+                new_ip = self._rotate_reserved_circuit()
+                if new_ip:
+                    return new_ip
+                self._status('Circuit reserve is empty, requesting a new identity...')
+                self.reserve.release_current()
+
+            old_ip = self.exit_ip
+            deadline = time.monotonic() + timeout
+            while time.monotonic() < deadline:
+                wait = controller.get_newnym_wait()
+                if wait > 0:
+                    time.sleep(min(wait, max(0, deadline - time.monotonic())))
+                requested_at = time.monotonic()
+                self.exit_resolver.expect_new_exit()
+                controller.signal('NEWNYM')
+                new_ip = self.exit_resolver.wait_for_exit(max(1, min(10, deadline - time.monotonic())),
+                                                          since=requested_at, exclude=old_ip)
+                if self.settings.get('verify_exit_ip', False) or not new_ip:
+                    try:
+                        new_ip = self.check_ip(timeout=max(1, min(10, deadline - time.monotonic()))).get('IP')
+                    except Exception as e:
+                        self._status(f'IP check failed: {str(e)}')
+                        continue
+                if new_ip and new_ip != old_ip:
+                    self.rotations += 1
+                    self._set_exit_ip(new_ip)
+                    return new_ip
+            return None
+        finally:
+            self._operation_lock.release()
+
+    def _rotate_reserved_circuit(self):
+        circuit_id = self.reserve.rotate()
+        if not circuit_id:
+            return None
+        self.exit_resolver.select(circuit_id)
+        new_ip = self.exit_resolver.address(circuit_id)
+        if new_ip:
+            self.rotations += 1
+            self._set_exit_ip(new_ip)
+        return new_ip
+
+    @staticmethod
+    def needs_reconnect(changes):
+        """Whether some of the changed settings can only take effect on the next connect"""
+        from src.controllers.connect_race import is_auto_transport
+        return 'bridge_transport' in changes and is_auto_transport(changes['bridge_transport'][1])
+
+    def _on_settings_changed(self, changes):
+        # Bridge probing can take a few seconds, so keep it off the thread that saved the settings
+        threading.Thread(target=self.reconfigure, args=(changes,), daemon=True).start()
+
+    def reconfigure(self, changes):
+        """Push changed settings ({key: (old, new)}) to the running Tor and close only the circuits they affect"""
+        with self._operation_lock:
+            controller = self.controller
+            if not self.is_connected or not controller:
+                return False
+            if self.needs_reconnect(changes):
+                self._status('Automatic bridge selection takes effect on the next connect.')
+                return False
+            started = time.perf_counter()
+            try:
+                if 'torrc_profile' in changes:
+                    self._apply_profile(controller, *changes['torrc_profile'])
+                if 'bandwidth_limit' in changes:
+                    self._apply_bandwidth_limit(controller)
+                if 'bridge_transport' in changes or 'bridge_count' in changes:
+                    self._apply_bridges(controller)
+                if 'exit_country' in changes:
+                    self._apply_exit_country(controller, *changes['exit_country'])
+            except Exception as e:
+                self._status(f'Could not apply settings: {str(e)}')
+                return False
+            self._status(f'Settings applied in {time.perf_counter() - started:.1f} s.')
+            return True
+
+    def _apply_profile(self, controller, old, new):
+        from src.utils.torrc import get_profile
+        options = get_profile(new)
+        stale = [option for option in get_profile(old) if option not in options]
+        if stale:
+            controller.reset_conf(*stale)
+        controller.set_options(options)
+        self.instance.profile = new
+
+    def _apply_bandwidth_limit(self, controller):
+        from src.utils.torrc import bandwidth_options
+        limit = self.settings.get('bandwidth_limit', 0)
+        if limit:
+            controller.set_options(bandwidth_options(limit))
+        else:
+            controller.reset_conf('BandwidthRate', 'BandwidthBurst')
+        self.instance.bandwidth_limit = limit
+
+    def _apply_bridges(self, controller):
+        from src.utils.bridges import BridgeProber
+        from src.utils.torrc import TorrcBuilder
+        transport = self.settings.get('bridge_transport', '')
+        if transport:
+            prober = BridgeProber(self.tor_path, status_callback=self._status)
+            config = TorrcBuilder()
+            for line in prober.torrc_lines(transport, self.settings.get('bridge_count', 3)):
+                config.add_line(line)
+            controller.set_options(config.options())
+        else:
+            controller.reset_conf('UseBridges', 'Bridge', 'ClientTransportPlugin')
+        self.instance.transport = transport or None
+        # Every circuit starts at a guard that is (or is not) a bridge, so none of them can be kept
+        closed = self._close_circuits(controller, lambda exit_fingerprint: True)
+        self._status(f'Switched to {transport or "direct"} connection, closed {closed} circuit(s).')
+
+    def _apply_exit_country(self, controller, old, new):
+        from src.utils.exit_selector import ExitSelector, is_auto_country
+        if is_auto_country(old) and self.exit_selector:
+            self.exit_selector.stop()
+            self.exit_selector = None
+        country = new
+        if is_auto_country(new):
+            self.exit_selector = ExitSelector(probe_url=self.check_url, status_callback=self._status,
+                                              change_callback=self._on_fastest_country)
+            country = self.exit_selector.best() or ''
+
+        if country:
+            controller.set_options({'ExitNodes': f'{{{country}}}', 'StrictNodes': '0'})
+        else:
+            controller.reset_conf('ExitNodes', 'StrictNodes')
+        self.instance.exit_country = country
+        if is_auto_country(new):
+            self.exit_selector.start(controller, self.socks_port, self.instance.relays, self.reserve, current=country)
+
+        if country:
+            closed = self._close_circuits(controller, lambda exit_fingerprint:
+                                          self._relay_country(controller, exit_fingerprint) != country.upper())
+            self._status(f'Exit country changed, closed {closed} circuit(s) through other countries.')
+
+    def _on_fastest_country(self, country):
+        # Called on the selector's probe thread, which stop() joins, so don't wait for the operation lock there
+        threading.Thread(target=self._switch_fastest_country, args=(country,), daemon=True).start()
+
+    def _switch_fastest_country(self, country):
+        from src.utils.exit_selector import is_auto_country
+        instance = self.instance
+        if not instance or not is_auto_country(self.settings.get('exit_country', '')):
+            return
+        # The setting stays 'auto'; only the country it currently resolves to changes
+        self.reconfigure({'exit_country': (instance.exit_country or '', country)})
+
+    def _relay_country(self, controller, fingerprint):
+        country = self.instance.relays.country(fingerprint)
+        if country and country != '??':
+            return country
+        try:
+            return get_geoip().country(controller.get_network_status(fingerprint).address)
+        except Exception:
+            return None
+
+    def _close_circuits(self, controller, affected):
+        """Close built circuits carrying user traffic for which affected(exit_fingerprint) is true"""
+        from src.utils.exit_resolver import EXIT_PURPOSES
+        closed = 0
+        for circuit in controller.get_circuits():
+            if circuit.purpose not in EXIT_PURPOSES or circuit.status != 'BUILT' or not circuit.path:
+                continue
+            if affected(circuit.path[-1][0]):
+                try:
+                    controller.close_circuit(circuit.id)
+                    closed += 1
+                except Exception:
+                    pass
+        return closed
+
+    def disconnect(self):
+        with self._operation_lock:
+            if self.state == SessionState.DISCONNECTED:
+                return True
+            self._set_state(SessionState.DISCONNECTING)
+            try:
+                self._teardown()
+            except Exception as e:
+                self.error = str(e)
+                self._set_state(SessionState.ERROR)
+                return False
+            self.exit_ip = None
+            self._exit_country = None
+            self.connected_at = None
+            self._set_state(SessionState.DISCONNECTED)
+            return True
+
+    def _teardown(self):
+        if hasattr(self.settings, 'unsubscribe'):
+            self.settings.unsubscribe(self._on_settings_changed)
+
+        if self.use_system_proxy:
+            set_system_proxy(False)
+
+        if self._original_socket is not None:
+            socket.socket = self._original_socket
+            self._original_socket = None
+
+        if self.exit_selector:
+            self.exit_selector.stop()
+            self.exit_selector = None
+
+        if self.reserve:
+            self.reserve.stop()
+            self.reserve = None
+
+        if self.exit_resolver:
+            self.exit_resolver.detach()
+            self.exit_resolver = None
+
+        if self.instance:
+            self.instance.stop()
+            self.instance = None
@@ -1,18 +1,16 @@
 import sys
 import os
-import ctypes
-import subprocess
-import win32gui
-import win32con
 
 def is_admin():
     try:
+        import ctypes
         return ctypes.windll.shell32.IsUserAnAdmin()
     except:
         return False
 
 def run_as_admin():
     if not is_admin():
+        import ctypes
         python_exe = sys.executable
         script = os.path.abspath(__file__)
         ctypes.windll.shell32.ShellExecuteW(None, "runas", python_exe, script, None, 1)
@@ -20,26 +18,53 @@ def run_as_admin():
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from PySide6.QtWidgets import QApplication
-from PySide6.QtGui import QIcon
-from src.controllers.tor_controller import TorController
-
 def hide_console():
+    import win32gui
+    import win32con
     window = win32gui.GetForegroundWindow()
     if window:
         win32gui.ShowWindow(window, win32con.SW_HIDE)
 
 def main():
-    run_as_admin()
+    profiler = None
+    if '--profile-startup' in sys.argv:
+        from src.utils.startup_profile import StartupProfiler
+        profiler = StartupProfiler()
+        sys.argv.remove('--profile-startup')
+        
+    from src.cli import COMMANDS, main as cli_main
+    if len(sys.argv) > 1 and sys.argv[1] in COMMANDS:
+        sys.exit(cli_main(sys.argv[1:]))
+        
+    if profiler is None:
+        run_as_admin()
+    
+    from PySide6.QtWidgets import QApplication
+    from PySide6.QtGui import QIcon
+    if profiler:
+        profiler.mark('import Qt')
     
     app = QApplication(sys.argv)
     
     icon_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ui', 'logo.ico')
     if os.path.exists(icon_path):
         app.setWindowIcon(QIcon(icon_path))
+    if profiler:
+        profiler.mark('create QApplication')
+    
+    from src.controllers.tor_controller import TorController
+    if profiler:
+        profiler.mark('import main window')
     
     window = TorController()
+    if profiler:
+        profiler.mark('construct main window')
     window.show()
+    if profiler:
+        app.processEvents()
+        profiler.mark('first paint')
+        print(profiler.report(), flush=True)
+        sys.exit(0)
     sys.exit(app.exec())
     
 if __name__ == '__main__':
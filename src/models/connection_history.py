@@ -1,61 +1,285 @@
 import json
+import math
+import sqlite3
+import threading
 from datetime import datetime
 import os
+from src.utils.system_utils import get_app_data_dir
+
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+SORT_COLUMNS = ('timestamp', 'ip', 'duration')
+SESSION_FIELDS = ('bootstrap_time', 'exit_country', 'exit_fingerprint', 'bytes_read', 'bytes_written',
+                  'rotations', 'disconnect_reason')
+SESSION_COLUMNS = {
+    'bootstrap_time': 'REAL',
+    'exit_country': 'TEXT',
+    'exit_fingerprint': 'TEXT',
+    'bytes_read': 'INTEGER NOT NULL DEFAULT 0',
+    'bytes_written': 'INTEGER NOT NULL DEFAULT 0',
+    'rotations': 'INTEGER NOT NULL DEFAULT 0',
+    'disconnect_reason': 'TEXT'
+}
+# Log-scale histogram buckets: each bucket is ~10% wide, so percentiles are within 10%.
+# They start at 10 ms so sub-second connect times (warm cache, reserve rotation) get their own buckets.
+HISTOGRAM_GROWTH = 1.1
+HISTOGRAM_FLOOR = 0.01
+# Bumped whenever the aggregate tables or histogram buckets change meaning; they are rebuilt on open
+STATS_VERSION = 2
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS connections (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    ip TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    duration INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_connections_timestamp ON connections (timestamp);
+CREATE INDEX IF NOT EXISTS idx_connections_ip ON connections (ip);
+CREATE INDEX IF NOT EXISTS idx_connections_duration ON connections (duration);
+CREATE TABLE IF NOT EXISTS country_stats (
+    country TEXT PRIMARY KEY,
+    sessions INTEGER NOT NULL,
+    total_duration INTEGER NOT NULL,
+    total_bootstrap_time REAL NOT NULL,
+    bootstrap_sessions INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS exit_stats (
+    ip TEXT PRIMARY KEY,
+    fingerprint TEXT,
+    country TEXT,
+    sessions INTEGER NOT NULL,
+    total_duration INTEGER NOT NULL,
+    longest_duration INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS histograms (
+    metric TEXT NOT NULL,
+    bucket INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (metric, bucket)
+);
+"""
+
+def _histogram_bucket(value):
+    if value < HISTOGRAM_FLOOR:
+        return 0
+    return int(math.log(value / HISTOGRAM_FLOOR, HISTOGRAM_GROWTH)) + 1
+
+def _bucket_upper_bound(bucket):
+    return HISTOGRAM_FLOOR * HISTOGRAM_GROWTH ** bucket
+
+def _format_timestamp(value):
+    if isinstance(value, datetime):
+        return value.strftime(TIMESTAMP_FORMAT)
+    return value
 
 class ConnectionHistory:
-    def __init__(self, max_entries=10):
+    """Connection history kept in an indexed SQLite database.
+
+    Every connection is a single INSERT, so retention is unbounded;
+    max_entries is only the default number of rows get_last_connections()
+    returns. An existing connection_history.json is imported once.
+
+    Per-country and per-exit aggregates and log-scale histograms of session
+    duration and connect time are updated in the same transaction as each
+    insert, so statistics never rescan the connections table.
+    """
+
+    def __init__(self, max_entries=10, db_path=None):
         self.max_entries = max_entries
-        
-        app_data_path = os.path.join(os.environ.get('APPDATA', ''), 'TorShield')
-        if not os.path.exists(app_data_path):
-            os.makedirs(app_data_path)
-            
-        self.history_file = os.path.join(app_data_path, 'connection_history.json')
-        self.connections = self.load_history()
-        
-    def load_history(self):
-        try:
-            if os.path.exists(self.history_file):
-                with open(self.history_file, 'r') as f:
-                    return json.load(f)
-            return []
-        except:
-            return []
-            
-    def save_history(self):
+        self.history_file = os.path.join(get_app_data_dir(), 'connection_history.json')
+        self.db_path = db_path or os.path.join(get_app_data_dir(), 'connection_history.db')
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        with self._lock, self._db:
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.executescript(SCHEMA)
+            self._migrate_columns()
+        self._migrate_json()
+
+    def _migrate_columns(self):
+        existing = {row['name'] for row in self._db.execute('PRAGMA table_info(connections)')}
+        missing = [name for name in SESSION_COLUMNS if name not in existing]
+        for name in missing:
+            self._db.execute(f'ALTER TABLE connections ADD COLUMN {name} {SESSION_COLUMNS[name]}')
+        if 'bootstrap_sessions' not in {row['name'] for row in self._db.execute('PRAGMA table_info(country_stats)')}:
+            self._db.execute('ALTER TABLE country_stats ADD COLUMN bootstrap_sessions INTEGER NOT NULL DEFAULT 0')
+        if missing or self._db.execute('PRAGMA user_version').fetchone()[0] < STATS_VERSION:
+            self._rebuild_stats()
+            self._db.execute(f'PRAGMA user_version = {STATS_VERSION}')
+
+    def _rebuild_stats(self):
+        for table in ('country_stats', 'exit_stats', 'histograms'):
+            self._db.execute(f'DELETE FROM {table}')
+        for row in self._db.execute('SELECT * FROM connections').fetchall():
+            self._record_stats(dict(row))
+
+    def _record_stats(self, record):
+        duration = record['duration']
+        bootstrap_time = record.get('bootstrap_time')
+        country = record.get('exit_country') or '??'
+        self._db.execute(
+            'INSERT INTO country_stats (country, sessions, total_duration, total_bootstrap_time, bootstrap_sessions) '
+            'VALUES (?, 1, ?, ?, ?) '
+            'ON CONFLICT (country) DO UPDATE SET sessions = sessions + 1, '
+            'total_duration = total_duration + excluded.total_duration, '
+            'total_bootstrap_time = total_bootstrap_time + excluded.total_bootstrap_time, '
+            'bootstrap_sessions = bootstrap_sessions + excluded.bootstrap_sessions',
+            (country, duration, bootstrap_time or 0, int(bootstrap_time is not None))
+        )
+        self._db.execute(
+            'INSERT INTO exit_stats (ip, fingerprint, country, sessions, total_duration, longest_duration) '
+            'VALUES (?, ?, ?, 1, ?, ?) '
+            'ON CONFLICT (ip) DO UPDATE SET sessions = sessions + 1, '
+            'fingerprint = COALESCE(excluded.fingerprint, fingerprint), country = excluded.country, '
+            'total_duration = total_duration + excluded.total_duration, '
+            'longest_duration = MAX(longest_duration, excluded.longest_duration)',
+            (record['ip'], record.get('exit_fingerprint'), country, duration, duration)
+        )
+        metrics = [('duration', duration)]
+        if bootstrap_time is not None:
+            metrics.append(('bootstrap_time', bootstrap_time))
+        for metric, value in metrics:
+            self._db.execute(
+                'INSERT INTO histograms (metric, bucket, count) VALUES (?, ?, 1) '
+                'ON CONFLICT (metric, bucket) DO UPDATE SET count = count + 1',
+                (metric, _histogram_bucket(value))
+            )
+
+    def _migrate_json(self):
+        if not os.path.exists(self.history_file):
+            return
         try:
-            os.makedirs(os.path.dirname(self.history_file), exist_ok=True)
-            with open(self.history_file, 'w') as f:
-                json.dump(self.connections, f, indent=4)
+            with open(self.history_file, 'r') as f:
+                connections = json.load(f)
+            with self._lock, self._db:
+                for c in connections:
+                    self._insert({'ip': c.get('ip', 'Unknown'), 'timestamp': c.get('timestamp', ''),
+                                  'duration': int(c.get('duration', 0))})
+            os.replace(self.history_file, self.history_file + '.migrated')
         except Exception as e:
+            print(f"Error migrating connection history: {e}")
+
+    def _insert(self, record):
+        columns = ', '.join(record)
+        placeholders = ', '.join('?' for _ in record)
+        self._db.execute(f'INSERT INTO connections ({columns}) VALUES ({placeholders})', list(record.values()))
+        self._record_stats(record)
+
+    def add_connection(self, ip, duration, **details):
+        """Record a finished session; details may hold any of SESSION_FIELDS"""
+        record = {'ip': ip, 'timestamp': datetime.now().strftime(TIMESTAMP_FORMAT), 'duration': int(duration)}
+        record.update((key, value) for key, value in details.items() if key in SESSION_FIELDS and value is not None)
+        try:
+            with self._lock, self._db:
+                self._insert(record)
+        except sqlite3.Error as e:
             print(f"Error saving connection history: {e}")
-            
-    def add_connection(self, ip, duration):
-        connection = {
-            'ip': ip,
-            'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-            'duration': duration
-        }
-        
-        self.connections.append(connection)
-        
-        if len(self.connections) > self.max_entries:
-            self.connections = self.connections[-self.max_entries:]
-            
-        self.save_history()
-        
+
+    def _where(self, start=None, end=None, ip=None, min_duration=None, max_duration=None):
+        clauses, params = [], []
+        if start is not None:
+            clauses.append('timestamp >= ?')
+            params.append(_format_timestamp(start))
+        if end is not None:
+            clauses.append('timestamp <= ?')
+            params.append(_format_timestamp(end))
+        if ip:
+            # GLOB prefix matching can use the ip index, unlike LIKE '%...%'
+            clauses.append('ip GLOB ?')
+            params.append(ip.replace('[', '[[]').replace('*', '[*]').replace('?', '[?]') + '*')
+        if min_duration is not None:
+            clauses.append('duration >= ?')
+            params.append(min_duration)
+        if max_duration is not None:
+            clauses.append('duration <= ?')
+            params.append(max_duration)
+        return (' WHERE ' + ' AND '.join(clauses)) if clauses else '', params
+
+    def query(self, limit=None, offset=0, order_by='timestamp', descending=True, after=None, **filters):
+        """Return connections matching the filters (start, end, ip prefix, min_duration, max_duration), one page at a time.
+
+        Pass the last row of the previous page as after to continue from it;
+        unlike a growing OFFSET this seeks straight to the page through the
+        index on order_by, however deep into the table it is.
+        """
+        if order_by not in SORT_COLUMNS:
+            raise ValueError(f'Cannot sort by {order_by}')
+        where, params = self._where(**filters)
+        direction = 'DESC' if descending else 'ASC'
+        if after is not None:
+            where += ' AND ' if where else ' WHERE '
+            where += f'({order_by}, id) {"<" if descending else ">"} (?, ?)'
+            params += [after[order_by], after['id']]
+        sql = f'SELECT id, ip, timestamp, duration FROM connections{where} ORDER BY {order_by} {direction}, id {direction}'
+        if limit is not None:
+            sql += ' LIMIT ? OFFSET ?'
+            params += [limit, offset]
+        with self._lock:
+            return [dict(row) for row in self._db.execute(sql, params)]
+
+    def count(self, **filters):
+        where, params = self._where(**filters)
+        with self._lock:
+            return self._db.execute(f'SELECT COUNT(*) FROM connections{where}', params).fetchone()[0]
+
     def get_last_connections(self, count=None):
         if count is None:
             count = self.max_entries
-        return self.connections[-count:]
-        
+        return list(reversed(self.query(limit=count)))
+
     def clear_history(self):
         """Clear all connection history"""
-        self.connections = []
         try:
-            if os.path.exists(self.history_file):
-                os.remove(self.history_file)
+            with self._lock, self._db:
+                for table in ('connections', 'country_stats', 'exit_stats', 'histograms'):
+                    self._db.execute(f'DELETE FROM {table}')
             return True
-        except Exception as e:
+        except sqlite3.Error as e:
             print(f"Error clearing history: {e}")
-            return False 
\ No newline at end of file
+            return False
+
+    def country_stats(self):
+        """Per exit country: session count, average duration and average connect time, longest sessions first.
+
+        The connect time is averaged over the sessions that recorded one only (None if none did).
+        """
+        with self._lock:
+            rows = self._db.execute(
+                'SELECT country, sessions, total_duration * 1.0 / sessions AS average_duration, '
+                'total_bootstrap_time / NULLIF(bootstrap_sessions, 0) AS average_bootstrap_time FROM country_stats '
+                'ORDER BY average_duration DESC'
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def exit_stats(self, limit=20):
+        with self._lock:
+            rows = self._db.execute(
+                'SELECT ip, fingerprint, country, sessions, total_duration * 1.0 / sessions AS average_duration, '
+                'longest_duration FROM exit_stats ORDER BY average_duration DESC LIMIT ?', (limit,)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def percentiles(self, metric='duration', quantiles=(50, 90, 99)):
+        """Approximate percentiles of 'duration' or 'bootstrap_time' from the histogram"""
+        with self._lock:
+            buckets = self._db.execute('SELECT bucket, count FROM histograms WHERE metric = ? ORDER BY bucket',
+                                       (metric,)).fetchall()
+        total = sum(count for _, count in buckets)
+        result = {}
+        for quantile in quantiles:
+            if not total:
+                result[quantile] = None
+                continue
+            target = quantile / 100 * total
+            seen = 0
+            for bucket, count in buckets:
+                seen += count
+                if seen >= target:
+                    result[quantile] = float(f'{_bucket_upper_bound(bucket):.3g}')
+                    break
+        return result
+
+    def close(self):
+        with self._lock:
+            self._db.close()
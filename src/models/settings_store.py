@@ -0,0 +1,168 @@
+import atexit
+import json
+import os
+import threading
+from src.utils.system_utils import get_app_data_dir
+
+SETTINGS_FILE = 'settings.json'
+SAVE_DELAY = 0.5
+
+DEFAULTS = {
+    'auto_connect': False,
+    'auto_reconnect': 0,
+    'minimize_to_tray': True,
+    'save_history': True,
+    'show_speed': True,
+    'proxy_host': '127.0.0.1',
+    'proxy_port': '9050',
+    'auto_start': False,
+    'auto_ip_change': False,
+    'ip_change_interval': 10,
+    'show_ip_notification': True,
+    'exit_country': '',
+    'persistent_data_dir': True,
+    'rotation_mode': 'newnym',
+    'circuit_reserve_size': 3,
+    'verify_exit_ip': False,
+    'bridge_transport': '',
+    'bridge_count': 3,
+    'torrc_profile': 'balanced',
+    'bandwidth_limit': 0
+}
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_settings_store():
+    """Return the process-wide settings store, loading settings.json on first use"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = SettingsStore()
+        return _store
+
+def _coerce(key, value):
+    default = DEFAULTS.get(key)
+    if default is None or value is None or isinstance(value, type(default)):
+        return value
+    try:
+        if isinstance(default, bool):
+            return value.lower() in ('1', 'true', 'yes', 'on') if isinstance(value, str) else bool(value)
+        return type(default)(value)
+    except (TypeError, ValueError):
+        return default
+
+class SettingsStore:
+    """In-memory view of settings.json with typed defaults.
+
+    update() returns and broadcasts only the keys whose values actually
+    changed; writes are debounced and go through a temporary file that
+    replaces settings.json atomically.
+    """
+
+    def __init__(self, path=None, save_delay=SAVE_DELAY):
+        self.path = path or os.path.join(get_app_data_dir(), SETTINGS_FILE)
+        self.save_delay = save_delay
+        self._values = {}
+        self._subscribers = []
+        self._lock = threading.RLock()
+        self._save_timer = None
+        self._dirty = False
+        self.load()
+        atexit.register(self.flush)
+
+    def load(self):
+        try:
+            with open(self.path, 'r') as f:
+                stored = json.load(f)
+        except (OSError, ValueError):
+            stored = None
+        with self._lock:
+            self._values = dict(DEFAULTS)
+            for key, value in (stored or {}).items():
+                self._values[key] = _coerce(key, value)
+        if stored is None:
+            self._dirty = True
+            self.flush()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._values:
+                return self._values[key]
+        return default
+
+    def __getitem__(self, key):
+        with self._lock:
+            return self._values[key]
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._values
+
+    def as_dict(self):
+        with self._lock:
+            return dict(self._values)
+
+    def set(self, key, value):
+        return self.update({key: value})
+
+    def update(self, changes):
+        """Apply changes and return {key: (old, new)} for the keys that changed"""
+        diff = {}
+        with self._lock:
+            for key, value in changes.items():
+                value = _coerce(key, value)
+                old = self._values.get(key)
+                if key not in self._values or old != value:
+                    self._values[key] = value
+                    diff[key] = (old, value)
+            subscribers = list(self._subscribers)
+        if not diff:
+            return diff
+        self._schedule_save()
+        for callback, keys in subscribers:
+            relevant = diff if keys is None else {key: diff[key] for key in diff if key in keys}
+            if relevant:
+                try:
+                    callback(relevant)
+                except Exception as e:
+                    print(f"Error in settings subscriber: {e}")
+        return diff
+
+    def subscribe(self, callback, keys=None):
+        """Call callback({key: (old, new)}) after changes, optionally only for the given keys"""
+        with self._lock:
+            self._subscribers.append((callback, set(keys) if keys is not None else None))
+
+    def unsubscribe(self, callback):
+        with self._lock:
+            self._subscribers = [(cb, keys) for cb, keys in self._subscribers if cb != callback]
+
+    def _schedule_save(self):
+        with self._lock:
+            self._dirty = True
+            if self._save_timer is not None:
+                self._save_timer.cancel()
+            self._save_timer = threading.Timer(self.save_delay, self.flush)
+            self._save_timer.daemon = True
+            self._save_timer.start()
+
+    def flush(self):
+        with self._lock:
+            if self._save_timer is not None:
+                self._save_timer.cancel()
+                self._save_timer = None
+            if not self._dirty:
+                return True
+            values = dict(self._values)
+            tmp_path = self.path + '.tmp'
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                with open(tmp_path, 'w') as f:
+                    json.dump(values, f, indent=4)
+                os.replace(tmp_path, self.path)
+                self._dirty = False
+                return True
+            except OSError as e:
+                print(f"Error saving settings: {e}")
+                return False
@@ -0,0 +1,201 @@
+from datetime import datetime, timedelta
+from PySide6.QtWidgets import (QWidget, QDialog, QVBoxLayout, QHBoxLayout, QTableView, QHeaderView,
+                             QLineEdit, QComboBox, QSpinBox, QLabel, QAbstractItemView)
+from PySide6.QtCore import Qt, QAbstractTableModel, QModelIndex, QTimer
+
+PAGE_SIZE = 200
+FILTER_DELAY_MS = 250
+DATE_RANGES = (
+    ('All time', None),
+    ('Last 24 hours', timedelta(days=1)),
+    ('Last 7 days', timedelta(days=7)),
+    ('Last 30 days', timedelta(days=30)),
+)
+
+def format_duration(seconds):
+    return f"{seconds // 3600}:{(seconds % 3600) // 60:02d}:{seconds % 60:02d}"
+
+class HistoryTableModel(QAbstractTableModel):
+    """Table model over ConnectionHistory that loads rows a page at a time as the view scrolls"""
+
+    COLUMNS = (('Date', 'timestamp'), ('IP', 'ip'), ('Duration', 'duration'))
+
+    def __init__(self, history=None, parent=None):
+        super().__init__(parent)
+        self.history = history
+        self.filters = {}
+        self.order_by = 'timestamp'
+        self.descending = True
+        self._rows = []
+        self._total = 0
+        self.refresh()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.COLUMNS)
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if orientation == Qt.Orientation.Horizontal and role == Qt.ItemDataRole.DisplayRole:
+            return self.COLUMNS[section][0]
+        return None
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        row = self._rows[index.row()]
+        key = self.COLUMNS[index.column()][1]
+        if role == Qt.ItemDataRole.DisplayRole:
+            return format_duration(row[key]) if key == 'duration' else row[key]
+        if role == Qt.ItemDataRole.TextAlignmentRole and key == 'duration':
+            return int(Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter)
+        return None
+
+    @property
+    def total(self):
+        return self._total
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and len(self._rows) < self._total
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid() or not self.history:
+            return
+        rows = self.history.query(limit=PAGE_SIZE, order_by=self.order_by, descending=self.descending,
+                                  after=self._rows[-1] if self._rows else None, **self.filters)
+        if not rows:
+            self._total = len(self._rows)
+            return
+        self.beginInsertRows(QModelIndex(), len(self._rows), len(self._rows) + len(rows) - 1)
+        self._rows.extend(rows)
+        self.endInsertRows()
+
+    def sort(self, column, order=Qt.SortOrder.AscendingOrder):
+        self.order_by = self.COLUMNS[column][1]
+        self.descending = order == Qt.SortOrder.DescendingOrder
+        self.refresh()
+
+    def set_filters(self, **filters):
+        self.filters = {key: value for key, value in filters.items() if value is not None}
+        self.refresh()
+
+    def refresh(self):
+        self.beginResetModel()
+        self._rows = []
+        self._total = self.history.count(**self.filters) if self.history else 0
+        self.endResetModel()
+        if self.canFetchMore():
+            self.fetchMore()
+
+class HistoryView(QWidget):
+    def __init__(self, history=None, parent=None):
+        super().__init__(parent)
+        self.model = HistoryTableModel(history, self)
+        self._filter_timer = QTimer(self)
+        self._filter_timer.setSingleShot(True)
+        self._filter_timer.setInterval(FILTER_DELAY_MS)
+        self._filter_timer.timeout.connect(self._apply_filters)
+        self.initUI()
+
+    def initUI(self):
+        layout = QVBoxLayout()
+        layout.setContentsMargins(0, 0, 0, 0)
+
+        filters = QHBoxLayout()
+        self.ip_filter = QLineEdit()
+        self.ip_filter.setPlaceholderText('Filter by IP...')
+        self.ip_filter.textChanged.connect(self._filter_timer.start)
+        self.date_filter = QComboBox()
+        for label, _ in DATE_RANGES:
+            self.date_filter.addItem(label)
+        self.date_filter.currentIndexChanged.connect(self._apply_filters)
+        self.duration_filter = QSpinBox()
+        self.duration_filter.setRange(0, 24 * 60)
+        self.duration_filter.setPrefix('≥ ')
+        self.duration_filter.setSuffix(' min')
+        self.duration_filter.valueChanged.connect(self._filter_timer.start)
+        filters.addWidget(self.ip_filter)
+        filters.addWidget(self.date_filter)
+        filters.addWidget(self.duration_filter)
+
+        self.table = QTableView()
+        self.table.setModel(self.model)
+        self.table.setSortingEnabled(True)
+        self.table.horizontalHeader().setSortIndicator(0, Qt.SortOrder.DescendingOrder)
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Stretch)
+        self.table.verticalHeader().setVisible(False)
+        self.table.verticalHeader().setDefaultSectionSize(24)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        self.table.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.table.setAlternatingRowColors(True)
+
+        self.count_label = QLabel()
+        self.model.modelReset.connect(self._update_count)
+
+        layout.addLayout(filters)
+        layout.addWidget(self.table)
+        layout.addWidget(self.count_label)
+        self.setLayout(layout)
+        self._update_count()
+        self._apply_styles()
+
+    def _apply_styles(self):
+        self.setStyleSheet("""
+            QTableView {
+                background-color: #1E1E1E;
+                alternate-background-color: #252525;
+                color: #FFFFFF;
+                gridline-color: #3C3C3C;
+                border: 1px solid #3C3C3C;
+                border-radius: 4px;
+                selection-background-color: #2D2D2D;
+                selection-color: #00E676;
+            }
+            QHeaderView::section {
+                background-color: #2D2D2D;
+                color: #00E676;
+                border: none;
+                padding: 4px;
+            }
+            QLineEdit, QComboBox, QSpinBox {
+                background-color: #2D2D2D;
+                color: #FFFFFF;
+                border: 1px solid #3C3C3C;
+                border-radius: 4px;
+                padding: 4px;
+            }
+        """)
+
+    def _apply_filters(self):
+        since = DATE_RANGES[self.date_filter.currentIndex()][1]
+        minutes = self.duration_filter.value()
+        self.model.set_filters(
+            ip=self.ip_filter.text().strip() or None,
+            start=datetime.now() - since if since else None,
+            min_duration=minutes * 60 if minutes else None
+        )
+
+    def _update_count(self):
+        if not self.model.history:
+            self.count_label.setText('Connection history is disabled.')
+        else:
+            self.count_label.setText(f'{self.model.total} connections')
+
+    def set_history(self, history):
+        self.model.history = history
+        self.refresh()
+
+    def refresh(self):
+        self.model.refresh()
+
+class HistoryDialog(QDialog):
+    def __init__(self, history, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle('Connection History')
+        self.resize(560, 480)
+        self.setStyleSheet('QDialog { background-color: #1E1E1E; } QLabel { color: #FFFFFF; }')
+        layout = QVBoxLayout()
+        self.view = HistoryView(history, self)
+        layout.addWidget(self.view)
+        self.setLayout(layout)
@@ -1,38 +1,40 @@
 from PySide6.QtWidgets import (QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
                              QPushButton, QLabel, QMessageBox, QSystemTrayIcon,
                              QMenu, QApplication, QStyle)
-from PySide6.QtCore import Qt, QTimer, QThread, Signal
+from PySide6.QtCore import Qt, QTimer, QThread, QObject, Signal
 from PySide6.QtGui import QIcon, QFont, QAction
-import requests
-import socks
-import socket
 import os
-import psutil
-import time
-import json
 import sys
-import subprocess
-from src.ui.settings_dialog import SettingsDialog
-from src.utils.system_utils import set_system_proxy, get_tor_path
-from src.utils.tor_utils import is_port_in_use, create_tor_config, launch_tor, create_controller
+from src.controllers.tor_session import TorSession, SessionState
 from src.models.connection_history import ConnectionHistory
+from src.models.settings_store import get_settings_store
+from src.utils.country_codes import get_country_name
+from src.utils.geoip import get_geoip
+
+BANDWIDTH_STALE_AFTER = 5
+TOOLTIP_WARNINGS = 5
+
+class SessionEvents(QObject):
+    event = Signal(str, object)
 
 class TorWorker(QThread):
-    status = Signal(str)
     finished = Signal(bool, str, str)
     
-    def __init__(self, main_window):
+    def __init__(self, session, action='connect'):
         super().__init__()
-        self.main_window = main_window
-        self.is_connecting = True
+        self.session = session
+        self.action = action
         self.is_running = True
         
     def run(self):
         try:
-            if self.is_connecting:
-                self._connect_to_tor()
+            if self.action == 'connect':
+                success = self.session.connect()
+            elif self.action == 'change_ip':
+                success = self.session.change_ip() is not None
             else:
-                self._disconnect_from_tor()
+                success = self.session.disconnect()
+            self.finished.emit(success, self.session.error or "", self.session.exit_ip or "")
         except Exception as e:
             self.finished.emit(False, str(e), "")
         finally:
@@ -42,165 +44,29 @@ class TorWorker(QThread):
         self.is_running = False
         self.wait()
         self.quit()
-            
-    def _connect_to_tor(self):
-        original_socket = socket.socket
-        try:
-            self.status.emit('Stopping existing Tor processes...')
-            for proc in psutil.process_iter(['pid', 'name']):
-                if 'tor.exe' in proc.info['name'].lower():
-                    try:
-                        proc.terminate()
-                        proc.wait(timeout=5)
-                    except:
-                        try:
-                            proc.kill()
-                        except:
-                            pass
-            time.sleep(3)
-            
-
-            self.status.emit('Disabling Windows proxy settings...')
-            set_system_proxy(False)
-            time.sleep(1)
-            
-            if is_port_in_use(9050) or is_port_in_use(9051):
-                raise Exception("Port 9050/9051 is still in use!")
-            
-            self.status.emit('Starting Tor...')
-            if not self.main_window.start_tor():
-                self.finished.emit(False, "Failed to start Tor", "")
-                return
-
-            self.status.emit('Waiting for Tor service to start...')
-            for _ in range(3):
-                if is_port_in_use(9051):
-                    break
-            time.sleep(1)
-            controller_retries = 3
-            while controller_retries > 0:
-                if self.main_window.controller and self.main_window.controller.is_authenticated():
-                    break
-                controller_retries -= 1
-                if controller_retries > 0:
-                    self.status.emit('Waiting for Tor controller...')
-                    time.sleep(3)
-            
-            if not self.main_window.controller or not self.main_window.controller.is_authenticated():
-                raise Exception("Tor controller is not ready!")
-
-            self.status.emit('Setting up SOCKS proxy...')
-            socket._original_socket = original_socket
-            socks.set_default_proxy(socks.SOCKS5, "127.0.0.1", 9050)
-            socket.socket = socks.socksocket
-
-            self.status.emit('Setting up system proxy...')
-            if not set_system_proxy(True):
-                socket.socket = original_socket
-                self.finished.emit(False, "System Proxy Error!", "")
-                return
-
-            max_retries = 3
-            retry_count = 0
-            retry_delay = 5
-            while retry_count < max_retries:
-                try:
-                    self.status.emit('Testing Tor connection...')
-                    session = requests.Session()
-                    session.trust_env = False
-                    
-                    proxies = {
-                        'http': 'socks5h://127.0.0.1:9050',
-                        'https': 'socks5h://127.0.0.1:9050'
-                    }
-                    
-                    if not self.main_window.controller.is_alive():
-                        raise Exception("Tor service is not responding!")
-                    
-                    try:
-                        response = session.get('https://check.torproject.org/api/ip', 
-                                           timeout=15,
-                                           verify=True,
-                                           proxies=proxies)
-                    except requests.exceptions.RequestException as e:
-                        error_msg = "Connection timed out" if isinstance(e, requests.exceptions.Timeout) else \
-                                    "Connection refused" if isinstance(e, requests.exceptions.ConnectionError) else \
-                                    "SSL/TLS error" if isinstance(e, requests.exceptions.SSLError) else \
-                                    f"Connection error: {str(e)}"
-                        raise Exception(error_msg)
-                    
-                    if response.status_code == 200:
-                        data = response.json()
-                        if data.get('IsTor', False):
-                            current_ip = data.get('IP', 'Unknown')
-                            self.finished.emit(True, "", current_ip)
-                            return
-                        else:
-                            raise Exception("Tor connection could not be verified!")
-                    else:
-                        raise Exception(f'Could not get IP address! Status code: {response.status_code}')
-                        
-                except Exception as e:
-                    retry_count += 1
-                    error_msg = str(e)
-                    
-                    if retry_count < max_retries:
-                        self.status.emit(f'Connection attempt {retry_count + 1}/{max_retries}... ({error_msg})')
-                        time.sleep(retry_delay)
-                        retry_delay = min(retry_delay * 2, 15)
-                    else:
-                        raise Exception(f"Connection error: {error_msg}")
-                        
-        except Exception as e:
-            socket.socket = original_socket
-            self.finished.emit(False, str(e), "")
-            
-    def _disconnect_from_tor(self):
-        try:
-            if self.main_window.controller:
-                try:
-                    self.main_window.controller.close()
-                except:
-                    pass
-                self.main_window.controller = None
-            
-            set_system_proxy(False)
-            
-            if hasattr(socket, 'socket') and socket.socket == socks.socksocket:
-                socket.socket = socket._original_socket if hasattr(socket, '_original_socket') else socket._socketobject
-            
-            self.main_window._cleanup_tor_processes()
-            
-            if is_port_in_use(9050) or is_port_in_use(9051):
-                raise Exception("Ports are still in use!")
-            
-            self.finished.emit(True, "", "")
-            
-        except Exception as e:
-            self.finished.emit(False, str(e), "")
 
 class MainWindow(QMainWindow):
     def __init__(self):
         super().__init__()
-        self.loadSettings()
+        self.settings = get_settings_store()
         
         icon_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'logo.ico')
         if os.path.exists(icon_path):
             self.setWindowIcon(QIcon(icon_path))
         
         self.initUI()
-        self.is_connected = False
         self.timer = QTimer()
         self.timer.timeout.connect(self.update_time)
-        self.connection_start_time = 0
-        self.tor_path = get_tor_path()
-        self.controller = None
-        self.tor_process = None
         self.worker = None
+        self.ip_worker = None
+        self._auto_ip_change = False
+        self._previous_state = SessionState.DISCONNECTED
         
-        self.last_download = 0
-        self.last_upload = 0
-        self.last_time = time.time()
+        self.session = TorSession(self.settings, patch_socket=True)
+        self.tor_path = self.session.tor_path
+        self.session_events = SessionEvents()
+        self.session_events.event.connect(self._on_session_event)
+        self.session.add_listener(self.session_events.event.emit)
         
         self.speed_timer = QTimer()
         self.speed_timer.timeout.connect(self.update_connection_status)
@@ -212,6 +78,7 @@ class MainWindow(QMainWindow):
         self.connection_history = ConnectionHistory() if self.settings.get('save_history', True) else None
         
         self.create_tray_icon()
+        self.settings.subscribe(self._on_settings_changed)
         
         if not self.tor_path:
             QMessageBox.critical(self, "Tor Not Found",
@@ -222,63 +89,13 @@ class MainWindow(QMainWindow):
         if self.settings.get('auto_connect', False):
             QTimer.singleShot(1000, self.connect_to_tor)
             
-    def loadSettings(self):
-        try:
-            app_data_path = os.path.join(os.environ.get('APPDATA', ''), 'TorShield')
-            
-            if not os.path.exists(app_data_path):
-                os.makedirs(app_data_path)
-                
-            settings_path = os.path.join(app_data_path, 'settings.json')
-            
-            if not os.path.exists(settings_path):
-                self.settings = {
-                    'auto_connect': False,
-                    'minimize_to_tray': True,
-                    'save_history': True,
-                    'show_speed': True,
-                    'proxy_host': '127.0.0.1',
-                    'proxy_port': '9050',
-                    'auto_start': False,
-                    'auto_ip_change': False,
-                    'ip_change_interval': 10,
-                    'show_ip_notification': True,
-                    'exit_country': ''
-                }
-                self.saveSettings()
-                return
-            
-            with open(settings_path, 'r') as f:
-                self.settings = json.load(f)
-        except:
-            self.settings = {
-                'auto_connect': False,
-                'minimize_to_tray': True,
-                'save_history': True,
-                'show_speed': True,
-                'proxy_host': '127.0.0.1',
-                'proxy_port': '9050',
-                'auto_start': False,
-                'auto_ip_change': False,
-                'ip_change_interval': 10,
-                'show_ip_notification': True,
-                'exit_country': ''
-            }
-            self.saveSettings()
-            
-    def saveSettings(self):
-        try:
-            app_data_path = os.path.join(os.environ.get('APPDATA', ''), 'TorShield')
-            
-            if not os.path.exists(app_data_path):
-                os.makedirs(app_data_path)
-                
-            settings_path = os.path.join(app_data_path, 'settings.json')
-            
-            with open(settings_path, 'w') as f:
-                json.dump(self.settings, f, indent=4)
-        except Exception as e:
-            print(f"Error saving settings: {str(e)}")
+    def _on_settings_changed(self, changes):
+        if 'show_speed' in changes:
+            self.speed_label.setVisible(self.settings.get('show_speed', True))
+        if 'auto_ip_change' in changes or 'ip_change_interval' in changes:
+            self.update_auto_ip_change()
+        if 'save_history' in changes:
+            self.connection_history = ConnectionHistory() if self.settings.get('save_history', True) else None
             
     def initUI(self):
         self.setWindowTitle('TorShield')
@@ -460,32 +277,22 @@ class MainWindow(QMainWindow):
             
 
 
+    @property
+    def is_connected(self):
+        return self.session.is_connected
+
     def update_connection_status(self):
-        if not self.is_connected or not self.controller:
+        bandwidth = self.session.bandwidth
+        if not self.is_connected or not bandwidth:
             return
         
         try:
             if self.settings.get('show_speed', True):
-                current_time = time.time()
-                time_diff = current_time - self.last_time
-                
-                if time_diff > 0:
-                    bytes_read = self.controller.get_info('traffic/read')
-                    bytes_written = self.controller.get_info('traffic/written')
-                    
-                    bytes_read = int(bytes_read) if bytes_read else 0
-                    bytes_written = int(bytes_written) if bytes_written else 0
+                bytes_read, bytes_written = bandwidth.latest()
+                self.speed_label.setText(f'Download: {bytes_read / 1024:.1f} KB/s | Upload: {bytes_written / 1024:.1f} KB/s')
                     
-                    download_speed = (bytes_read - self.last_download) / time_diff / 1024
-                    upload_speed = (bytes_written - self.last_upload) / time_diff / 1024
-                    
-                    self.speed_label.setText(f'Download: {download_speed:.1f} KB/s | Upload: {upload_speed:.1f} KB/s')
-                    
-                    self.last_download = bytes_read
-                    self.last_upload = bytes_written
-                    self.last_time = current_time
-                    
-            if self.controller.is_alive():
+            sample_age = bandwidth.seconds_since_last_sample()
+            if self.session.is_alive() and (sample_age is None or sample_age < BANDWIDTH_STALE_AFTER):
                 self.connection_status.setText('Connection: Good')
                 self.connection_status.setStyleSheet('color: #00E676;')
             else:
@@ -503,183 +310,9 @@ class MainWindow(QMainWindow):
             QMessageBox.information(self, "Information", "Connection history is disabled.")
             return
             
-        connections = self.connection_history.get_last_connections()
-        if not connections:
-            QMessageBox.information(self, "Connection History", "No connection history yet.")
-            return
-            
-        history_text = "Recent Connections:\n\n"
-        for conn in reversed(connections):
-            hours = conn['duration'] // 3600
-            minutes = (conn['duration'] % 3600) // 60
-            seconds = conn['duration'] % 60
-            history_text += (f"IP: {conn['ip']}\n"
-                           f"Date: {conn['timestamp']}\n"
-                           f"Duration: {hours}:{minutes:02d}:{seconds:02d}\n"
-                           f"{'-' * 30}\n")
-            
-        QMessageBox.information(self, "Connection History", history_text)
+        from src.ui.history_view import HistoryDialog
+        HistoryDialog(self.connection_history, self).exec()
         
-    def start_tor(self):
-        try:
-            self.status_label.setText('Starting Tor...')
-            QApplication.processEvents()
-
-            base_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-            data_dir = os.path.join(base_dir, "tor_data")
-            
-            if os.path.exists(data_dir):
-                try:
-                    for file in os.listdir(data_dir):
-                        file_path = os.path.join(data_dir, file)
-                        try:
-                            if os.path.isfile(file_path):
-                                os.unlink(file_path)
-                        except Exception as e:
-                            print(f"Error deleting file: {str(e)}")
-                except Exception as e:
-                    print(f"Error cleaning directory: {str(e)}")
-            else:
-                try:
-                    os.makedirs(data_dir)
-                except Exception as e:
-                    print(f"Error creating directory: {str(e)}")
-
-            self._cleanup_tor_processes()
-
-            if is_port_in_use(9050) or is_port_in_use(9051):
-                try:
-                    self.status_label.setText('Cleaning used ports...')
-                    QApplication.processEvents()
-                    subprocess.run(['taskkill', '/F', '/IM', 'tor.exe'], 
-                                  capture_output=True, 
-                                  creationflags=subprocess.CREATE_NO_WINDOW)
-                    time.sleep(3)
-                except Exception as e:
-                    print(f"Error terminating Tor process: {str(e)}")
-
-            self.status_label.setText('Creating Tor configuration...')
-            QApplication.processEvents()
-            exit_country = self.settings.get('exit_country', '')
-            if exit_country:
-                self.status_label.setText(f'Creating Tor configuration (via {exit_country})...')
-                QApplication.processEvents()
-            tor_config = create_tor_config(self.tor_path, data_dir, exit_country)
-            if not tor_config:
-                self.status_label.setText('Failed to create Tor configuration!')
-                return False
-
-            self.status_label.setText('Starting Tor service...')
-            QApplication.processEvents()
-            self.tor_process = launch_tor(
-                self.tor_path,
-                tor_config,
-                lambda msg: self._update_status_with_events(msg)
-            )
-            
-            if not self.tor_process:
-                self.status_label.setText('Failed to start Tor!')
-                return False
-            
-            time.sleep(3)
-            
-            self.status_label.setText('Creating Tor controller...')
-            QApplication.processEvents()
-            max_retries = 3
-            retry_count = 0
-            
-            while retry_count < max_retries:
-                try:
-                    if self.controller:
-                        try:
-                            self.controller.close()
-                        except:
-                            pass
-                        self.controller = None
-                    
-                    self.controller = create_controller()
-                    
-                    if not self.controller:
-                        raise Exception("Failed to create controller!")
-                        
-                    if not self.controller.is_authenticated():
-                        raise Exception("Controller authentication failed!")
-                    
-                    if not self.controller.is_alive():
-                        raise Exception("Controller is not responding!")
-                    
-                    self.status_label.setText('Tor controller ready.')
-                    QApplication.processEvents()
-                    return True
-                        
-                except Exception as e:
-                    retry_count += 1
-                    error_msg = str(e)
-                    
-                    if retry_count >= max_retries:
-                        self.status_label.setText(f'Tor controller error: {error_msg}')
-                        self._cleanup_tor_processes()
-                        return False
-                    
-                    self.status_label.setText(f'Retrying Tor controller ({retry_count}/{max_retries})...')
-                    QApplication.processEvents()
-                    time.sleep(3)
-            
-            return False
-            
-        except Exception as e:
-            error_msg = str(e)
-            error_texts = {
-                "Permission denied": 'Permission Error: Please run as administrator',
-                "Address already in use": 'Port Error: 9050/9051 in use',
-                "Connection refused": 'Connection Error: Failed to start Tor service'
-            }
-            self.status_label.setText(error_texts.get(error_msg, f'Tor Startup Error: {error_msg}'))
-            return False
-
-    def _cleanup_tor_processes(self):
-        try:
-            if self.controller:
-                try:
-                    self.controller.close()
-                except:
-                    pass
-                self.controller = None
-            
-            if self.tor_process:
-                try:
-                    parent = psutil.Process(self.tor_process.pid)
-                    for child in parent.children(recursive=True):
-                        try:
-                            child.terminate()
-                            child.wait(timeout=5)
-                        except:
-                            try:
-                                child.kill()
-                            except:
-                                pass
-                    parent.terminate()
-                    parent.wait(timeout=5)
-                except:
-                    pass
-                self.tor_process = None
-            
-            for proc in psutil.process_iter(['pid', 'name']):
-                try:
-                    if 'tor.exe' in proc.info['name'].lower():
-                        proc.terminate()
-                        proc.wait(timeout=5)
-                except:
-                    try:
-                        proc.kill()
-                    except:
-                        pass
-            
-            time.sleep(3)
-            
-        except Exception as e:
-            print(f"Tor cleanup error: {str(e)}")
-
     def toggle_connection(self):
         if not self.is_connected:
             self.connect_to_tor()
@@ -697,23 +330,15 @@ class MainWindow(QMainWindow):
 
         self.connect_button.setEnabled(False)
         self.connect_button.setText('Connecting...')
-        self.worker = TorWorker(self)
-        self.worker.is_connecting = True
-        self.worker.status.connect(self.status_label.setText)
-        self.worker.finished.connect(self._on_connection_finished)
+        self.worker = TorWorker(self.session, 'connect')
         self.worker.start()
         
-    def disconnect_from_tor(self):
+    def disconnect_from_tor(self, reason='user'):
         if not self.is_connected or (self.worker is not None and self.worker.isRunning()):
             return
             
-        if self.is_connected and self.connection_history:
-            ip_text = self.ip_label.text()
-            ip = ip_text.replace('IP Address: ', '') if 'IP Address: ' in ip_text else 'Unknown'
-            
-            if hasattr(self, 'connection_start_time') and self.connection_start_time > 0:
-                duration = int(time.time() - self.connection_start_time)
-                self.connection_history.add_connection(ip, duration)
+        if self.is_connected and self.connection_history and self.session.connected_at:
+            self.connection_history.add_connection(**self.session.session_record(), disconnect_reason=reason)
         
         for timer in [self.timer, self.speed_timer]:
             timer.stop()
@@ -731,31 +356,44 @@ class MainWindow(QMainWindow):
         self.status_label.setText('Disconnecting...')
         self.status_label.setStyleSheet('color: #FF0000; font-weight: bold;')
         
-        self.worker = TorWorker(self)
-        self.worker.is_connecting = False
-        self.worker.status.connect(self.status_label.setText)
-        self.worker.finished.connect(self._on_disconnection_finished)
+        self.worker = TorWorker(self.session, 'disconnect')
         self.worker.start()
         
+    def _on_session_event(self, event, value):
+        if event == 'status':
+            self.status_label.setText(value)
+        elif event == 'ip':
+            self._on_ip_changed(value)
+        elif event == 'log':
+            if value.is_warning and self.session.log:
+                warnings = self.session.log.warnings(TOOLTIP_WARNINGS)
+                self.status_label.setToolTip('\n'.join(str(record) for record in warnings))
+        elif event == 'state':
+            previous, self._previous_state = self._previous_state, value
+            if value == SessionState.CONNECTED:
+                self._on_connection_finished(True, "", self.session.exit_ip or "")
+            elif value == SessionState.DISCONNECTED:
+                self._on_disconnection_finished(True, "", "")
+            elif value == SessionState.ERROR:
+                if previous == SessionState.DISCONNECTING:
+                    self._on_disconnection_finished(False, self.session.error or "", "")
+                else:
+                    self._on_connection_finished(False, self.session.error or "", "")
+        
     def _on_connection_finished(self, success, error_message, ip):
         self.connect_button.setEnabled(True)
         
         if success:
-            self.is_connected = True
             self.change_ip_button.setEnabled(not self.settings.get('auto_ip_change', False))
-            self.connection_start_time = time.time()
             self.status_label.setText('Connection Status: Connected')
             self.status_label.setStyleSheet('color: #00E676; font-weight: bold;')
             self.connect_button.setText('Disconnect')
             self.connect_button.update()
-            self.ip_label.setText(f'IP Address: {ip}')
+            self.ip_label.setText(f'IP Address: {self._describe_ip(ip)}')
             self.time_label.setText('Connection Time: 00:00:00')
             self.connection_status.setText('Connection: Good')
             self.connection_status.setStyleSheet('color: #00E676;')
             
-            self.last_download = 0
-            self.last_upload = 0
-            self.last_time = time.time()
             self.timer.start(1000)
             self.speed_timer.start()
             
@@ -764,9 +402,8 @@ class MainWindow(QMainWindow):
                 self.ip_change_timer.setInterval(interval)
                 self.ip_change_timer.start()
             
-            self.tray_icon.setToolTip(f'Tor Connected\nIP: {ip}')
+            self.tray_icon.setToolTip(f'Tor Connected\nIP: {self._describe_ip(ip)}')
         else:
-            self.is_connected = False
             self.change_ip_button.setEnabled(False)
             self.status_label.setText(f'Connection Error: {error_message}')
             self.status_label.setStyleSheet('color: #FF0000; font-weight: bold;')
@@ -784,7 +421,6 @@ class MainWindow(QMainWindow):
         self.connect_button.setEnabled(True)
         
         if success:
-            self.is_connected = False
             self.change_ip_button.setEnabled(False)
             self.status_label.setText('Connection Status: Disconnected')
             self.status_label.setStyleSheet('color: #FF0000; font-weight: bold;')
@@ -812,12 +448,14 @@ class MainWindow(QMainWindow):
             )
         else:
             if self.is_connected:
-                self.disconnect_from_tor()
+                self.disconnect_from_tor('quit')
             
-            if self.worker:
-                self.worker.stop()
-                self.worker.deleteLater()
-                self.worker = None
+            for worker in [self.worker, self.ip_worker]:
+                if worker:
+                    worker.stop()
+                    worker.deleteLater()
+            self.worker = None
+            self.ip_worker = None
             
             for timer in [self.timer, self.speed_timer]:
                 timer.stop()
@@ -827,35 +465,32 @@ class MainWindow(QMainWindow):
             
             event.accept()
         
-    def _update_status_with_events(self, message):
-        """Helper method to update status label with UI processing"""
-        self.status_label.setText(message)
-        QApplication.processEvents()
-        
     def update_time(self):
-        if hasattr(self, 'connection_start_time'):
-            elapsed_time = int(time.time() - self.connection_start_time)
+        if self.session.connected_at:
+            elapsed_time = self.session.duration
             hours = elapsed_time // 3600
             minutes = (elapsed_time % 3600) // 60
             seconds = elapsed_time % 60
             self.time_label.setText(f'Connection Time: {hours:02d}:{minutes:02d}:{seconds:02d}')
         
     def showSettings(self):
+        from src.ui.settings_dialog import SettingsDialog
         dialog = SettingsDialog(self)
         dialog.exec()
-        self.speed_label.setVisible(self.settings.get('show_speed', True))
 
     def toggleVisibility(self):
         self.setVisible(not self.isVisible())
 
     def quit_application(self):
         if self.is_connected:
-            self.disconnect_from_tor()
+            self.disconnect_from_tor('quit')
             
-        if self.worker:
-            self.worker.stop()
-            self.worker.deleteLater()
-            self.worker = None
+        for worker in [self.worker, self.ip_worker]:
+            if worker:
+                worker.stop()
+                worker.deleteLater()
+        self.worker = None
+        self.ip_worker = None
             
         for timer in [self.timer, self.speed_timer]:
             timer.stop()
@@ -863,6 +498,7 @@ class MainWindow(QMainWindow):
         if hasattr(self, 'tray_icon'):
             self.tray_icon.hide()
             
+        self.settings.flush()
         QApplication.quit()
 
     def update_auto_ip_change(self):
@@ -876,61 +512,50 @@ class MainWindow(QMainWindow):
             self.change_ip_button.setEnabled(self.is_connected)
 
     def auto_change_ip(self):
-        if self.is_connected and self.controller:
+        if self.is_connected:
             self.change_ip(auto=True)
 
     def change_ip(self, auto=False):
-        if not self.is_connected or not self.controller:
+        if not self.is_connected or (self.ip_worker is not None and self.ip_worker.isRunning()):
             return
             
-        try:
-            self.change_ip_button.setEnabled(False)
-            self.status_label.setText('Changing IP...')
-            self.controller.signal('NEWNYM')
-            
-            old_ip = self.ip_label.text().replace('IP Address: ', '')
-            
-            def check_ip_changed():
-                try:
-                    session = requests.Session()
-                    session.trust_env = False
-                    response = session.get('https://check.torproject.org/api/ip',
-                                        timeout=10,
-                                        verify=True,
-                                        proxies={
-                                            'http': 'socks5h://127.0.0.1:9050',
-                                            'https': 'socks5h://127.0.0.1:9050'
-                                        })
-                    
-                    if response.status_code == 200:
-                        data = response.json()
-                        new_ip = data.get('IP', 'Unknown')
-                        if new_ip != old_ip:
-                            self.ip_label.setText(f'IP Address: {new_ip}')
-                            self.status_label.setText('Connection Status: Connected')
-                            self.status_label.setStyleSheet('color: #00E676; font-weight: bold;')
-                            self.tray_icon.setToolTip(f'Tor Connected\nIP: {new_ip}')
-                            
-                            if auto and self.settings.get('show_ip_notification', True):
-                                self.tray_icon.showMessage(
-                                    "IP Changed",
-                                    f"New IP: {new_ip}",
-                                    QSystemTrayIcon.MessageIcon.Information,
-                                    3000
-                                )
-                        else:
-                            self.controller.signal('NEWNYM')
-                            QTimer.singleShot(5000, check_ip_changed)
-                            return
-                except:
-                    pass
-                
-                if not self.settings.get('auto_ip_change', False):
-                    self.change_ip_button.setEnabled(True)
-            
-            QTimer.singleShot(5000, check_ip_changed)
+        self._auto_ip_change = auto
+        self.change_ip_button.setEnabled(False)
+        self.status_label.setText('Changing IP...')
+        
+        self.ip_worker = TorWorker(self.session, 'change_ip')
+        self.ip_worker.finished.connect(self._on_ip_change_finished)
+        self.ip_worker.start()
+        
+    def _describe_ip(self, ip):
+        """The address followed by its country from the local GeoIP database, once the session has loaded it"""
+        geoip = get_geoip(block=False)
+        country = geoip.country(ip) if ip and geoip else None
+        return f'{ip} ({get_country_name(country)})' if country else ip
+
+    def _on_ip_changed(self, ip):
+        if not ip:
+            return
+        previous_ip = self.ip_label.text().replace('IP Address: ', '').split(' ')[0]
+        self.ip_label.setText(f'IP Address: {self._describe_ip(ip)}')
+        self.tray_icon.setToolTip(f'Tor Connected\nIP: {self._describe_ip(ip)}')
+        
+        if previous_ip not in ('-', ip) and self._auto_ip_change and self.settings.get('show_ip_notification', True):
+            self.tray_icon.showMessage(
+                "IP Changed",
+                f"New IP: {ip}",
+                QSystemTrayIcon.MessageIcon.Information,
+                3000
+            )
             
-        except:
+    def _on_ip_change_finished(self, success, error_message, ip):
+        if not self.is_connected:
+            return
+        if success:
+            self.status_label.setText('Connection Status: Connected')
+            self.status_label.setStyleSheet('color: #00E676; font-weight: bold;')
+        else:
             self.status_label.setText('IP change failed!')
-            if not self.settings.get('auto_ip_change', False):
-                self.change_ip_button.setEnabled(True)
+        self._auto_ip_change = False
+        if not self.settings.get('auto_ip_change', False):
+            self.change_ip_button.setEnabled(True)
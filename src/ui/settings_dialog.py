@@ -1,17 +1,25 @@
 from PySide6.QtWidgets import (QDialog, QVBoxLayout, QHBoxLayout, QTabWidget,
                              QGroupBox, QCheckBox, QSpinBox, QLabel, QPushButton,
-                             QLineEdit, QScrollArea, QMessageBox, QWidget, QComboBox,
+                             QLineEdit, QMessageBox, QWidget, QComboBox,
                              QListWidget, QListWidgetItem)
 from PySide6.QtCore import Qt, QSize
 from PySide6.QtGui import QFont, QPixmap, QIcon
-import json
 import os
-from src.utils.country_codes import get_all_countries, get_popular_countries
+from src.utils.country_codes import get_all_countries, get_popular_countries, get_country_name
+from src.utils.exit_selector import ExitSelector, AUTO_COUNTRY
+from src.utils.bridges import BridgeProber
+from src.controllers.connect_race import AUTO_TRANSPORT, race_data_dirs
+from src.controllers.tor_session import TorSession
+from src.utils.torrc import PROFILES, PROFILE_DESCRIPTIONS, DEFAULT_PROFILE
+from src.utils.system_utils import get_tor_data_dir
+from src.ui.history_view import HistoryView
+from src.models.settings_store import get_settings_store
 
 class SettingsDialog(QDialog):
     def __init__(self, parent=None):
         super().__init__(parent)
         self.parent = parent
+        self.settings = get_settings_store()
         self.initUI()
         self.loadSettings()
         self._apply_styles()
@@ -89,10 +97,14 @@ class SettingsDialog(QDialog):
         interval_layout.addStretch()
         
         self.show_ip_notification = QCheckBox("Show notification when IP changes")
+        self.circuit_reserve = QCheckBox("Keep pre-built circuits for instant IP changes")
+        self.verify_exit_ip = QCheckBox("Verify exit IP with check.torproject.org")
         
         ip_layout.addWidget(self.auto_ip_change)
         ip_layout.addLayout(interval_layout)
         ip_layout.addWidget(self.show_ip_notification)
+        ip_layout.addWidget(self.circuit_reserve)
+        ip_layout.addWidget(self.verify_exit_ip)
         ip_group.setLayout(ip_layout)
         
         appearance_group = QGroupBox("Appearance Settings")
@@ -103,9 +115,89 @@ class SettingsDialog(QDialog):
         appearance_layout.addWidget(self.show_speed)
         appearance_group.setLayout(appearance_layout)
         
+        cache_group = QGroupBox("Tor Cache Settings")
+        cache_layout = QVBoxLayout()
+        
+        self.persistent_data_dir = QCheckBox("Keep Tor directory cache between connections (faster reconnects)")
+        
+        cache_buttons = QHBoxLayout()
+        self.clear_cache_button = QPushButton("Clear Tor Cache")
+        self.clear_cache_button.clicked.connect(self._clear_tor_cache)
+        cache_buttons.addWidget(self.clear_cache_button)
+        cache_buttons.addStretch()
+        
+        cache_layout.addWidget(self.persistent_data_dir)
+        cache_layout.addLayout(cache_buttons)
+        cache_group.setLayout(cache_layout)
+        
+        bridge_group = QGroupBox("Bridge Settings")
+        bridge_layout = QVBoxLayout()
+        
+        bridge_select_layout = QHBoxLayout()
+        bridge_select_layout.addWidget(QLabel("Connect through:"))
+        self.bridge_combo = QComboBox()
+        self.bridge_combo.addItem("Direct (No Bridges)", "")
+        self.bridge_combo.addItem("Automatic (Race Direct, obfs4 and snowflake)", AUTO_TRANSPORT)
+        for transport in BridgeProber().transports():
+            self.bridge_combo.addItem(f"{transport} bridges", transport)
+        bridge_select_layout.addWidget(self.bridge_combo)
+        bridge_select_layout.addWidget(QLabel("fastest"))
+        self.bridge_count = QSpinBox()
+        self.bridge_count.setMinimum(1)
+        self.bridge_count.setMaximum(10)
+        self.bridge_count.setValue(3)
+        bridge_select_layout.addWidget(self.bridge_count)
+        bridge_select_layout.addStretch()
+        
+        bridge_description = QLabel("Use bridges if Tor is blocked on your network. All bridges are probed "
+                                    "in parallel and only the fastest reachable ones are used. \"Automatic\" "
+                                    "starts with whatever worked last time and tries the others alongside it "
+                                    "if it does not connect within a few seconds.")
+        bridge_description.setWordWrap(True)
+        
+        bridge_layout.addLayout(bridge_select_layout)
+        bridge_layout.addWidget(bridge_description)
+        bridge_group.setLayout(bridge_layout)
+        
         layout.addWidget(startup_group)
         layout.addWidget(ip_group)
         layout.addWidget(appearance_group)
+        profile_group = QGroupBox("Performance Profile")
+        profile_layout = QVBoxLayout()
+        
+        profile_select_layout = QHBoxLayout()
+        profile_select_layout.addWidget(QLabel("Tune Tor for:"))
+        self.profile_combo = QComboBox()
+        for profile in PROFILES:
+            self.profile_combo.addItem(profile.replace('-', ' ').capitalize(), profile)
+        self.profile_combo.setCurrentIndex(-1)
+        profile_select_layout.addWidget(self.profile_combo)
+        profile_select_layout.addStretch()
+        
+        self.profile_description = QLabel()
+        self.profile_description.setWordWrap(True)
+        self.profile_combo.currentIndexChanged.connect(
+            lambda: self.profile_description.setText(PROFILE_DESCRIPTIONS.get(self.profile_combo.currentData(), '')))
+        
+        bandwidth_layout = QHBoxLayout()
+        bandwidth_layout.addWidget(QLabel("Bandwidth limit:"))
+        self.bandwidth_limit = QSpinBox()
+        self.bandwidth_limit.setMinimum(0)
+        self.bandwidth_limit.setMaximum(1000000)
+        self.bandwidth_limit.setSingleStep(100)
+        self.bandwidth_limit.setSpecialValueText("Unlimited")
+        bandwidth_layout.addWidget(self.bandwidth_limit)
+        bandwidth_layout.addWidget(QLabel("KB/s"))
+        bandwidth_layout.addStretch()
+        
+        profile_layout.addLayout(profile_select_layout)
+        profile_layout.addWidget(self.profile_description)
+        profile_layout.addLayout(bandwidth_layout)
+        profile_group.setLayout(profile_layout)
+        
+        layout.addWidget(cache_group)
+        layout.addWidget(bridge_group)
+        layout.addWidget(profile_group)
         layout.addStretch()
         tab.setLayout(layout)
         return tab
@@ -117,28 +209,18 @@ class SettingsDialog(QDialog):
         history_group = QGroupBox("Connection History")
         history_layout = QVBoxLayout()
         
-        self.history_area = QScrollArea()
-        self.history_area.setWidgetResizable(True)
-        self.history_content = QWidget()
-        self.history_content_layout = QVBoxLayout()
-        self.history_text = QLabel()
-        self.history_text.setWordWrap(True)
-        
-        self.history_content_layout.addWidget(self.history_text)
-        self.history_content_layout.addStretch()
-        self.history_content.setLayout(self.history_content_layout)
-        self.history_area.setWidget(self.history_content)
+        self.history_view = HistoryView(getattr(self.parent, 'connection_history', None))
         
         history_buttons = QHBoxLayout()
         self.refresh_button = QPushButton("Refresh")
-        self.refresh_button.clicked.connect(self.update_history_text)
+        self.refresh_button.clicked.connect(self.history_view.refresh)
         self.clear_button = QPushButton("Clear History")
         self.clear_button.clicked.connect(self._clear_history)
         
         history_buttons.addWidget(self.refresh_button)
         history_buttons.addWidget(self.clear_button)
         
-        history_layout.addWidget(self.history_area)
+        history_layout.addWidget(self.history_view)
         history_layout.addLayout(history_buttons)
         history_group.setLayout(history_layout)
         
@@ -241,21 +323,26 @@ class SettingsDialog(QDialog):
         self.show_ip_notification.setEnabled(state == Qt.CheckState.Checked.value)
 
     def loadSettings(self):
-        try:
-            with open('settings.json', 'r') as f:
-                settings = json.load(f)
-        except:
-            settings = {}
+        settings = self.settings
         
         self.auto_start.setChecked(settings.get('auto_start', False))
         self.auto_connect.setChecked(settings.get('auto_connect', False))
         self.minimize_to_tray.setChecked(settings.get('minimize_to_tray', True))
         self.show_speed.setChecked(settings.get('show_speed', True))
+        self.persistent_data_dir.setChecked(settings.get('persistent_data_dir', True))
         
         self.auto_ip_change.setChecked(settings.get('auto_ip_change', False))
         self.ip_interval.setValue(settings.get('ip_change_interval', 15))
         self.show_ip_notification.setChecked(settings.get('show_ip_notification', True))
         self._toggle_ip_interval(self.auto_ip_change.checkState())
+        self.circuit_reserve.setChecked(settings.get('rotation_mode', 'newnym') == 'reserve')
+        self.verify_exit_ip.setChecked(settings.get('verify_exit_ip', False))
+        
+        index = self.bridge_combo.findData(settings.get('bridge_transport', ''))
+        self.bridge_combo.setCurrentIndex(max(0, index))
+        self.bridge_count.setValue(settings.get('bridge_count', 3))
+        self.profile_combo.setCurrentIndex(max(0, self.profile_combo.findData(settings.get('torrc_profile', DEFAULT_PROFILE))))
+        self.bandwidth_limit.setValue(settings.get('bandwidth_limit', 0))
         
         exit_country = settings.get('exit_country', '')
         if exit_country:
@@ -263,8 +350,7 @@ class SettingsDialog(QDialog):
                 if self.country_combo.itemData(i) == exit_country:
                     self.country_combo.setCurrentIndex(i)
                     break
-        
-        self.update_history_text()
+
 
     def saveSettings(self):
         settings = {
@@ -275,28 +361,24 @@ class SettingsDialog(QDialog):
             'auto_ip_change': self.auto_ip_change.isChecked(),
             'ip_change_interval': self.ip_interval.value(),
             'show_ip_notification': self.show_ip_notification.isChecked(),
-            'exit_country': self.country_combo.currentData()
+            'exit_country': self.country_combo.currentData(),
+            'persistent_data_dir': self.persistent_data_dir.isChecked(),
+            'rotation_mode': 'reserve' if self.circuit_reserve.isChecked() else 'newnym',
+            'verify_exit_ip': self.verify_exit_ip.isChecked(),
+            'bridge_transport': self.bridge_combo.currentData(),
+            'bridge_count': self.bridge_count.value(),
+            'torrc_profile': self.profile_combo.currentData(),
+            'bandwidth_limit': self.bandwidth_limit.value()
         }
         
         try:
-            if self.parent:
-                self.parent.settings.update(settings)
-                self.parent.saveSettings()
-                
-                self.parent.speed_label.setVisible(settings['show_speed'])
-                self.parent.update_auto_ip_change()
-                
-                if self.parent.is_connected and 'exit_country' in settings:
-                    QMessageBox.information(self, "Information", "Country selection has changed. You need to reconnect for the changes to take effect.")
-            else:
-                app_data_path = os.path.join(os.environ.get('APPDATA', ''), 'TorShield')
-                if not os.path.exists(app_data_path):
-                    os.makedirs(app_data_path)
-                    
-                settings_path = os.path.join(app_data_path, 'settings.json')
-                
-                with open(settings_path, 'w') as f:
-                    json.dump(settings, f, indent=4)
+            changes = self.settings.update(settings)
+            if not self.settings.flush():
+                raise Exception('Could not write settings.json')
+            
+            # Everything else is pushed to the running Tor by the session itself
+            if getattr(self.parent, 'is_connected', False) and TorSession.needs_reconnect(changes):
+                QMessageBox.information(self, "Information", "Automatic bridge selection takes effect the next time you connect.")
                 
             QMessageBox.information(self, "Success", "Settings saved successfully!")
             self.accept()
@@ -322,6 +404,7 @@ class SettingsDialog(QDialog):
         
         self.country_combo = QComboBox()
         self.country_combo.addItem("Automatic (No Country Selection)", "")
+        self.country_combo.addItem("Fastest (Measured Automatically)", AUTO_COUNTRY)
         
 
         all_countries = get_all_countries()
@@ -330,6 +413,16 @@ class SettingsDialog(QDialog):
         
         country_select_layout.addWidget(self.country_combo)
         country_layout.addLayout(country_select_layout)
+
+        ranking = ExitSelector().ranking()[:3]
+        if ranking:
+            fastest = ', '.join(f"{get_country_name(code)} {score:.1f} s" for code, score in ranking)
+            fastest_label = QLabel(f"Fastest measured so far: {fastest}")
+        else:
+            fastest_label = QLabel("\"Fastest\" measures circuit build time and time to first byte for popular "
+                                   "countries while connected and switches to the quickest one.")
+        fastest_label.setWordWrap(True)
+        country_layout.addWidget(fastest_label)
         
         country_group.setLayout(country_layout)
         layout.addWidget(country_group)
@@ -338,32 +431,19 @@ class SettingsDialog(QDialog):
         tab.setLayout(layout)
         return tab
         
+    def _clear_tor_cache(self):
+        from src.utils.tor_utils import clear_data_dir
+        if getattr(self.parent, 'is_connected', False):
+            QMessageBox.warning(self, "Warning", "Disconnect from Tor before clearing the cache.")
+            return
+        # The bridge strategies of the connection race keep their own consensus and guard state
+        if all([clear_data_dir(data_dir) for data_dir in race_data_dirs(get_tor_data_dir())]):
+            QMessageBox.information(self, "Success", "Tor cache cleared. The next connection will bootstrap from scratch.")
+        else:
+            QMessageBox.critical(self, "Error", "Could not clear the Tor cache.")
+            
     def _clear_history(self):
         if hasattr(self.parent, 'connection_history') and self.parent.connection_history:
             self.parent.connection_history.clear_history()
-            self.update_history_text()
-            QMessageBox.information(self, "Success", "Connection history cleared.")
-    
-    def update_history_text(self):
-        if not hasattr(self.parent, 'connection_history') or not self.parent.connection_history:
-            self.history_text.setText("Connection history is disabled or empty.")
-            return
-            
-        connections = self.parent.connection_history.get_last_connections()
-        if not connections:
-            self.history_text.setText("No connection history yet.")
-            return
-            
-        history_text = ""
-        for conn in reversed(connections):
-            hours = conn['duration'] // 3600
-            minutes = (conn['duration'] % 3600) // 60
-            seconds = conn['duration'] % 60
-            
-            history_text += (f"<div style='margin: 10px 0; padding: 10px; background: #2D2D2D; border-radius: 4px;'>"
-                           f"<b style='color: #00E676;'>IP:</b> {conn['ip']}<br>"
-                           f"<b style='color: #00E676;'>Date:</b> {conn['timestamp']}<br>"
-                           f"<b style='color: #00E676;'>Duration:</b> {hours}:{minutes:02d}:{seconds:02d}"
-                           f"</div>")
-            
-        self.history_text.setText(history_text)
\ No newline at end of file
+            self.history_view.refresh()
+            QMessageBox.information(self, "Success", "Connection history cleared.")
\ No newline at end of file
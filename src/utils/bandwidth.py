@@ -0,0 +1,84 @@
+import threading
+import time
+from array import array
+from stem.control import EventType
+
+class BandwidthMonitor:
+    def __init__(self, capacity=300):
+        self.capacity = capacity
+        self._read = array('Q', [0]) * capacity
+        self._written = array('Q', [0]) * capacity
+        self._timestamps = array('d', [0.0]) * capacity
+        self._index = 0
+        self._count = 0
+        self.total_read = 0
+        self.total_written = 0
+        self._lock = threading.Lock()
+        self._controller = None
+
+    def attach(self, controller):
+        self.detach()
+        self._controller = controller
+        controller.add_event_listener(self._handle_event, EventType.BW)
+
+    def detach(self):
+        if self._controller:
+            try:
+                self._controller.remove_event_listener(self._handle_event)
+            except Exception:
+                pass
+            self._controller = None
+
+    def _handle_event(self, event):
+        self.record(event.read, event.written)
+
+    def record(self, read, written, timestamp=None):
+        with self._lock:
+            self._read[self._index] = read
+            self._written[self._index] = written
+            self._timestamps[self._index] = timestamp if timestamp is not None else time.monotonic()
+            self._index = (self._index + 1) % self.capacity
+            self._count = min(self._count + 1, self.capacity)
+            self.total_read += read
+            self.total_written += written
+
+    def reset(self):
+        with self._lock:
+            self._index = 0
+            self._count = 0
+            self.total_read = 0
+            self.total_written = 0
+
+    def latest(self):
+        """Return (read, written) bytes per second of the newest sample"""
+        with self._lock:
+            if not self._count:
+                return 0, 0
+            last = (self._index - 1) % self.capacity
+            return self._read[last], self._written[last]
+
+    def average(self, seconds=5):
+        with self._lock:
+            count = min(seconds, self._count)
+            if not count:
+                return 0.0, 0.0
+            read = written = 0
+            for offset in range(1, count + 1):
+                position = (self._index - offset) % self.capacity
+                read += self._read[position]
+                written += self._written[position]
+            return read / count, written / count
+
+    def samples(self, count=None):
+        """Return up to count (timestamp, read, written) tuples, oldest first"""
+        with self._lock:
+            count = self._count if count is None else min(count, self._count)
+            start = self._index - count
+            return [(self._timestamps[i % self.capacity], self._read[i % self.capacity],
+                     self._written[i % self.capacity]) for i in range(start, self._index)]
+
+    def seconds_since_last_sample(self):
+        with self._lock:
+            if not self._count:
+                return None
+            return time.monotonic() - self._timestamps[(self._index - 1) % self.capacity]
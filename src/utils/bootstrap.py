@@ -0,0 +1,110 @@
+import os
+import re
+import threading
+import time
+from stem.control import EventType
+
+CONTROL_PORT_FILE = 'control_port'
+CONTROL_PORT_TIMEOUT = 30
+BOOTSTRAP_TIMEOUT = 120
+
+BOOTSTRAP_PHASE_PATTERN = re.compile(r'(\w+)="([^"]*)"|(\w+)=(\S+)')
+
+def read_control_port_file(path):
+    try:
+        with open(path, 'r') as f:
+            for line in f:
+                line = line.strip()
+                if line.startswith('PORT='):
+                    host, port = line[5:].rsplit(':', 1)
+                    return host, int(port)
+    except (OSError, ValueError):
+        pass
+    return None
+
+def wait_for_control_port(path, timeout=CONTROL_PORT_TIMEOUT, process=None, poll_interval=0.05):
+    """Return (host, port) as soon as Tor writes its control port file"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if os.path.exists(path):
+            address = read_control_port_file(path)
+            if address:
+                return address
+        if process is not None and process.poll() is not None:
+            return None
+        time.sleep(poll_interval)
+    return None
+
+def parse_bootstrap_phase(phase):
+    arguments = {}
+    for match in BOOTSTRAP_PHASE_PATTERN.finditer(phase or ''):
+        if match.group(1):
+            arguments[match.group(1)] = match.group(2)
+        else:
+            arguments[match.group(3)] = match.group(4)
+    return arguments
+
+class BootstrapTracker:
+    def __init__(self, progress_callback=None):
+        self.progress_callback = progress_callback
+        self.progress = 0
+        self.tag = ''
+        self.summary = ''
+        self.warning = None
+        self._controller = None
+        self._condition = threading.Condition()
+
+    def attach(self, controller):
+        self._controller = controller
+        controller.add_event_listener(self._handle_event, EventType.STATUS_CLIENT)
+        try:
+            self._update(parse_bootstrap_phase(controller.get_info('status/bootstrap-phase')))
+        except Exception as e:
+            print(f"Error reading bootstrap phase: {e}")
+
+    def detach(self):
+        if self._controller:
+            try:
+                self._controller.remove_event_listener(self._handle_event)
+            except Exception:
+                pass
+            self._controller = None
+        with self._condition:
+            self._condition.notify_all()
+
+    def _handle_event(self, event):
+        if event.action != 'BOOTSTRAP':
+            return
+        self._update(dict(event.keyword_args))
+
+    def _update(self, arguments):
+        if 'PROGRESS' not in arguments:
+            return
+        try:
+            progress = int(arguments['PROGRESS'])
+        except ValueError:
+            return
+        with self._condition:
+            self.progress = max(self.progress, progress)
+            self.tag = arguments.get('TAG', self.tag)
+            self.summary = arguments.get('SUMMARY', self.summary)
+            self.warning = arguments.get('WARNING', self.warning)
+            self._condition.notify_all()
+        if self.progress_callback:
+            self.progress_callback(self.progress, self.summary)
+
+    @property
+    def is_done(self):
+        return self.progress >= 100
+
+    def wait(self, timeout=BOOTSTRAP_TIMEOUT, target=100, process=None):
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while self.progress < target:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or self._controller is None:
+                    return False
+                if process is not None and process.poll() is not None:
+                    return False
+                self._condition.wait(min(remaining, 0.5))
+            return True
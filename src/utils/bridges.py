@@ -0,0 +1,183 @@
+import json
+import os
+import shutil
+import socket
+import ssl
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+from src.utils.system_utils import get_app_data_dir
+
+PT_CONFIG_FILE = 'pt_config.json'
+RANKINGS_FILE = 'bridge_rankings.json'
+RANKING_TTL = 3600
+PROBE_TIMEOUT = 5
+MAX_PARALLEL_PROBES = 16
+DEFAULT_BRIDGE_COUNT = 3
+
+def get_pt_dir(tor_path=None):
+    """Directory holding pt_config.json and the transport plugins, next to the bundled tor binary"""
+    if tor_path:
+        pt_dir = os.path.join(os.path.dirname(tor_path), 'pluggable_transports')
+        if os.path.isdir(pt_dir):
+            return pt_dir
+    base_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    return os.path.join(base_dir, 'tor', 'pluggable_transports')
+
+def parse_bridge_line(line):
+    """(transport, host, port, options) of a Bridge line such as 'obfs4 1.2.3.4:443 FINGERPRINT cert=...'"""
+    parts = line.split()
+    if len(parts) < 2 or ':' not in parts[1]:
+        raise Exception(f'Invalid bridge line: {line}')
+    host, port = parts[1].rsplit(':', 1)
+    options = dict(part.split('=', 1) for part in parts[2:] if '=' in part)
+    return parts[0], host.strip('[]'), int(port), options
+
+def probe_target(line):
+    """(host, port, use_tls) that decides whether a bridge is usable from this network.
+
+    Domain-fronted transports (meek, snowflake) never connect to the address in
+    their bridge line; what matters is a TLS handshake with the front domain
+    that carries the rendezvous. Everything else is probed with a TCP connect
+    to the bridge itself.
+    """
+    _, host, port, options = parse_bridge_line(line)
+    if 'url' in options:
+        url = urlparse(options['url'])
+        front = options.get('front') or options.get('fronts', '').split(',')[0] or url.hostname
+        return front, url.port or 443, True
+    return host, port, False
+
+class BridgeProber:
+    """Ranks the bridges in pt_config.json by how quickly they can be reached.
+
+    All bridges of a transport are probed concurrently, so one round costs at
+    most PROBE_TIMEOUT however many of them are dead. Rankings are kept in
+    bridge_rankings.json for RANKING_TTL seconds, so reconnecting within that
+    window reuses them without probing again.
+    """
+
+    def __init__(self, tor_path=None, path=None, ttl=RANKING_TTL, timeout=PROBE_TIMEOUT, status_callback=None):
+        self.pt_dir = get_pt_dir(tor_path)
+        self.path = path or os.path.join(get_app_data_dir(), RANKINGS_FILE)
+        self.ttl = ttl
+        self.timeout = timeout
+        self.status_callback = status_callback
+        self._lock = threading.Lock()
+        self.config = self._load_config()
+
+    def _status(self, message):
+        if self.status_callback:
+            self.status_callback(message)
+
+    def _load_config(self):
+        try:
+            with open(os.path.join(self.pt_dir, PT_CONFIG_FILE), 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Error loading pluggable transport config: {e}")
+            return {}
+
+    def transports(self):
+        return [name for name, lines in self.config.get('bridges', {}).items() if lines]
+
+    def bridges(self, transport):
+        return list(self.config.get('bridges', {}).get(transport, []))
+
+    def plugin_line(self, transport):
+        """ClientTransportPlugin line for the plugin that handles the transport's bridges"""
+        names = {line.split()[0] for line in self.bridges(transport)}
+        for command in self.config.get('pluggableTransports', {}).values():
+            parts = command.split()
+            if len(parts) < 4 or parts[2] != 'exec' or not names & set(parts[1].split(',')):
+                continue
+            parts[3] = self._plugin_path(parts[3].replace('${pt_path}', ''))
+            return ' '.join(parts)
+        raise Exception(f'No transport plugin configured for {transport} bridges')
+
+    def _plugin_path(self, name):
+        candidates = [name]
+        if sys.platform != 'win32' and name.endswith('.exe'):
+            candidates.append(name[:-4])
+        for candidate in candidates:
+            path = os.path.join(self.pt_dir, candidate)
+            if os.path.isfile(path):
+                return path
+        for candidate in candidates:
+            path = shutil.which(candidate)
+            if path:
+                return path
+        raise Exception(f'Transport plugin {name} not found in {self.pt_dir}')
+
+    # -- probing --
+
+    def probe(self, line):
+        """Seconds to reach the bridge (TCP connect, plus the TLS handshake for fronted transports), or None"""
+        try:
+            host, port, use_tls = probe_target(line)
+            started = time.perf_counter()
+            with socket.create_connection((host, port), timeout=self.timeout) as sock:
+                if use_tls:
+                    with ssl.create_default_context().wrap_socket(sock, server_hostname=host):
+                        pass
+            return time.perf_counter() - started
+        except Exception:
+            return None
+
+    def probe_all(self, lines):
+        """[(line, seconds or None)] for all lines, probed in parallel, fastest first and unreachable last"""
+        if not lines:
+            return []
+        with ThreadPoolExecutor(max_workers=min(MAX_PARALLEL_PROBES, len(lines))) as executor:
+            results = list(zip(lines, executor.map(self.probe, lines)))
+        return sorted(results, key=lambda item: (item[1] is None, item[1] or 0))
+
+    def _load_rankings(self):
+        try:
+            with open(self.path, 'r') as f:
+                rankings = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        return rankings if isinstance(rankings, dict) else {}
+
+    def _save_rankings(self, rankings):
+        tmp_path = self.path + '.tmp'
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(rankings, f, indent=4)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"Error saving bridge rankings: {e}")
+
+    def rankings(self, transport, refresh=False):
+        """Ranked (line, seconds) for a transport, from the saved rankings while they are fresh"""
+        lines = self.bridges(transport)
+        with self._lock:
+            saved = self._load_rankings()
+            entry = saved.get(transport)
+            if not refresh and entry and time.time() - entry.get('probed_at', 0) < self.ttl \
+                    and sorted(result[0] for result in entry.get('results', [])) == sorted(lines):
+                return [tuple(result) for result in entry['results']]
+
+            self._status(f'Probing {len(lines)} {transport} bridges...')
+            results = self.probe_all(lines)
+            # Don't remember a round where nothing answered, the network may just be down right now
+            if any(seconds is not None for _, seconds in results):
+                saved[transport] = {'probed_at': time.time(), 'results': [list(result) for result in results]}
+                self._save_rankings(saved)
+            return results
+
+    def best(self, transport, count=DEFAULT_BRIDGE_COUNT):
+        """Up to count reachable bridge lines, fastest first"""
+        reachable = [line for line, seconds in self.rankings(transport) if seconds is not None]
+        if not reachable:
+            raise Exception(f'None of the {transport} bridges is reachable')
+        return reachable[:max(1, count)]
+
+    def torrc_lines(self, transport, count=DEFAULT_BRIDGE_COUNT):
+        """torrc lines that make Tor connect only through the fastest bridges of a transport"""
+        lines = ['UseBridges 1', self.plugin_line(transport)]
+        lines += [f'Bridge {line}' for line in self.best(transport, count)]
+        return lines
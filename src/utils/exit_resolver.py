@@ -0,0 +1,160 @@
+import threading
+import time
+from stem import CircStatus, StreamStatus
+from stem.control import EventType
+
+# Directory fetches and onion service circuits never leave through an exit
+NON_EXIT_FLAGS = ('ONEHOP_TUNNEL', 'IS_INTERNAL')
+MIN_EXIT_PATH = 3
+# With ConfluxEnabled, Tor carries streams over linked conflux legs instead of GENERAL circuits
+EXIT_PURPOSES = ('GENERAL', 'CONFLUX_LINKED')
+
+def is_exit_circuit(circuit):
+    """Whether a built circuit (CIRC event or circuit-status entry) can carry user traffic to an exit"""
+    return circuit.status == CircStatus.BUILT and circuit.purpose in EXIT_PURPOSES \
+        and len(circuit.path or ()) >= MIN_EXIT_PATH \
+        and not set(NON_EXIT_FLAGS) & set(circuit.build_flags or ())
+
+class ExitResolver:
+    """Works out the current exit IP from circuit data instead of an HTTP round trip.
+
+    The exit fingerprint of every built exit circuit is cached per circuit ID
+    from CIRC events and resolved to an address through the relay's network
+    status entry. The "current" circuit is the one that most recently carried
+    a successful stream. Tor builds preemptive circuits all the time, so a new
+    circuit only becomes current when there is none yet, after
+    expect_new_exit() (NEWNYM) or through select() (reserve rotation).
+    """
+
+    def __init__(self, change_callback=None):
+        self.change_callback = change_callback
+        self._controller = None
+        self._circuits = {}
+        self._addresses = {}
+        self._current = None
+        self._follow_builds = False
+        self._updated_at = 0.0
+        self._condition = threading.Condition()
+
+    def attach(self, controller):
+        self.detach()
+        self._controller = controller
+        controller.add_event_listener(self._on_circuit, EventType.CIRC)
+        controller.add_event_listener(self._on_stream, EventType.STREAM)
+        try:
+            for circuit in controller.get_circuits():
+                if is_exit_circuit(circuit):
+                    self._set_circuit(circuit.id, circuit.path[-1][0])
+        except Exception as e:
+            print(f"Error reading circuit status: {e}")
+
+    def detach(self):
+        if self._controller:
+            try:
+                self._controller.remove_event_listener(self._on_circuit)
+                self._controller.remove_event_listener(self._on_stream)
+            except Exception:
+                pass
+            self._controller = None
+        with self._condition:
+            self._circuits.clear()
+            self._current = None
+            self._follow_builds = False
+            self._condition.notify_all()
+
+    def expect_new_exit(self):
+        """Make the next exit circuit Tor builds current, e.g. right before sending NEWNYM"""
+        with self._condition:
+            self._follow_builds = True
+
+    def select(self, circuit_id):
+        """Make a circuit current because new streams are routed onto it (reserve rotation)"""
+        if self.exit_fingerprint(circuit_id) or self.address(circuit_id):
+            self._select(circuit_id)
+
+    def _set_circuit(self, circuit_id, fingerprint):
+        with self._condition:
+            self._circuits[circuit_id] = fingerprint
+            follow = self._current is None or self._follow_builds
+            self._follow_builds = False
+        if follow:
+            self._select(circuit_id)
+
+    def _select(self, circuit_id):
+        previous = self.current_exit_ip()
+        with self._condition:
+            self._current = circuit_id
+            self._updated_at = time.monotonic()
+            self._condition.notify_all()
+        address = self.address(circuit_id)
+        if address and address != previous and self.change_callback:
+            self.change_callback(address)
+
+    def _on_circuit(self, event):
+        if is_exit_circuit(event):
+            self._set_circuit(event.id, event.path[-1][0])
+        elif event.status in (CircStatus.FAILED, CircStatus.CLOSED):
+            with self._condition:
+                self._circuits.pop(event.id, None)
+                if self._current == event.id:
+                    self._current = None
+
+    def _on_stream(self, event):
+        if event.status == StreamStatus.SUCCEEDED and event.circ_id in self._circuits \
+                and event.circ_id != self._current:
+            self._select(event.circ_id)
+
+    def exit_fingerprint(self, circuit_id=None):
+        with self._condition:
+            return self._circuits.get(circuit_id or self._current)
+
+    def address(self, circuit_id=None):
+        fingerprint = self.exit_fingerprint(circuit_id)
+        if not fingerprint and circuit_id and self._controller:
+            try:
+                circuit = self._controller.get_circuit(circuit_id)
+            except Exception:
+                return None
+            if circuit.status != CircStatus.BUILT or not circuit.path:
+                return None
+            fingerprint = circuit.path[-1][0]
+            with self._condition:
+                self._circuits[circuit_id] = fingerprint
+        if not fingerprint:
+            return None
+        with self._condition:
+            address = self._addresses.get(fingerprint)
+        if address or not self._controller:
+            return address
+        try:
+            address = self._controller.get_network_status(fingerprint).address
+        except Exception as e:
+            print(f"Error resolving exit address: {e}")
+            return None
+        with self._condition:
+            self._addresses[fingerprint] = address
+        return address
+
+    def current_exit_ip(self):
+        return self.address()
+
+    def wait_for_exit(self, timeout=10, since=None, exclude=None):
+        """Wait for a current circuit selected after `since` whose exit address isn't `exclude`"""
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._condition:
+                fresh = since is None or self._updated_at > since
+                ready = self._current is not None and fresh
+                if not ready:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0 or self._controller is None:
+                        return None
+                    self._condition.wait(remaining)
+                    continue
+            address = self.address()
+            if address and address != exclude:
+                return address
+            # NEWNYM landed on the same exit again, keep following new circuits
+            if address:
+                self.expect_new_exit()
+            since = time.monotonic()
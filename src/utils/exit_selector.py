@@ -0,0 +1,255 @@
+import json
+import os
+import socket
+import ssl
+import struct
+import threading
+import time
+from urllib.parse import urlparse
+from src.utils.country_codes import get_popular_countries, get_country_name
+from src.utils.socks_balancer import SocksError, _recv_exact, _read_address
+from src.utils.system_utils import get_app_data_dir
+
+AUTO_COUNTRY = 'auto'
+SCORES_FILE = 'exit_scores.json'
+PROBE_URL = 'https://check.torproject.org/api/ip'
+PROBE_INTERVAL = 600
+PROBE_TIMEOUT = 20
+# A failed probe counts as this many seconds so unreachable countries sink to the bottom
+FAILURE_PENALTY = 30.0
+# Weight of a new sample; older scores also lose half their weight every SCORE_HALF_LIFE seconds
+SAMPLE_WEIGHT = 0.3
+SCORE_HALF_LIFE = 6 * 3600
+# Only switch away from the current country when another one is at least 20% faster
+SWITCH_MARGIN = 0.8
+
+def is_auto_country(country):
+    return str(country or '').lower() == AUTO_COUNTRY
+
+class ExitSelector:
+    """Finds the exit country with the lowest circuit build time plus time to first byte.
+
+    Each probe round builds one circuit per candidate country through our
+    current guard, a random middle relay and a random exit in that country
+    that allows the probe port (both picked from the RelayIndex),
+    then fetches probe_url over it and records build time plus time to first
+    byte. Scores are exponentially weighted and persisted in exit_scores.json,
+    so the next connection can start with the fastest country known so far.
+    When a faster country is found, change_callback(country) applies it, or
+    ExitNodes is set directly if there is no callback.
+    """
+
+    def __init__(self, countries=None, probe_url=PROBE_URL, path=None, status_callback=None, change_callback=None):
+        self.countries = [code.upper() for code in (countries or get_popular_countries())]
+        self.probe_url = probe_url
+        self.path = path or os.path.join(get_app_data_dir(), SCORES_FILE)
+        self.status_callback = status_callback
+        self.change_callback = change_callback
+        self.current = None
+        self.controller = None
+        self.socks_port = None
+        self.relays = None
+        self.reserve = None
+        self._scores = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.load()
+
+    def _status(self, message):
+        if self.status_callback:
+            self.status_callback(message)
+
+    def load(self):
+        try:
+            with open(self.path, 'r') as f:
+                scores = json.load(f)
+        except (OSError, ValueError):
+            scores = {}
+        with self._lock:
+            self._scores = {code: entry for code, entry in scores.items() if isinstance(entry, dict)}
+
+    def save(self):
+        with self._lock:
+            scores = dict(self._scores)
+        tmp_path = self.path + '.tmp'
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(scores, f, indent=4)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"Error saving exit scores: {e}")
+
+    def record(self, country, seconds):
+        """Fold a probe result into the country's score; seconds=None records a failure"""
+        now = time.time()
+        with self._lock:
+            entry = self._scores.get(country)
+            sample = FAILURE_PENALTY if seconds is None else seconds
+            if entry is None:
+                entry = {'score': sample, 'samples': 0, 'failures': 0}
+            else:
+                age = max(0, now - entry.get('updated', now))
+                weight = max(SAMPLE_WEIGHT, 1 - 0.5 ** (age / SCORE_HALF_LIFE))
+                entry['score'] += weight * (sample - entry['score'])
+            entry['samples'] += 1
+            if seconds is None:
+                entry['failures'] += 1
+            entry['updated'] = now
+            self._scores[country] = entry
+
+    def score(self, country):
+        with self._lock:
+            entry = self._scores.get(country)
+            return entry['score'] if entry else None
+
+    def ranking(self):
+        """[(country, score)] for the candidate countries that have been measured, fastest first"""
+        with self._lock:
+            scored = [(code, self._scores[code]['score']) for code in self.countries if code in self._scores]
+        return sorted(scored, key=lambda item: item[1])
+
+    def best(self):
+        ranking = self.ranking()
+        if not ranking or ranking[0][1] >= FAILURE_PENALTY:
+            return None
+        return ranking[0][0]
+
+    def start(self, controller, socks_port, relays, reserve=None, current=None):
+        """Probe candidates in the background every PROBE_INTERVAL seconds and switch ExitNodes to the fastest"""
+        self.controller = controller
+        self.socks_port = socks_port
+        self.relays = relays
+        self.reserve = reserve
+        self.current = current or None
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._probe_loop, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join(timeout=PROBE_TIMEOUT)
+        self._thread = None
+        self.controller = None
+        self.save()
+
+    def _probe_loop(self):
+        while not self._stop.is_set():
+            try:
+                self.probe_all()
+                self._choose()
+            except Exception as e:
+                print(f"Exit country probe failed: {e}")
+            self.save()
+            self._stop.wait(PROBE_INTERVAL)
+
+    def probe_all(self):
+        from src.controllers.circuit_reserve import CircuitReserve
+
+        if not self.relays.wait_ready(PROBE_TIMEOUT) or not len(self.relays):
+            raise Exception('Relay index is not available')
+        # Streams are pinned to probe circuits by source port; borrow the session's reserve if it has one.
+        # Otherwise new streams wait for our attacher only for this round, and stop() always hands them back to Tor.
+        attacher = self.reserve
+        owned = attacher is None
+        try:
+            if owned:
+                attacher = CircuitReserve(self.controller, size=0)
+                attacher.start()
+            for country in self.countries:
+                if self._stop.is_set():
+                    return
+                exit_fingerprint = self.relays.pick_exit(country, self._probe_port())
+                if not exit_fingerprint:
+                    continue
+                seconds = self.probe(country, exit_fingerprint, attacher)
+                self.record(country, seconds)
+        finally:
+            if owned and attacher is not None:
+                attacher.stop()
+
+    def probe(self, country, exit_fingerprint, attacher):
+        """Seconds to build a circuit through exit_fingerprint and get the first byte of probe_url, or None"""
+        circuit_id = None
+        try:
+            path = self._probe_path(exit_fingerprint)
+            started = time.perf_counter()
+            # CONTROLLER purpose keeps Tor (and ExitResolver) from using probe circuits for regular streams
+            circuit_id = self.controller.new_circuit(path, purpose='controller', await_build=True, timeout=PROBE_TIMEOUT)
+            build_time = time.perf_counter() - started
+            return build_time + self._first_byte_time(circuit_id, attacher)
+        except Exception as e:
+            print(f"Probe via {country} failed: {e}")
+            return None
+        finally:
+            if circuit_id:
+                try:
+                    self.controller.close_circuit(circuit_id)
+                except Exception:
+                    pass
+
+    def _probe_port(self):
+        url = urlparse(self.probe_url)
+        return url.port or (443 if url.scheme == 'https' else 80)
+
+    def _probe_path(self, exit_fingerprint):
+        guard = None
+        for circuit in self.controller.get_circuits():
+            if circuit.purpose == 'GENERAL' and circuit.path:
+                guard = circuit.path[0][0]
+                break
+        if guard is None:
+            guard = self.relays.pick_relay(('Guard', 'Fast', 'Running', 'Valid'), exclude=(exit_fingerprint,))
+        middle = self.relays.pick_relay(exclude=(exit_fingerprint, guard))
+        if not guard or not middle:
+            raise Exception('Not enough relays to build a probe circuit')
+        return [guard, middle, exit_fingerprint]
+
+    def _first_byte_time(self, circuit_id, attacher):
+        url = urlparse(self.probe_url)
+        host = url.hostname
+        port = self._probe_port()
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.settimeout(PROBE_TIMEOUT)
+        source_port = None
+        try:
+            sock.bind(('127.0.0.1', 0))
+            source_port = sock.getsockname()[1]
+            attacher.pin(source_port, circuit_id)
+            started = time.perf_counter()
+            sock.connect(('127.0.0.1', self.socks_port))
+            sock.sendall(b'\x05\x01\x00')
+            if _recv_exact(sock, 2) != b'\x05\x00':
+                raise SocksError('SOCKS handshake rejected')
+            name = host.encode()
+            sock.sendall(b'\x05\x01\x00\x03' + bytes([len(name)]) + name + struct.pack('>H', port))
+            reply = _recv_exact(sock, 4)
+            _read_address(sock, reply[3])
+            if reply[1] != 0:
+                raise SocksError(f'SOCKS connect failed with code {reply[1]}')
+            if url.scheme == 'https':
+                sock = ssl.create_default_context().wrap_socket(sock, server_hostname=host)
+            sock.sendall(f'GET {url.path or "/"} HTTP/1.1\r\nHost: {host}\r\nConnection: close\r\n\r\n'.encode())
+            if not sock.recv(1):
+                raise SocksError('Connection closed before the first byte')
+            return time.perf_counter() - started
+        finally:
+            if source_port is not None:
+                attacher.unpin(source_port)
+            sock.close()
+
+    def _choose(self):
+        best = self.best()
+        if not best or best == self.current:
+            return
+        current_score = self.score(self.current) if self.current else None
+        if current_score is not None and self.score(best) > current_score * SWITCH_MARGIN:
+            return
+        self.current = best
+        self._status(f'Fastest exit country is now {get_country_name(best)} ({self.score(best):.1f} s)')
+        # The owner (TorSession) applies the switch so its own state and circuits follow along
+        if self.change_callback:
+            self.change_callback(best)
+        else:
+            self.controller.set_conf('ExitNodes', f'{{{best}}}')
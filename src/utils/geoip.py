@@ -0,0 +1,201 @@
+import mmap
+import os
+import socket
+import struct
+import threading
+from src.utils.system_utils import get_app_data_dir, get_tor_path
+
+CACHE_MAGIC = b'TSGEOIP1'
+# magic, key size, source size, source mtime_ns, entry count
+CACHE_HEADER = struct.Struct('<8sBQQQ')
+SYSTEM_GEOIP_DIRS = ('/usr/share/tor', '/usr/local/share/tor', '/opt/homebrew/share/tor')
+
+_geoip = None
+_geoip_lock = threading.Lock()
+
+def get_geoip_paths(tor_path):
+    """(geoip, geoip6) paths shipped with the Tor bundle, falling back to a system Tor install"""
+    bundle_dir = os.path.join(os.path.dirname(os.path.dirname(tor_path)), 'data') if tor_path else None
+    for directory in ([bundle_dir] if bundle_dir else []) + list(SYSTEM_GEOIP_DIRS):
+        if os.path.exists(os.path.join(directory, 'geoip')):
+            return os.path.join(directory, 'geoip'), os.path.join(directory, 'geoip6')
+    if bundle_dir:
+        return os.path.join(bundle_dir, 'geoip'), os.path.join(bundle_dir, 'geoip6')
+    return None, None
+
+def get_geoip(block=True):
+    """The process-wide GeoIP database for the bundled Tor, loaded on first use.
+
+    The first load can build the range table from the text files, so with
+    block=False this returns None instead of loading or waiting for a load.
+    """
+    global _geoip
+    if not block:
+        return _geoip
+    with _geoip_lock:
+        if _geoip is None:
+            _geoip = GeoIP(*get_geoip_paths(get_tor_path()))
+        return _geoip
+
+def warm_geoip():
+    """Load the GeoIP database on a background thread"""
+    if _geoip is None:
+        threading.Thread(target=get_geoip, daemon=True).start()
+
+def _parse_geoip(path):
+    ranges = []
+    with open(path, 'r', encoding='ascii', errors='replace') as f:
+        for line in f:
+            if not line or line[0] == '#':
+                continue
+            parts = line.strip().split(',')
+            if len(parts) != 3 or parts[2] in ('??', ''):
+                continue
+            ranges.append((int(parts[0]), int(parts[1]), parts[2].upper()))
+    return ranges
+
+def _parse_geoip6(path):
+    ranges = []
+    with open(path, 'r', encoding='ascii', errors='replace') as f:
+        for line in f:
+            if not line or line[0] == '#':
+                continue
+            parts = line.strip().split(',')
+            if len(parts) != 3 or parts[2] in ('??', ''):
+                continue
+            try:
+                low = socket.inet_pton(socket.AF_INET6, parts[0])
+                high = socket.inet_pton(socket.AF_INET6, parts[1])
+            except OSError:
+                continue
+            ranges.append((low, high, parts[2].upper()))
+    return ranges
+
+class RangeTable:
+    """Sorted, non-overlapping address ranges stored as fixed-size keys in one memory-mapped file.
+
+    Layout after the header: n low keys, n high keys (key_size bytes each,
+    big-endian so byte order equals numeric order) and n two-letter country
+    codes. Lookups bisect the low keys directly in the mapping, so only the
+    pages touched by the search are ever read from disk.
+    """
+
+    def __init__(self, source_path, cache_path, key_size, parse, encode):
+        self.source_path = source_path
+        self.cache_path = cache_path
+        self.key_size = key_size
+        self.count = 0
+        self._parse = parse
+        self._encode = encode
+        self._map = None
+        self.load()
+
+    def load(self):
+        try:
+            stat = os.stat(self.source_path)
+        except (OSError, TypeError):
+            return False
+        if not self._open_cache(stat):
+            self._build_cache(stat)
+            if not self._open_cache(stat):
+                return False
+        return True
+
+    def _open_cache(self, stat):
+        try:
+            with open(self.cache_path, 'rb') as f:
+                header = f.read(CACHE_HEADER.size)
+                if len(header) < CACHE_HEADER.size:
+                    return False
+                magic, key_size, size, mtime, count = CACHE_HEADER.unpack(header)
+                if (magic, key_size, size, mtime) != (CACHE_MAGIC, self.key_size, stat.st_size, stat.st_mtime_ns):
+                    return False
+                if count:
+                    self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                self.count = count
+                return True
+        except (OSError, ValueError):
+            return False
+
+    def _build_cache(self, stat):
+        ranges = sorted(self._parse(self.source_path))
+        lows = b''.join(self._encode(low) for low, _, _ in ranges)
+        highs = b''.join(self._encode(high) for _, high, _ in ranges)
+        countries = ''.join(country[:2].ljust(2, '?') for _, _, country in ranges).encode('ascii')
+        header = CACHE_HEADER.pack(CACHE_MAGIC, self.key_size, stat.st_size, stat.st_mtime_ns, len(ranges))
+        tmp_path = self.cache_path + '.tmp'
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(header + lows + highs + countries)
+            os.replace(tmp_path, self.cache_path)
+        except OSError as e:
+            print(f"Error writing GeoIP cache: {e}")
+
+    def lookup(self, key):
+        """Country of the range containing key (big-endian, key_size bytes), or None"""
+        size, count, data, base = self.key_size, self.count, self._map, CACHE_HEADER.size
+        if not count:
+            return None
+        # Rightmost range whose low key is <= key
+        low, high = 0, count
+        while low < high:
+            middle = (low + high) // 2
+            start = base + middle * size
+            if data[start:start + size] <= key:
+                low = middle + 1
+            else:
+                high = middle
+        index = low - 1
+        if index < 0:
+            return None
+        start = base + (count + index) * size
+        if data[start:start + size] < key:
+            return None
+        start = base + 2 * count * size + index * 2
+        return data[start:start + 2].decode('ascii')
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+            self.count = 0
+
+class GeoIP:
+    """Offline IP-to-country lookups over Tor's geoip and geoip6 files.
+
+    The text files are converted once into a binary range table in the app
+    data directory (rebuilt whenever the source file changes) which is then
+    memory-mapped, so opening the database is nearly free and each lookup is
+    a binary search without any network or controller round trip.
+    """
+
+    def __init__(self, geoip_path=None, geoip6_path=None, cache_dir=None):
+        cache_dir = cache_dir or get_app_data_dir()
+        self.v4 = RangeTable(geoip_path, os.path.join(cache_dir, 'geoip.idx'), 4, _parse_geoip,
+                             lambda value: value.to_bytes(4, 'big'))
+        self.v6 = RangeTable(geoip6_path, os.path.join(cache_dir, 'geoip6.idx'), 16, _parse_geoip6,
+                             lambda value: value)
+
+    @property
+    def available(self):
+        return bool(self.v4.count or self.v6.count)
+
+    def country(self, address):
+        """Two-letter country code of an IPv4 or IPv6 address, or None"""
+        if not address:
+            return None
+        address = address.strip('[]')
+        try:
+            if ':' in address:
+                return self.v6.lookup(socket.inet_pton(socket.AF_INET6, address))
+            return self.v4.lookup(socket.inet_aton(address))
+        except OSError:
+            return None
+
+    def countries(self, addresses):
+        """country() for many addresses, in the form RelayIndex's country_lookup expects"""
+        return [self.country(address) for address in addresses]
+
+    def close(self):
+        self.v4.close()
+        self.v6.close()
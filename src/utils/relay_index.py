@@ -0,0 +1,443 @@
+import base64
+import bisect
+import hashlib
+import os
+import random
+import socket
+import struct
+import threading
+from array import array
+from src.utils.geoip import get_geoip
+
+CONSENSUS_FILE = 'cached-microdesc-consensus'
+MICRODESC_FILES = ('cached-microdescs', 'cached-microdescs.new')
+FLAGS = ('Authority', 'BadExit', 'Exit', 'Fast', 'Guard', 'HSDir', 'MiddleOnly', 'NoEdConsensus',
+         'Running', 'Stable', 'StaleDesc', 'Sybil', 'V2Dir', 'Valid')
+FLAG_BITS = {flag: 1 << bit for bit, flag in enumerate(FLAGS)}
+NO_COUNTRY = '??'
+REJECT_ALL = 'reject 1-65535'
+FINGERPRINT_SIZE = 20
+COUNTRY_LOOKUP_BATCH = 500
+
+def flag_mask(flags):
+    mask = 0
+    for flag in flags:
+        mask |= FLAG_BITS.get(flag, 0)
+    return mask
+
+def _pack_country(code):
+    code = (code or NO_COUNTRY).upper()
+    if len(code) != 2:
+        code = NO_COUNTRY
+    return (ord(code[0]) << 8) | ord(code[1])
+
+def _unpack_country(value):
+    return chr(value >> 8) + chr(value & 0xFF)
+
+def _address_to_int(address):
+    return struct.unpack('!I', socket.inet_aton(address))[0]
+
+def _int_to_address(value):
+    return socket.inet_ntoa(struct.pack('!I', value))
+
+def _decode_digest(value):
+    return base64.b64decode(value + '=' * (-len(value) % 4))
+
+def controller_country_lookup(controller):
+    """Country lookup for RelayIndex that asks Tor (GETINFO ip-to-country) in batches"""
+    def lookup(addresses):
+        countries = []
+        for start in range(0, len(addresses), COUNTRY_LOOKUP_BATCH):
+            batch = addresses[start:start + COUNTRY_LOOKUP_BATCH]
+            result = controller.get_info([f'ip-to-country/{address}' for address in batch])
+            countries.extend(result.get(f'ip-to-country/{address}') for address in batch)
+        return countries
+    return lookup
+
+class ExitPolicySummary:
+    """A consensus/microdescriptor policy summary such as 'accept 80,443,6660-6669'"""
+
+    __slots__ = ('summary', 'accept', 'starts', 'ends')
+
+    def __init__(self, summary):
+        self.summary = summary
+        action, _, ports = summary.partition(' ')
+        self.accept = action == 'accept'
+        self.starts = array('H')
+        self.ends = array('H')
+        for item in ports.split(','):
+            if not item:
+                continue
+            low, _, high = item.partition('-')
+            self.starts.append(int(low))
+            self.ends.append(int(high or low))
+
+    def allows(self, port):
+        index = bisect.bisect_right(self.starts, port) - 1
+        listed = index >= 0 and port <= self.ends[index]
+        return listed == self.accept
+
+    def allows_any(self):
+        """Whether at least one port is allowed, e.g. Tor's default 'reject 25,119,135-139,...' allows most"""
+        if self.accept:
+            return len(self.starts) > 0
+        uncovered = 1
+        for low, high in sorted(zip(self.starts, self.ends)):
+            if low > uncovered:
+                return True
+            uncovered = max(uncovered, high + 1)
+        return uncovered <= 65535
+
+def _parse_consensus(path):
+    """Return ([(fingerprint, address, or_port, flags, bandwidth, digest, policy)], valid_after, bandwidth_weights)"""
+    entries = []
+    valid_after = None
+    weights = {}
+    current = None
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        for line in f:
+            keyword = line[:2]
+            if keyword == 'r ':
+                parts = line.split()
+                try:
+                    # The microdesc flavour has no descriptor digest; address and ports are always last
+                    fingerprint = _decode_digest(parts[2])
+                    address = _address_to_int(parts[-3])
+                    or_port = int(parts[-2])
+                except (IndexError, ValueError, OSError):
+                    current = None
+                    continue
+                current = [fingerprint, address, or_port, 0, 0, None, None]
+                entries.append(current)
+            elif current is None:
+                if line.startswith('valid-after '):
+                    valid_after = line[12:].strip()
+                elif line.startswith('bandwidth-weights '):
+                    for item in line.split()[1:]:
+                        key, _, value = item.partition('=')
+                        if value.lstrip('-').isdigit():
+                            weights[key] = int(value)
+            elif keyword == 'm ':
+                try:
+                    current[5] = _decode_digest(line[2:].strip())
+                except ValueError:
+                    pass
+            elif keyword == 's ':
+                current[3] = flag_mask(line.split()[1:])
+            elif keyword == 'w ':
+                for item in line.split()[1:]:
+                    if item.startswith('Bandwidth='):
+                        current[4] = int(item[10:])
+            elif keyword == 'p ':
+                current[6] = line[2:].strip()
+            elif line.startswith('directory-footer'):
+                current = None
+    return entries, valid_after, weights
+
+class RelayIndex:
+    """Relays from the cached microdesc consensus in compact, fingerprint-sorted columnar arrays.
+
+    Rows hold the identity fingerprint, IPv4 address, ORPort, country, flag
+    bits, consensus bandwidth and an index into a table of distinct exit
+    policy summaries (taken from the microdescriptors), so a full consensus
+    needs well under a megabyte. refresh() rebuilds the arrays when the
+    consensus file changes but only parses newly appended microdescriptors
+    and only looks up countries for addresses it has not seen before.
+    """
+
+    def __init__(self, data_dir, country_lookup=None):
+        self.data_dir = data_dir
+        self.country_lookup = country_lookup
+        self.valid_after = None
+        self.bandwidth_weights = {}
+        self.ready = threading.Event()
+        self._fingerprints = b''
+        self._addresses = array('I')
+        self._or_ports = array('H')
+        self._countries = array('H')
+        self._flags = array('H')
+        self._bandwidths = array('I')
+        self._policies = array('H')
+        self._policy_table = [ExitPolicySummary(REJECT_ALL)]
+        self._policy_ids = {REJECT_ALL: 0}
+        self._by_country = {}
+        self._policy_by_digest = {}
+        self._microdesc_state = {}
+        self._consensus_mtime = None
+        self._controller = None
+        self._lock = threading.RLock()
+        self._refresh_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._addresses)
+
+    # -- loading --
+
+    def attach(self, controller):
+        """Load the index in the background and reload it whenever Tor reports a new consensus"""
+        from stem.control import EventType
+
+        self.detach()
+        self._controller = controller
+        if self.country_lookup is None:
+            geoip = get_geoip()
+            self.country_lookup = geoip.countries if geoip.available else controller_country_lookup(controller)
+        controller.add_event_listener(self._on_new_consensus, EventType.NEWCONSENSUS)
+        self._refresh_in_background()
+
+    def detach(self):
+        if self._controller:
+            try:
+                self._controller.remove_event_listener(self._on_new_consensus)
+            except Exception:
+                pass
+            self._controller = None
+
+    def _on_new_consensus(self, event):
+        self._refresh_in_background()
+
+    def _refresh_in_background(self):
+        def run():
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"Error loading relay index: {e}")
+            finally:
+                self.ready.set()
+        threading.Thread(target=run, daemon=True).start()
+
+    def wait_ready(self, timeout=None):
+        return self.ready.wait(timeout)
+
+    def refresh(self, force=False):
+        """Rebuild the index if the consensus file changed; returns True when it was rebuilt"""
+        path = os.path.join(self.data_dir, CONSENSUS_FILE)
+        with self._refresh_lock:
+            try:
+                mtime = os.stat(path).st_mtime_ns
+            except OSError:
+                return False
+            if not force and mtime == self._consensus_mtime:
+                return False
+            self._load_microdescs()
+            entries, valid_after, weights = _parse_consensus(path)
+            entries.sort(key=lambda entry: entry[0])
+            self._build(entries)
+            self.valid_after = valid_after
+            self.bandwidth_weights = weights
+            self._consensus_mtime = mtime
+            self.ready.set()
+            return True
+
+    def _load_microdescs(self):
+        for name in MICRODESC_FILES:
+            path = os.path.join(self.data_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                self._microdesc_state.pop(name, None)
+                continue
+            inode, offset = self._microdesc_state.get(name, (None, 0))
+            if inode != stat.st_ino or stat.st_size < offset:
+                offset = 0
+            if stat.st_size == offset:
+                continue
+            with open(path, 'rb') as f:
+                f.seek(offset)
+                data = f.read()
+            self._parse_microdescs(data)
+            self._microdesc_state[name] = (stat.st_ino, offset + len(data))
+
+    def _parse_microdescs(self, data):
+        body = []
+        for line in data.splitlines(keepends=True):
+            if line.startswith(b'@') or (line.startswith(b'onion-key') and body):
+                self._add_microdesc(body)
+                body = []
+            if not line.startswith(b'@'):
+                body.append(line)
+        self._add_microdesc(body)
+
+    def _add_microdesc(self, lines):
+        if not lines:
+            return
+        digest = hashlib.sha256(b''.join(lines)).digest()
+        summary = REJECT_ALL
+        for line in lines:
+            if line.startswith(b'p '):
+                summary = line[2:].decode('ascii', errors='replace').strip()
+                break
+        self._policy_by_digest[digest] = self._policy_id(summary)
+
+    def _policy_id(self, summary):
+        policy_id = self._policy_ids.get(summary)
+        if policy_id is None:
+            policy_id = len(self._policy_table)
+            self._policy_table.append(ExitPolicySummary(summary))
+            self._policy_ids[summary] = policy_id
+        return policy_id
+
+    def _build(self, entries):
+        with self._lock:
+            known = dict(zip(self._addresses, self._countries))
+        unknown = sorted({entry[1] for entry in entries if entry[1] not in known})
+        if unknown and self.country_lookup:
+            try:
+                countries = self.country_lookup([_int_to_address(address) for address in unknown])
+                known.update(zip(unknown, (_pack_country(country) for country in countries)))
+            except Exception as e:
+                print(f"Error looking up relay countries: {e}")
+
+        fingerprints = bytearray()
+        addresses, or_ports = array('I'), array('H')
+        countries, flags = array('H'), array('H')
+        bandwidths, policies = array('I'), array('H')
+        by_country = {}
+        no_country = _pack_country(NO_COUNTRY)
+        referenced = set()
+        for row, (fingerprint, address, or_port, mask, bandwidth, digest, summary) in enumerate(entries):
+            country = known.get(address, no_country)
+            fingerprints += fingerprint
+            addresses.append(address)
+            or_ports.append(or_port)
+            countries.append(country)
+            flags.append(mask)
+            bandwidths.append(min(bandwidth, 0xFFFFFFFF))
+            if summary is not None:
+                policies.append(self._policy_id(summary))
+            else:
+                policies.append(self._policy_by_digest.get(digest, 0))
+                referenced.add(digest)
+            by_country.setdefault(country, array('I')).append(row)
+
+        # Forget microdescriptors the consensus no longer lists so the digest map stays bounded
+        self._policy_by_digest = {digest: policy for digest, policy in self._policy_by_digest.items()
+                                  if digest in referenced}
+        with self._lock:
+            self._fingerprints = bytes(fingerprints)
+            self._addresses, self._or_ports = addresses, or_ports
+            self._countries, self._flags = countries, flags
+            self._bandwidths, self._policies = bandwidths, policies
+            self._by_country = by_country
+
+    # -- queries --
+
+    def _row(self, fingerprint):
+        try:
+            key = bytes.fromhex(fingerprint.lstrip('$')[:40])
+        except ValueError:
+            return None
+        data = self._fingerprints
+        low, high = 0, len(data) // FINGERPRINT_SIZE
+        while low < high:
+            middle = (low + high) // 2
+            if data[middle * FINGERPRINT_SIZE:(middle + 1) * FINGERPRINT_SIZE] < key:
+                low = middle + 1
+            else:
+                high = middle
+        if data[low * FINGERPRINT_SIZE:(low + 1) * FINGERPRINT_SIZE] == key:
+            return low
+        return None
+
+    def _fingerprint(self, row):
+        return self._fingerprints[row * FINGERPRINT_SIZE:(row + 1) * FINGERPRINT_SIZE].hex().upper()
+
+    def lookup(self, fingerprint):
+        """Details of one relay as a dict, or None if it is not in the consensus"""
+        with self._lock:
+            row = self._row(fingerprint)
+            if row is None:
+                return None
+            mask = self._flags[row]
+            return {
+                'fingerprint': self._fingerprint(row),
+                'address': _int_to_address(self._addresses[row]),
+                'or_port': self._or_ports[row],
+                'country': _unpack_country(self._countries[row]),
+                'flags': [flag for flag in FLAGS if mask & FLAG_BITS[flag]],
+                'bandwidth': self._bandwidths[row],
+                'exit_policy': self._policy_table[self._policies[row]].summary
+            }
+
+    def country(self, fingerprint):
+        with self._lock:
+            row = self._row(fingerprint)
+            return _unpack_country(self._countries[row]) if row is not None else None
+
+    def _select_rows(self, flags, exclude_flags, country, allowed):
+        required, excluded = flag_mask(flags), flag_mask(exclude_flags)
+        with self._lock:
+            if country is not None:
+                rows = self._by_country.get(_pack_country(country), ())
+            else:
+                rows = range(len(self._flags))
+            # Policies are shared by many relays, so evaluate each distinct one only once
+            policy_ids = None
+            if allowed is not None:
+                policy_ids = {index for index, policy in enumerate(self._policy_table) if allowed(policy)}
+            flag_column, policy_column = self._flags, self._policies
+            result = []
+            for row in rows:
+                mask = flag_column[row]
+                if mask & required != required or mask & excluded:
+                    continue
+                if policy_ids is not None and policy_column[row] not in policy_ids:
+                    continue
+                result.append(row)
+            return result
+
+    def _select(self, flags, exclude_flags, country, allowed):
+        with self._lock:
+            return [self._fingerprint(row) for row in self._select_rows(flags, exclude_flags, country, allowed)]
+
+    def _pick_row(self, rows, exclude):
+        excluded_rows = {self._row(fingerprint) for fingerprint in exclude}
+        rows = [row for row in rows if row not in excluded_rows]
+        if not rows:
+            return None
+        row = random.choices(rows, weights=[max(1, self._bandwidths[row]) for row in rows])[0]
+        return self._fingerprint(row)
+
+    def relays(self, flags=('Running', 'Valid'), country=None, port=None, exclude_flags=()):
+        """Fingerprints of relays with all of flags and none of exclude_flags, optionally
+        only in one country and only exits whose policy allows port"""
+        allowed = (lambda policy: policy.allows(port)) if port is not None else None
+        return self._select(flags, exclude_flags, country, allowed)
+
+    def exits(self, country=None, port=None):
+        """Usable exits, optionally in one country and allowing port"""
+        allowed = (lambda policy: policy.allows(port)) if port is not None else ExitPolicySummary.allows_any
+        return self._select(('Exit', 'Running', 'Valid'), ('BadExit',), country, allowed)
+
+    def countries_with_exits(self, port=None):
+        """{country: number of usable exits}"""
+        counts = {}
+        for country in self.countries():
+            if country != NO_COUNTRY:
+                count = len(self.exits(country, port))
+                if count:
+                    counts[country] = count
+        return counts
+
+    def countries(self):
+        with self._lock:
+            return sorted(_unpack_country(value) for value in self._by_country)
+
+    def pick_relay(self, flags=('Fast', 'Running', 'Valid'), exclude=()):
+        """Bandwidth-weighted random relay with all of flags, skipping the exclude fingerprints"""
+        with self._lock:
+            return self._pick_row(self._select_rows(flags, (), None, None), exclude)
+
+    def pick_exit(self, country=None, port=None, exclude=()):
+        """Bandwidth-weighted random usable exit, optionally in one country and allowing port"""
+        allowed = (lambda policy: policy.allows(port)) if port is not None else ExitPolicySummary.allows_any
+        with self._lock:
+            return self._pick_row(self._select_rows(('Exit', 'Running', 'Valid'), ('BadExit',), country, allowed),
+                                  exclude)
+
+    def memory_usage(self):
+        """Approximate bytes held by the columnar arrays"""
+        with self._lock:
+            columns = (self._addresses, self._or_ports, self._countries, self._flags, self._bandwidths,
+                       self._policies)
+            return len(self._fingerprints) + sum(column.itemsize * len(column) for column in columns)
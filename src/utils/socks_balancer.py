@@ -0,0 +1,258 @@
+import random
+import select
+import socket
+import threading
+import time
+
+STRATEGIES = ('round-robin', 'least-connections', 'latency')
+LATENCY_SMOOTHING = 0.2
+BACKEND_CONNECT_TIMEOUT = 5
+SOCKS_REPLY_TIMEOUT = 120
+
+class SocksError(Exception):
+    pass
+
+def _recv_exact(sock, size):
+    data = b''
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise SocksError('Connection closed during SOCKS handshake')
+        data += chunk
+    return data
+
+def _read_address(sock, atyp):
+    if atyp == 1:
+        return _recv_exact(sock, 4 + 2)
+    if atyp == 4:
+        return _recv_exact(sock, 16 + 2)
+    if atyp == 3:
+        length = _recv_exact(sock, 1)
+        return length + _recv_exact(sock, length[0] + 2)
+    raise SocksError(f'Unsupported address type {atyp}')
+
+class Backend:
+    def __init__(self, name, host, port):
+        self.name = name
+        self.host = host
+        self.port = port
+        self.healthy = True
+        self.active = 0
+        self.total = 0
+        self.failures = 0
+        self.bytes_up = 0
+        self.bytes_down = 0
+        self.latency = None
+
+    def record_latency(self, seconds):
+        if self.latency is None:
+            self.latency = seconds
+        else:
+            self.latency += LATENCY_SMOOTHING * (seconds - self.latency)
+
+    def stats(self):
+        return {
+            'name': self.name,
+            'address': f'{self.host}:{self.port}',
+            'healthy': self.healthy,
+            'active': self.active,
+            'total': self.total,
+            'failures': self.failures,
+            'bytes_up': self.bytes_up,
+            'bytes_down': self.bytes_down,
+            'latency_ms': round(self.latency * 1000, 1) if self.latency is not None else None
+        }
+
+class SocksBalancer:
+    """SOCKS5 front listener that spreads connections over several SOCKS5 backends.
+
+    The balancer terminates the client handshake itself so it can time each
+    backend's CONNECT reply, which is what latency-weighted selection uses.
+    """
+
+    def __init__(self, backends=None, host='127.0.0.1', port=9050, strategy='round-robin'):
+        if strategy not in STRATEGIES:
+            raise ValueError(f'Unknown strategy: {strategy}')
+        self.host = host
+        self.port = port
+        self.strategy = strategy
+        self.backends = list(backends or [])
+        self._next = 0
+        self._lock = threading.Lock()
+        self._server = None
+        self._running = False
+
+    def add_backend(self, backend):
+        with self._lock:
+            self.backends.append(backend)
+
+    def remove_backend(self, name):
+        with self._lock:
+            self.backends = [backend for backend in self.backends if backend.name != name]
+
+    def set_healthy(self, name, healthy):
+        with self._lock:
+            for backend in self.backends:
+                if backend.name == name:
+                    backend.healthy = healthy
+
+    def start(self):
+        self._server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._server.bind((self.host, self.port))
+        self._server.listen(128)
+        self.port = self._server.getsockname()[1]
+        self._running = True
+        threading.Thread(target=self._accept_loop, daemon=True).start()
+
+    def stop(self):
+        self._running = False
+        if self._server:
+            try:
+                self._server.close()
+            except OSError:
+                pass
+            self._server = None
+
+    def stats(self):
+        with self._lock:
+            return [backend.stats() for backend in self.backends]
+
+    def _choose(self, exclude=()):
+        with self._lock:
+            candidates = [b for b in self.backends if b.healthy and b not in exclude]
+            if not candidates:
+                return None
+            if self.strategy == 'least-connections':
+                backend = min(candidates, key=lambda b: (b.active, b.total))
+            elif self.strategy == 'latency':
+                weights = [1.0 / max(b.latency, 0.001) if b.latency is not None else 1.0 for b in candidates]
+                if any(b.latency is None for b in candidates):
+                    backend = next(b for b in candidates if b.latency is None)
+                else:
+                    backend = random.choices(candidates, weights)[0]
+            else:
+                backend = candidates[self._next % len(candidates)]
+                self._next += 1
+            backend.active += 1
+            backend.total += 1
+            return backend
+
+    def _release(self, backend):
+        with self._lock:
+            backend.active -= 1
+
+    def _accept_loop(self):
+        while self._running:
+            try:
+                client, _ = self._server.accept()
+            except OSError:
+                break
+            threading.Thread(target=self._handle_client, args=(client,), daemon=True).start()
+
+    def _client_handshake(self, client):
+        version, count = _recv_exact(client, 2)
+        if version != 5:
+            raise SocksError('Only SOCKS5 clients are supported')
+        methods = _recv_exact(client, count)
+        credentials = None
+        if 2 in methods:
+            client.sendall(b'\x05\x02')
+            header = _recv_exact(client, 2)
+            username = _recv_exact(client, header[1])
+            password_length = _recv_exact(client, 1)
+            password = _recv_exact(client, password_length[0])
+            credentials = (username, password)
+            client.sendall(b'\x01\x00')
+        elif 0 in methods:
+            client.sendall(b'\x05\x00')
+        else:
+            client.sendall(b'\x05\xff')
+            raise SocksError('No acceptable authentication method')
+        header = _recv_exact(client, 4)
+        return credentials, header + _read_address(client, header[3])
+
+    def _open_backend(self, backend, credentials, request):
+        upstream = socket.create_connection((backend.host, backend.port), timeout=BACKEND_CONNECT_TIMEOUT)
+        try:
+            upstream.settimeout(SOCKS_REPLY_TIMEOUT)
+            if credentials:
+                upstream.sendall(b'\x05\x01\x02')
+                if _recv_exact(upstream, 2) != b'\x05\x02':
+                    raise SocksError('Backend rejected username/password authentication')
+                username, password = credentials
+                upstream.sendall(b'\x01' + bytes([len(username)]) + username + bytes([len(password)]) + password)
+                if _recv_exact(upstream, 2)[1] != 0:
+                    raise SocksError('Backend authentication failed')
+            else:
+                upstream.sendall(b'\x05\x01\x00')
+                if _recv_exact(upstream, 2) != b'\x05\x00':
+                    raise SocksError('Backend rejected the handshake')
+            started = time.monotonic()
+            upstream.sendall(request)
+            header = _recv_exact(upstream, 4)
+            reply = header + _read_address(upstream, header[3])
+            return upstream, reply, time.monotonic() - started
+        except Exception:
+            upstream.close()
+            raise
+
+    def _handle_client(self, client):
+        backend = None
+        upstream = None
+        try:
+            client.settimeout(SOCKS_REPLY_TIMEOUT)
+            credentials, request = self._client_handshake(client)
+
+            tried = []
+            while upstream is None:
+                backend = self._choose(tried)
+                if backend is None:
+                    client.sendall(b'\x05\x01\x00\x01' + b'\x00' * 6)
+                    return
+                try:
+                    upstream, reply, latency = self._open_backend(backend, credentials, request)
+                except (OSError, SocksError) as e:
+                    if isinstance(e, ConnectionRefusedError):
+                        self.set_healthy(backend.name, False)
+                    backend.failures += 1
+                    self._release(backend)
+                    tried.append(backend)
+                    backend = None
+
+            if reply[1] == 0:
+                backend.record_latency(latency)
+            client.sendall(reply)
+            if reply[1] != 0:
+                return
+            client.settimeout(None)
+            upstream.settimeout(None)
+            self._pump(client, upstream, backend)
+        except (OSError, SocksError):
+            pass
+        finally:
+            if backend is not None:
+                self._release(backend)
+            for sock in (client, upstream):
+                if sock is not None:
+                    try:
+                        sock.close()
+                    except OSError:
+                        pass
+
+    def _pump(self, client, upstream, backend):
+        sockets = [client, upstream]
+        while self._running:
+            readable, _, errored = select.select(sockets, [], sockets, 60)
+            if errored:
+                return
+            for sock in readable:
+                data = sock.recv(65536)
+                if not data:
+                    return
+                if sock is client:
+                    upstream.sendall(data)
+                    backend.bytes_up += len(data)
+                else:
+                    client.sendall(data)
+                    backend.bytes_down += len(data)
@@ -0,0 +1,30 @@
+import sys
+import time
+
+# Modules that should only be imported on first connect, not at startup
+DEFERRED_MODULES = ('requests', 'socks', 'psutil', 'stem', 'win32gui')
+
+class StartupProfiler:
+    """Records wall-clock time and newly imported modules per startup phase"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = []
+        self._last = self.started
+        self._module_count = len(sys.modules)
+
+    def mark(self, name):
+        now = time.perf_counter()
+        module_count = len(sys.modules)
+        self.phases.append((name, (now - self._last) * 1000, module_count - self._module_count))
+        self._last = now
+        self._module_count = module_count
+
+    def report(self):
+        lines = [f"{'phase':<28} {'ms':>9} {'modules':>8}"]
+        for name, elapsed, modules in self.phases:
+            lines.append(f"{name:<28} {elapsed:>9.1f} {modules:>8}")
+        lines.append(f"{'total':<28} {(self._last - self.started) * 1000:>9.1f} {len(sys.modules):>8}")
+        loaded = [name for name in DEFERRED_MODULES if name in sys.modules]
+        lines.append('Loaded at startup (should be deferred): ' + (', '.join(loaded) if loaded else 'none'))
+        return '\n'.join(lines)
@@ -1,11 +1,18 @@
 import os
-import ctypes
-import winreg
 import sys
+import shutil
 import subprocess
 
+try:
+    import winreg
+except ImportError:
+    winreg = None
+
+CREATE_NO_WINDOW = getattr(subprocess, 'CREATE_NO_WINDOW', 0)
+
 def is_admin():
     try:
+        import ctypes
         return ctypes.windll.shell32.IsUserAnAdmin()
     except:
         return False
@@ -15,18 +22,33 @@ def get_tor_path():
         base_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
         tor_dir = os.path.join(base_dir, 'tor')
         
-        if not os.path.exists(tor_dir):
-            return None
-            
-        tor_exe = os.path.join(tor_dir, 'tor.exe')
-        if os.path.exists(tor_exe):
-            return tor_exe
+        for name in ('tor.exe', 'tor'):
+            tor_exe = os.path.join(tor_dir, name)
+            if os.path.isfile(tor_exe):
+                return tor_exe
             
+        if sys.platform != 'win32':
+            return shutil.which('tor')
         return None
     except:
         return None
 
+def get_app_data_dir():
+    if os.environ.get('APPDATA'):
+        app_data_path = os.path.join(os.environ['APPDATA'], 'TorShield')
+    else:
+        config_home = os.environ.get('XDG_CONFIG_HOME') or os.path.join(os.path.expanduser('~'), '.config')
+        app_data_path = os.path.join(config_home, 'torshield')
+    os.makedirs(app_data_path, exist_ok=True)
+    return app_data_path
+
+def get_tor_data_dir():
+    base_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    return os.path.join(base_dir, 'tor_data')
+
 def set_system_proxy(enable, host='127.0.0.1', port='9050'):
+    if winreg is None:
+        return False
     try:
         INTERNET_SETTINGS = winreg.OpenKey(winreg.HKEY_CURRENT_USER,
             r'Software\Microsoft\Windows\CurrentVersion\Internet Settings',
@@ -52,16 +74,17 @@ def set_system_proxy(enable, host='127.0.0.1', port='9050'):
             set_key_string('ProxyServer', '')
 
         try:
-            subprocess.run(['ipconfig', '/flushdns'], capture_output=True, creationflags=subprocess.CREATE_NO_WINDOW)
-            subprocess.run(['ipconfig', '/registerdns'], capture_output=True, creationflags=subprocess.CREATE_NO_WINDOW)
-            subprocess.run(['ipconfig', '/release'], capture_output=True, creationflags=subprocess.CREATE_NO_WINDOW)
-            subprocess.run(['ipconfig', '/renew'], capture_output=True, creationflags=subprocess.CREATE_NO_WINDOW)
+            subprocess.run(['ipconfig', '/flushdns'], capture_output=True, creationflags=CREATE_NO_WINDOW)
+            subprocess.run(['ipconfig', '/registerdns'], capture_output=True, creationflags=CREATE_NO_WINDOW)
+            subprocess.run(['ipconfig', '/release'], capture_output=True, creationflags=CREATE_NO_WINDOW)
+            subprocess.run(['ipconfig', '/renew'], capture_output=True, creationflags=CREATE_NO_WINDOW)
         except Exception as e:
             print(f"Error refreshing IP configuration: {e}")
 
         INTERNET_OPTION_SETTINGS_CHANGED = 39
         INTERNET_OPTION_REFRESH = 37
         try:
+            import ctypes
             ctypes.windll.Wininet.InternetSetOptionW(0, INTERNET_OPTION_REFRESH, 0, 0)
             ctypes.windll.Wininet.InternetSetOptionW(0, INTERNET_OPTION_SETTINGS_CHANGED, 0, 0)
         except Exception as e:
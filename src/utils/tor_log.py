@@ -0,0 +1,127 @@
+import re
+import threading
+import time
+from collections import deque
+
+LOG_CAPACITY = 500
+LOG_LEVELS = ('debug', 'info', 'notice', 'warn', 'err')
+
+LOG_LINE_PATTERN = re.compile(r'^(?:\w{3} \d+ [\d:.]+ )?\[(\w+)\] (?:\{(\w+)\} )?(.*)$')
+BOOTSTRAP_PATTERN = re.compile(r'Bootstrapped (\d+)%')
+
+class TorLogRecord:
+    __slots__ = ('timestamp', 'level', 'subsystem', 'message', 'bootstrap')
+
+    def __init__(self, timestamp, level, subsystem, message, bootstrap=None):
+        self.timestamp = timestamp
+        self.level = level
+        self.subsystem = subsystem
+        self.message = message
+        self.bootstrap = bootstrap
+
+    @property
+    def is_warning(self):
+        return self.level in ('warn', 'err')
+
+    def to_dict(self):
+        return {
+            'timestamp': self.timestamp,
+            'level': self.level,
+            'subsystem': self.subsystem,
+            'message': self.message,
+            'bootstrap': self.bootstrap
+        }
+
+    def __str__(self):
+        subsystem = f' {{{self.subsystem}}}' if self.subsystem else ''
+        return f'[{self.level}]{subsystem} {self.message}'
+
+def parse_log_line(line, timestamp=None):
+    """Parse one line of Tor's stdout (with LogMessageDomains 1) into a TorLogRecord"""
+    line = line.rstrip('\r\n')
+    if not line:
+        return None
+    timestamp = timestamp if timestamp is not None else time.time()
+    match = LOG_LINE_PATTERN.match(line)
+    if not match:
+        return TorLogRecord(timestamp, 'notice', None, line)
+    level, subsystem, message = match.groups()
+    bootstrap = BOOTSTRAP_PATTERN.search(message)
+    return TorLogRecord(timestamp, level.lower(), subsystem, message,
+                        int(bootstrap.group(1)) if bootstrap else None)
+
+class TorLog:
+    """Drains a Tor process's output into a bounded buffer of parsed records.
+
+    Reading the pipe continuously keeps Tor from blocking on a full pipe
+    buffer; only the last `capacity` records are kept.
+    """
+
+    def __init__(self, capacity=LOG_CAPACITY, record_callback=None):
+        self.record_callback = record_callback
+        self.bootstrap = 0
+        self.warning_count = 0
+        self._records = deque(maxlen=capacity)
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def attach(self, process):
+        self._thread = threading.Thread(target=self._read_loop, args=(process.stdout,), daemon=True)
+        self._thread.start()
+
+    def join(self, timeout=None):
+        if self._thread:
+            self._thread.join(timeout)
+
+    def _read_loop(self, pipe):
+        try:
+            for raw in iter(pipe.readline, b''):
+                self.add(raw.decode('utf-8', errors='replace'))
+        except (OSError, ValueError):
+            pass
+        finally:
+            try:
+                pipe.close()
+            except OSError:
+                pass
+
+    def add(self, line):
+        record = parse_log_line(line)
+        if record is None:
+            return None
+        with self._lock:
+            self._records.append(record)
+            if record.bootstrap is not None:
+                self.bootstrap = record.bootstrap
+            if record.is_warning:
+                self.warning_count += 1
+        if self.record_callback:
+            try:
+                self.record_callback(record)
+            except Exception as e:
+                print(f"Error in Tor log callback: {e}")
+        return record
+
+    def records(self, min_level=None, count=None):
+        """Return buffered records, oldest first, optionally filtered by minimum level"""
+        with self._lock:
+            records = list(self._records)
+        if min_level:
+            threshold = LOG_LEVELS.index(min_level)
+            records = [r for r in records if r.level in LOG_LEVELS and LOG_LEVELS.index(r.level) >= threshold]
+        if count is not None:
+            records = records[-count:] if count > 0 else []
+        return records
+
+    def warnings(self, count=None):
+        return self.records('warn', count)
+
+    def last_warning(self):
+        warnings = self.warnings(1)
+        return warnings[0] if warnings else None
+
+    def clear(self):
+        with self._lock:
+            self._records.clear()
+            self.bootstrap = 0
+            self.warning_count = 0
@@ -0,0 +1,95 @@
+import os
+import subprocess
+import psutil
+
+PID_FILE = 'tor.pid'
+SHUTDOWN_TIMEOUT = 5
+
+def _pid_file_path(data_dir):
+    return os.path.join(data_dir, PID_FILE)
+
+def write_pid_file(data_dir, pid):
+    path = _pid_file_path(data_dir)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        f.write(str(pid))
+    os.replace(tmp_path, path)
+
+def read_pid_file(data_dir):
+    try:
+        with open(_pid_file_path(data_dir), 'r') as f:
+            return int(f.read().strip())
+    except (OSError, ValueError):
+        return None
+
+def remove_pid_file(data_dir):
+    try:
+        os.unlink(_pid_file_path(data_dir))
+    except OSError:
+        pass
+
+def find_orphaned_tor(data_dir, tor_path):
+    """Return the Tor process recorded in data_dir's PID file if it is still running"""
+    pid = read_pid_file(data_dir)
+    if pid is None:
+        return None
+    try:
+        proc = psutil.Process(pid)
+        tor_name = os.path.basename(tor_path).lower()
+        if proc.name().lower() != tor_name:
+            return None
+        # Guard against PID reuse: the recorded Tor was started with this data directory's torrc
+        if os.path.join(data_dir, 'torrc') not in proc.cmdline():
+            return None
+        return proc
+    except psutil.Error:
+        return None
+
+def stop_orphaned_tor(data_dir, tor_path, timeout=SHUTDOWN_TIMEOUT):
+    """Stop a Tor left running by a previous run with the same data directory"""
+    proc = find_orphaned_tor(data_dir, tor_path)
+    if proc is not None:
+        _terminate(proc, timeout)
+    remove_pid_file(data_dir)
+    return proc is not None
+
+def _terminate(proc, timeout):
+    try:
+        processes = proc.children(recursive=True) + [proc]
+    except psutil.Error:
+        processes = [proc]
+    for p in processes:
+        try:
+            p.terminate()
+        except psutil.Error:
+            pass
+    _, alive = psutil.wait_procs(processes, timeout=timeout)
+    for p in alive:
+        try:
+            p.kill()
+        except psutil.Error:
+            pass
+    psutil.wait_procs(alive, timeout=timeout)
+
+def shutdown_tor(process, controller=None, timeout=SHUTDOWN_TIMEOUT):
+    """Stop a Tor process we started: SHUTDOWN over the control port, then terminate as a fallback"""
+    if process.poll() is not None:
+        return True
+    if controller is not None:
+        try:
+            controller.signal('SHUTDOWN')
+            process.wait(timeout)
+            return True
+        except subprocess.TimeoutExpired:
+            pass
+        except Exception as e:
+            print(f"Error sending SHUTDOWN to Tor: {e}")
+    try:
+        _terminate(psutil.Process(process.pid), timeout)
+    except psutil.Error:
+        pass
+    try:
+        process.wait(timeout)
+    except subprocess.TimeoutExpired:
+        return False
+    return True
@@ -1,41 +1,145 @@
 import socket
 import subprocess
 import os
+import shutil
 import time
+from datetime import datetime, timedelta, timezone
 from stem.control import Controller
 import psutil
+from src.utils.bootstrap import CONTROL_PORT_FILE
+from src.utils.geoip import get_geoip_paths
+from src.utils.system_utils import CREATE_NO_WINDOW
+from src.utils.torrc import TorrcBuilder, get_profile, bandwidth_options
 
-def is_port_in_use(port):
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-        try:
-            s.bind(('127.0.0.1', port))
-            return False
-        except:
+CONSENSUS_FILES = ('cached-microdesc-consensus', 'cached-consensus')
+CONSENSUS_GRACE_PERIOD = timedelta(hours=24)
+CACHE_HEADERS = {
+    'cached-microdesc-consensus': 'network-status-version 3',
+    'cached-consensus': 'network-status-version 3',
+    'cached-certs': 'dir-key-certificate-version',
+}
+VOLATILE_FILES = ('lock', CONTROL_PORT_FILE)
+
+def is_port_open(port, host='127.0.0.1', timeout=0.5):
+    try:
+        with socket.create_connection((host, port), timeout=timeout):
+            return True
+    except OSError:
+        return False
+
+def wait_for_port(port, host='127.0.0.1', timeout=10, process=None, poll_interval=0.05):
+    """Connect-probe host:port until it accepts connections or the deadline passes"""
+    deadline = time.monotonic() + timeout
+    while True:
+        remaining = deadline - time.monotonic()
+        if is_port_open(port, host, max(0.05, min(0.5, remaining))):
             return True
+        if remaining <= 0 or (process is not None and process.poll() is not None):
+            return False
+        time.sleep(poll_interval)
             
-def create_tor_config(tor_path, data_dir, exit_country=None):
-    config_path = os.path.join(data_dir, 'torrc')
+def _read_consensus_valid_until(path):
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        for line in f:
+            if line.startswith('valid-until '):
+                return datetime.strptime(line[12:].strip(), '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
+            if line.startswith('r ') or line.startswith('directory-footer'):
+                break
+    return None
+
+def _has_valid_header(path, header):
+    try:
+        with open(path, 'r', encoding='utf-8', errors='replace') as f:
+            return f.read(len(header) + 64).lstrip().startswith(header)
+    except OSError:
+        return False
+
+def clear_data_dir(data_dir):
+    if not os.path.exists(data_dir):
+        return True
+    try:
+        for name in os.listdir(data_dir):
+            path = os.path.join(data_dir, name)
+            if os.path.isdir(path) and not os.path.islink(path):
+                shutil.rmtree(path)
+            else:
+                os.unlink(path)
+        return True
+    except Exception as e:
+        print(f"Error clearing Tor data directory: {e}")
+        return False
+
+def prepare_data_dir(data_dir, persistent=True):
+    """Return 'cold', 'stale' or 'warm' depending on the reusable cache"""
+    if not persistent:
+        clear_data_dir(data_dir)
+    os.makedirs(data_dir, exist_ok=True)
     
-    config = f"""DataDirectory {data_dir}
-SocksPort 9050
-ControlPort 9051
-CookieAuthentication 1
-"""    
-    if exit_country and exit_country.strip():
-        config += f"\nExitNodes {{{exit_country}}}"
-        config += "\nStrictNodes 0"
-        config += "\nGeoIPFile " + os.path.join(os.path.dirname(os.path.dirname(tor_path)), 'data', 'geoip')
-        config += "\nGeoIPv6File " + os.path.join(os.path.dirname(os.path.dirname(tor_path)), 'data', 'geoip6')
-        
-    config += "\nCircuitBuildTimeout 60"
-    config += "\nLearnCircuitBuildTimeout 1"
-    config += "\nNewCircuitPeriod 15"
-    config += "\nMaxCircuitDirtiness 600"
+    for name in VOLATILE_FILES:
+        path = os.path.join(data_dir, name)
+        if os.path.exists(path):
+            try:
+                os.unlink(path)
+            except OSError as e:
+                print(f"Error removing {name}: {e}")
+                
+    for name, header in CACHE_HEADERS.items():
+        path = os.path.join(data_dir, name)
+        if os.path.exists(path) and not _has_valid_header(path, header):
+            print(f"Discarding corrupt Tor cache file: {name}")
+            os.unlink(path)
     
+    state = 'cold'
+    for name in CONSENSUS_FILES:
+        path = os.path.join(data_dir, name)
+        if not os.path.exists(path):
+            continue
+        try:
+            valid_until = _read_consensus_valid_until(path)
+        except (OSError, ValueError):
+            valid_until = None
+        if valid_until and datetime.now(timezone.utc) < valid_until + CONSENSUS_GRACE_PERIOD:
+            state = 'warm'
+        else:
+            os.unlink(path)
+            if state == 'cold':
+                state = 'stale'
+    return state
+
+def build_tor_config(tor_path, data_dir, exit_country=None, socks_port='auto', control_port='auto', owner_pid=None,
+                     bridge_lines=None, profile=None, bandwidth_limit=0):
+    """TorrcBuilder for a TorShield-managed Tor, tuned by one of the torrc profiles"""
+    config = TorrcBuilder()
+    config.set('DataDirectory', data_dir)
+    config.add('SocksPort', socks_port)
+    config.add('ControlPort', control_port)
+    config.set('ControlPortWriteToFile', os.path.join(data_dir, CONTROL_PORT_FILE))
+    config.set('CookieAuthentication', '1')
+    config.add('Log', 'notice stdout')
+    config.set('LogMessageDomains', '1')
+    if owner_pid:
+        config.set('__OwningControllerProcess', owner_pid)
+    if exit_country and exit_country.strip():
+        config.set('ExitNodes', f'{{{exit_country}}}')
+        config.set('StrictNodes', '0')
+    # Country lookups (ExitNodes, ip-to-country) need the bundled GeoIP files even without an exit country
+    geoip_path, geoip6_path = get_geoip_paths(tor_path)
+    if (exit_country and exit_country.strip()) or os.path.exists(geoip_path):
+        config.set('GeoIPFile', geoip_path)
+        config.set('GeoIPv6File', geoip6_path)
+    for line in bridge_lines or []:
+        config.add_line(line)
+    config.update(get_profile(profile))
+    config.update(bandwidth_options(bandwidth_limit))
+    return config
+
+def create_tor_config(tor_path, data_dir, exit_country=None, socks_port='auto', control_port='auto', owner_pid=None,
+                      bridge_lines=None, profile=None, bandwidth_limit=0):
+    config_path = os.path.join(data_dir, 'torrc')
     try:
-        with open(config_path, 'w') as f:
-            f.write(config)
-        return config_path
+        config = build_tor_config(tor_path, data_dir, exit_country, socks_port, control_port, owner_pid,
+                                  bridge_lines, profile, bandwidth_limit)
+        return config.write(config_path)
     except Exception as e:
         print(f"Error creating Tor configuration file: {e}")
         return None
@@ -45,22 +149,24 @@ def launch_tor(tor_path, config_path, status_callback=None):
         if status_callback:
             status_callback("Starting Tor...")
             
+        control_port_file = os.path.join(os.path.dirname(config_path), CONTROL_PORT_FILE)
+        if os.path.exists(control_port_file):
+            os.unlink(control_port_file)
+            
         process = subprocess.Popen(
             [tor_path, '-f', config_path],
             stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            creationflags=subprocess.CREATE_NO_WINDOW
+            stderr=subprocess.STDOUT,
+            creationflags=CREATE_NO_WINDOW
         )
         
-        time.sleep(3)
-        
         if process.poll() is not None:
             if status_callback:
                 status_callback("Failed to start Tor!")
             return None
             
         if status_callback:
-            status_callback("Tor started successfully!")
+            status_callback("Tor process started, waiting for control port...")
             
         return process
     except Exception as e:
@@ -68,7 +174,7 @@ def launch_tor(tor_path, config_path, status_callback=None):
             status_callback(f"Error starting Tor: {e}")
         return None
         
-def create_controller():
-    controller = Controller.from_port(port=9051)
+def create_controller(port=9051, address='127.0.0.1'):
+    controller = Controller.from_port(address=address, port=port)
     controller.authenticate()
     return controller
\ No newline at end of file
@@ -0,0 +1,174 @@
+import os
+import re
+
+DEFAULT_PROFILE = 'balanced'
+# Options that may appear several times; everything else is set once and replaced on the next set()
+REPEATABLE_OPTIONS = ('Bridge', 'ClientTransportPlugin', 'SocksPort', 'ControlPort', 'Log')
+OPTION_NAME = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+INTERVAL_UNITS = ('', 'second', 'seconds', 'minute', 'minutes', 'hour', 'hours', 'day', 'days', 'week', 'weeks')
+MEMORY_UNITS = ('bytes', 'kb', 'kbytes', 'mb', 'mbytes', 'gb', 'gbytes', 'tb', 'tbytes')
+
+# Value checks for the options the profiles set, so a typo fails before Tor is launched
+OPTION_TYPES = {
+    'CircuitBuildTimeout': 'interval',
+    'LearnCircuitBuildTimeout': 'bool',
+    'NewCircuitPeriod': 'interval',
+    'MaxCircuitDirtiness': 'interval',
+    'CircuitsAvailableTimeout': 'interval',
+    'MaxClientCircuitsPending': 'int',
+    'MaxMemInQueues': 'memory',
+    'BandwidthRate': 'memory',
+    'BandwidthBurst': 'memory',
+    'ConfluxEnabled': ('0', '1', 'auto'),
+    'ConfluxClientUX': ('throughput', 'latency', 'throughput_lowmem', 'latency_lowmem'),
+    'ReducedConnectionPadding': 'bool',
+    'ReducedCircuitPadding': 'bool',
+    'UseBridges': 'bool',
+    'StrictNodes': 'bool',
+    'CookieAuthentication': 'bool',
+    'LogMessageDomains': 'bool',
+}
+
+PROFILES = {
+    'balanced': {
+        'CircuitBuildTimeout': '60',
+        'LearnCircuitBuildTimeout': '1',
+        'NewCircuitPeriod': '15',
+        'MaxCircuitDirtiness': '600',
+    },
+    'low-latency': {
+        # Tor ignores CircuitBuildTimeout while it learns the timeout itself
+        'CircuitBuildTimeout': '15',
+        'LearnCircuitBuildTimeout': '0',
+        'NewCircuitPeriod': '10',
+        'MaxCircuitDirtiness': '300',
+        'CircuitsAvailableTimeout': '3600',
+        'ConfluxEnabled': '1',
+        'ConfluxClientUX': 'latency',
+    },
+    'bulk-throughput': {
+        'CircuitBuildTimeout': '60',
+        'LearnCircuitBuildTimeout': '1',
+        'NewCircuitPeriod': '30',
+        'MaxCircuitDirtiness': '1800',
+        'MaxMemInQueues': '2 GB',
+        'ConfluxEnabled': '1',
+        'ConfluxClientUX': 'throughput',
+    },
+    'low-resource': {
+        'CircuitBuildTimeout': '60',
+        'LearnCircuitBuildTimeout': '1',
+        'NewCircuitPeriod': '60',
+        'MaxCircuitDirtiness': '1800',
+        'CircuitsAvailableTimeout': '300',
+        'MaxClientCircuitsPending': '16',
+        'MaxMemInQueues': '256 MB',
+        'ConfluxEnabled': '0',
+        'ReducedConnectionPadding': '1',
+        'ReducedCircuitPadding': '1',
+    },
+}
+
+PROFILE_DESCRIPTIONS = {
+    'balanced': 'The circuit timings TorShield has always used.',
+    'low-latency': 'Gives up on slow circuit builds early, keeps spare circuits ready for longer and '
+                   'uses conflux tuned for latency.',
+    'bulk-throughput': 'Larger queues, conflux tuned for throughput and long-lived circuits for big downloads.',
+    'low-resource': 'Fewer preemptive circuits, the smallest queues Tor allows and less padding traffic.',
+}
+
+def get_profile(name):
+    """Options of a named profile, falling back to the default profile for unknown names"""
+    if name and name not in PROFILES:
+        print(f"Unknown torrc profile {name}, using {DEFAULT_PROFILE}")
+    return dict(PROFILES.get(name or DEFAULT_PROFILE, PROFILES[DEFAULT_PROFILE]))
+
+def bandwidth_options(limit):
+    """BandwidthRate/BandwidthBurst for a limit in KB/s, or {} for unlimited"""
+    if not limit:
+        return {}
+    return {'BandwidthRate': f'{int(limit)} KBytes', 'BandwidthBurst': f'{int(limit)} KBytes'}
+
+def validate_option(option, value):
+    if not OPTION_NAME.match(option):
+        raise Exception(f'Invalid torrc option name: {option!r}')
+    value = str(value)
+    if not value.strip() or '\n' in value or '\r' in value:
+        raise Exception(f'Invalid value for {option}: {value!r}')
+    kind = OPTION_TYPES.get(option)
+    parts = value.lower().split()
+    if kind == 'bool':
+        valid = value in ('0', '1')
+    elif kind == 'int':
+        valid = value.isdigit()
+    elif kind == 'interval':
+        valid = parts[0].isdigit() and len(parts) <= 2 and (len(parts) == 1 or parts[1] in INTERVAL_UNITS)
+    elif kind == 'memory':
+        valid = len(parts) == 2 and parts[0].isdigit() and parts[1] in MEMORY_UNITS
+    elif isinstance(kind, tuple):
+        valid = value in kind
+    else:
+        valid = True
+    if not valid:
+        raise Exception(f'Invalid value for {option}: {value!r}')
+    return value
+
+class TorrcBuilder:
+    """An ordered torrc that is assembled option by option and checked before it is written.
+
+    set() replaces an option, add() appends another line for options Tor
+    accepts several times (Bridge, SocksPort, ...). Values are validated as
+    they are set, so a bad profile or setting fails with a clear message
+    instead of Tor refusing to start.
+    """
+
+    def __init__(self, options=None):
+        self._lines = []
+        self.update(options or {})
+
+    def set(self, option, value):
+        value = validate_option(option, value)
+        index = next((i for i, (name, _) in enumerate(self._lines) if name == option), len(self._lines))
+        self.remove(option)
+        self._lines.insert(index, (option, value))
+        return self
+
+    def add(self, option, value):
+        if option not in REPEATABLE_OPTIONS:
+            return self.set(option, value)
+        self._lines.append((option, validate_option(option, value)))
+        return self
+
+    def update(self, options):
+        for option, value in options.items():
+            self.set(option, value)
+        return self
+
+    def add_line(self, line):
+        """Add a raw 'Option value' line such as those produced by BridgeProber.torrc_lines()"""
+        option, _, value = line.strip().partition(' ')
+        return self.add(option, value)
+
+    def remove(self, option):
+        self._lines = [line for line in self._lines if line[0] != option]
+        return self
+
+    def get(self, option, default=None):
+        values = self.get_all(option)
+        return values[-1] if values else default
+
+    def get_all(self, option):
+        return [value for name, value in self._lines if name == option]
+
+    def options(self):
+        return list(self._lines)
+
+    def render(self):
+        return ''.join(f'{option} {value}\n' for option, value in self._lines)
+
+    def write(self, path):
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(self.render())
+        os.replace(tmp_path, path)
+        return path
@@ -0,0 +1,61 @@
+import time
+import pytest
+
+@pytest.fixture(autouse=True)
+def app_data_dir(tmp_path, monkeypatch):
+    """Keep settings, rankings and history files out of the real application data directory"""
+    monkeypatch.delenv('APPDATA', raising=False)
+    monkeypatch.setenv('XDG_CONFIG_HOME', str(tmp_path / 'config'))
+    return tmp_path / 'config' / 'torshield'
+
+@pytest.fixture
+def control_server():
+    from benchmarks.fake_control import FakeControlServer
+    server = FakeControlServer(circuit_delay=0.01, seed=1)
+    server.start()
+    yield server
+    server.stop()
+
+@pytest.fixture
+def controller(control_server):
+    from src.utils.tor_utils import create_controller
+    controller = create_controller(control_server.port)
+    yield controller
+    controller.close()
+
+@pytest.fixture
+def wait_until():
+    """Poll a condition that is met by control events arriving on stem's event thread"""
+    def wait(condition, timeout=5):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if condition():
+                return True
+            time.sleep(0.01)
+        return condition()
+    return wait
+
+@pytest.fixture
+def tor_session(tmp_path, monkeypatch):
+    """Factory for TorSessions connected to the stub Tor; settings override the defaults below"""
+    from benchmarks.run_benchmarks import start_check_server, write_tor_wrapper
+    from src.controllers.tor_session import TorSession
+    monkeypatch.setenv('STUB_TOR_BOOTSTRAP_DELAY', '0.05')
+    monkeypatch.setenv('STUB_TOR_CIRCUIT_DELAY', '0.01')
+    server = start_check_server()
+    sessions = []
+
+    def connect(**settings):
+        data_dir = tmp_path / f'data{len(sessions)}'
+        data_dir.mkdir()
+        settings = {'persistent_data_dir': True, 'verify_exit_ip': False, **settings}
+        session = TorSession(settings, tor_path=write_tor_wrapper(str(tmp_path)), data_dir=str(data_dir),
+                             use_system_proxy=False, check_url=f'http://127.0.0.1:{server.server_address[1]}/api/ip')
+        sessions.append(session)
+        assert session.connect(), session.error
+        return session
+
+    yield connect
+    for session in sessions:
+        session.disconnect()
+    server.shutdown()
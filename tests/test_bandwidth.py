@@ -0,0 +1,19 @@
+from src.utils.bandwidth import BandwidthMonitor
+
+def test_monitor_records_bw_events(control_server, controller, wait_until):
+    monitor = BandwidthMonitor(capacity=4)
+    monitor.attach(controller)
+    assert control_server.wait_for_subscriber('BW')
+    for read, written in ((100, 10), (200, 20), (300, 30), (400, 40), (500, 50)):
+        control_server.emit('BW', f'{read} {written}')
+    assert wait_until(lambda: monitor.total_read == 1500)
+
+    assert monitor.total_written == 150
+    assert monitor.latest() == (500, 50)
+    assert monitor.average(2) == (450.0, 45.0)
+    # Only the newest `capacity` samples are kept
+    assert [sample[1:] for sample in monitor.samples()] == [(200, 20), (300, 30), (400, 40), (500, 50)]
+
+    monitor.detach()
+    control_server.emit('BW', '1000 1000')
+    assert monitor.total_read == 1500
@@ -0,0 +1,27 @@
+from src.utils.bootstrap import BootstrapTracker, parse_bootstrap_phase
+
+def test_parse_bootstrap_phase():
+    arguments = parse_bootstrap_phase('NOTICE BOOTSTRAP PROGRESS=75 TAG=enough_dirinfo SUMMARY="Loaded enough directory info"')
+    assert arguments == {'PROGRESS': '75', 'TAG': 'enough_dirinfo', 'SUMMARY': 'Loaded enough directory info'}
+
+def test_tracker_follows_status_events(control_server, controller):
+    control_server.set_bootstrap(10, 'conn_done', 'Connected to a relay')
+    updates = []
+    tracker = BootstrapTracker(progress_callback=lambda progress, summary: updates.append((progress, summary)))
+    tracker.attach(controller)
+    assert tracker.progress == 10 and not tracker.is_done
+    assert control_server.wait_for_subscriber('STATUS_CLIENT')
+
+    control_server.set_bootstrap(50, 'loading_descriptors', 'Loading relay descriptors')
+    assert tracker.wait(5, target=50)
+    control_server.set_bootstrap(100, 'done', 'Done')
+    assert tracker.wait(5)
+    assert tracker.is_done and tracker.tag == 'done'
+    assert updates == [(10, 'Connected to a relay'), (50, 'Loading relay descriptors'), (100, 'Done')]
+
+def test_wait_gives_up_after_detach(control_server, controller):
+    control_server.set_bootstrap(5, 'conn', 'Connecting to a relay')
+    tracker = BootstrapTracker()
+    tracker.attach(controller)
+    tracker.detach()
+    assert not tracker.wait(1)
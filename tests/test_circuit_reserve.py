@@ -0,0 +1,113 @@
+import pytest
+from src.controllers.circuit_reserve import CircuitReserve
+
+@pytest.fixture
+def reserve(controller):
+    reserve = CircuitReserve(controller, size=2)
+    reserve.start()
+    yield reserve
+    reserve.stop()
+
+def conf(controller, option):
+    return str(controller.msg(f'GETCONF {option}'))
+
+def test_builds_circuits_through_distinct_exits(control_server, controller, reserve, wait_until):
+    current = reserve.wait_for_current(5)
+    assert current is not None
+    assert wait_until(lambda: reserve.available == 2)
+    circuits = [current] + list(reserve._reserve)
+    exits = {reserve.exit_fingerprint(circuit_id) for circuit_id in circuits}
+    assert len(exits) == 3
+    assert all(control_server.circuits[circuit_id]['status'] == 'BUILT' for circuit_id in circuits)
+    assert conf(controller, '__LeaveStreamsUnattached') == '__LeaveStreamsUnattached=1'
+
+def test_attaches_new_streams(control_server, reserve, wait_until):
+    current = reserve.wait_for_current(5)
+    assert wait_until(lambda: reserve.available == 2)
+    pinned = reserve._reserve[0]
+    reserve.pin(40001, pinned)
+
+    control_server.emit('STREAM', '11 NEW 0 example.com:443 SOURCE_ADDR=127.0.0.1:40000 PURPOSE=USER')
+    control_server.emit('STREAM', '12 NEW 0 example.com:443 SOURCE_ADDR=127.0.0.1:40001 PURPOSE=USER')
+    assert wait_until(lambda: len(control_server.attached_streams) == 2)
+    assert control_server.attached_streams == {'11': current, '12': pinned}
+
+def test_rotate_and_replace_closed_circuits(control_server, reserve, wait_until):
+    first = reserve.wait_for_current(5)
+    assert wait_until(lambda: reserve.available == 2)
+
+    second = reserve.rotate()
+    assert second is not None and reserve.current == second
+    # The reserve is topped up again behind the rotation
+    assert wait_until(lambda: reserve.available == 2)
+
+    control_server.close_circuit(second)
+    assert wait_until(lambda: reserve.current not in (None, second))
+    assert wait_until(lambda: reserve.available == 2)
+    assert first in control_server.circuits
+
+def test_stop_hands_streams_back_to_tor(control_server, controller, wait_until):
+    reserve = CircuitReserve(controller, size=1)
+    reserve.start()
+    current = reserve.wait_for_current(5)
+    assert wait_until(lambda: reserve.available == 1)
+    reserved = reserve._reserve[0]
+    reserve.stop()
+
+    assert conf(controller, '__LeaveStreamsUnattached') == '__LeaveStreamsUnattached'
+    assert reserved not in control_server.circuits
+    assert current in control_server.circuits
+    assert reserve.wait_for_current(1) is None
+
+def test_size_zero_routes_only_pinned_streams(control_server, controller, wait_until):
+    reserve = CircuitReserve(controller, size=0)
+    reserve.start()
+    try:
+        assert reserve.wait_for_current(1) is None
+        control_server.emit('STREAM', '21 NEW 0 example.com:443 SOURCE_ADDR=127.0.0.1:40002 PURPOSE=USER')
+        assert wait_until(lambda: '21' in control_server.attached_streams)
+        assert control_server.attached_streams['21'] == '0'
+        assert not control_server.circuits
+    finally:
+        reserve.stop()
+
+def test_promotion_is_reported(control_server, controller, wait_until):
+    promoted = []
+    reserve = CircuitReserve(controller, size=1, change_callback=promoted.append)
+    reserve.start()
+    try:
+        first = reserve.wait_for_current(5)
+        assert wait_until(lambda: reserve.available == 1)
+        assert promoted == [first]
+        second = reserve._reserve[0]
+
+        control_server.close_circuit(first)
+        assert wait_until(lambda: promoted == [first, second])
+        assert reserve.current == second
+    finally:
+        reserve.stop()
+
+def test_stop_during_build_closes_the_circuit(control_server, controller, wait_until):
+    control_server.circuit_delay = 0.3
+    reserve = CircuitReserve(controller, size=1)
+    reserve.start()
+    assert wait_until(lambda: control_server.circuits)
+    reserve.stop()
+
+    assert reserve.current is None and not reserve.available
+    assert wait_until(lambda: not control_server.circuits)
+
+def test_session_follows_closed_reserve_circuit(tor_session, wait_until):
+    session = tor_session(rotation_mode='reserve', circuit_reserve_size=2)
+    reserve = session.reserve
+    first = reserve.current
+    assert wait_until(lambda: reserve.available == 2)
+    assert session.exit_ip == session.exit_resolver.address(first)
+    following = reserve._reserve[0]
+    expected = session.exit_resolver.address(following)
+    assert expected != session.exit_ip
+
+    session.controller.close_circuit(first)
+    assert wait_until(lambda: session.exit_ip == expected)
+    assert reserve.current == following
+    assert session.session_record()['ip'] == expected
@@ -0,0 +1,64 @@
+import sqlite3
+import pytest
+from src.models.connection_history import ConnectionHistory
+
+@pytest.fixture
+def history(tmp_path):
+    history = ConnectionHistory(db_path=str(tmp_path / 'history.db'))
+    yield history
+    history.close()
+
+def test_sub_second_connect_times_have_their_own_buckets(history):
+    for _ in range(20):
+        history.add_connection('198.51.100.1', 60, bootstrap_time=0.3)
+    percentiles = history.percentiles('bootstrap_time', (50, 95))
+    for value in percentiles.values():
+        assert value == pytest.approx(0.3, rel=0.1)
+
+def test_percentiles_within_ten_percent(history):
+    samples = [0.05, 0.3, 0.8, 2.5, 7, 30, 120]
+    for value in samples:
+        history.add_connection('198.51.100.1', 60, bootstrap_time=value)
+    assert history.percentiles('bootstrap_time', (50,))[50] == pytest.approx(2.5, rel=0.1)
+    assert history.percentiles('bootstrap_time', (100,))[100] == pytest.approx(120, rel=0.1)
+
+def test_country_connect_time_ignores_sessions_without_one(history):
+    history.add_connection('198.51.100.1', 60, exit_country='DE', bootstrap_time=4.0)
+    history.add_connection('198.51.100.2', 60, exit_country='DE')
+    history.add_connection('198.51.100.3', 60, exit_country='NL')
+    stats = {row['country']: row for row in history.country_stats()}
+    assert stats['DE']['sessions'] == 2
+    assert stats['DE']['average_bootstrap_time'] == pytest.approx(4.0)
+    assert stats['NL']['average_bootstrap_time'] is None
+
+def test_old_statistics_are_rebuilt(tmp_path):
+    path = str(tmp_path / 'history.db')
+    history = ConnectionHistory(db_path=path)
+    history.add_connection('198.51.100.1', 60, exit_country='DE', bootstrap_time=0.5)
+    history.close()
+    # A database written before sub-second buckets and bootstrap_sessions existed
+    db = sqlite3.connect(path)
+    with db:
+        db.execute('PRAGMA user_version = 0')
+        db.execute('UPDATE country_stats SET bootstrap_sessions = 0')
+        db.execute("UPDATE histograms SET bucket = 0 WHERE metric = 'bootstrap_time'")
+    db.close()
+
+    history = ConnectionHistory(db_path=path)
+    assert history.percentiles('bootstrap_time', (50,))[50] == pytest.approx(0.5, rel=0.1)
+    assert history.country_stats()[0]['average_bootstrap_time'] == pytest.approx(0.5)
+    history.close()
+
+def test_keyset_pages_match_a_full_query(history):
+    for index in range(25):
+        history.add_connection(f'198.51.100.{index % 7}', index % 5)
+    for order_by in ('timestamp', 'ip', 'duration'):
+        for descending in (True, False):
+            rows, last = [], None
+            while True:
+                page = history.query(limit=4, order_by=order_by, descending=descending, after=last)
+                if not page:
+                    break
+                rows += page
+                last = page[-1]
+            assert rows == history.query(order_by=order_by, descending=descending)
@@ -0,0 +1,86 @@
+from stem import Signal
+from src.utils.exit_resolver import ExitResolver
+
+def build(server, wait_until, **kwargs):
+    circuit_id = server.build_circuit(**kwargs)
+    assert wait_until(lambda: server.circuits[circuit_id]['status'] == 'BUILT')
+    return circuit_id
+
+def exit_address(server, circuit_id):
+    return server.circuits[circuit_id]['path'][-1]['address']
+
+def test_first_circuit_becomes_current(control_server, controller, wait_until):
+    existing = build(control_server, wait_until)
+    changes = []
+    resolver = ExitResolver(change_callback=changes.append)
+    resolver.attach(controller)
+    assert resolver.current_exit_ip() == exit_address(control_server, existing)
+    assert changes == [exit_address(control_server, existing)]
+
+def test_internal_and_one_hop_circuits_are_ignored(control_server, controller, wait_until):
+    resolver = ExitResolver()
+    resolver.attach(controller)
+    assert control_server.wait_for_subscriber('CIRC')
+    relays = [relay['fingerprint'] for relay in control_server.relays]
+    # Directory fetches build one-hop tunnels, onion services internal circuits; neither exits anywhere
+    one_hop = build(control_server, wait_until, path=relays[:1], build_flags=['ONEHOP_TUNNEL', 'IS_INTERNAL'])
+    internal = build(control_server, wait_until, path=relays[1:4], build_flags=['IS_INTERNAL', 'NEED_CAPACITY'])
+    short = build(control_server, wait_until, path=relays[4:6])
+    probe = build(control_server, wait_until, path=relays[6:9], purpose='CONTROLLER')
+    exit_circuit = build(control_server, wait_until)
+
+    assert wait_until(lambda: resolver.current_exit_ip() is not None)
+    assert resolver.current_exit_ip() == exit_address(control_server, exit_circuit)
+    for circuit_id in (one_hop, internal, short, probe):
+        assert resolver.exit_fingerprint(circuit_id) is None
+
+    # Stream events never move the current exit onto them either
+    control_server.emit('STREAM', f'1 SUCCEEDED {one_hop} 10.0.0.1:443')
+    control_server.emit('STREAM', f'2 SUCCEEDED {internal} 10.0.0.1:443')
+    # Events arrive in order, so once a later circuit is known the streams above have been handled
+    later = build(control_server, wait_until)
+    assert wait_until(lambda: resolver.exit_fingerprint(later) is not None)
+    assert resolver.current_exit_ip() == exit_address(control_server, exit_circuit)
+
+def test_preemptive_circuits_wait_for_a_stream(control_server, controller, wait_until):
+    first = build(control_server, wait_until)
+    resolver = ExitResolver()
+    resolver.attach(controller)
+    assert control_server.wait_for_subscriber('CIRC')
+
+    preemptive = build(control_server, wait_until)
+    assert wait_until(lambda: resolver.exit_fingerprint(preemptive) is not None)
+    assert resolver.current_exit_ip() == exit_address(control_server, first)
+
+    control_server.emit('STREAM', f'7 SUCCEEDED {preemptive} 10.0.0.1:443')
+    assert wait_until(lambda: resolver.current_exit_ip() == exit_address(control_server, preemptive))
+
+def test_follows_newnym(control_server, controller, wait_until):
+    first = build(control_server, wait_until)
+    resolver = ExitResolver()
+    resolver.attach(controller)
+    assert control_server.wait_for_subscriber('CIRC')
+    previous = resolver.current_exit_ip()
+    assert previous == exit_address(control_server, first)
+
+    resolver.expect_new_exit()
+    controller.signal(Signal.NEWNYM)
+    address = resolver.wait_for_exit(5, exclude=previous)
+    assert address and address != previous
+    assert address == control_server.exit_address()
+
+def test_current_circuit_closed(control_server, controller, wait_until):
+    first = build(control_server, wait_until)
+    resolver = ExitResolver()
+    resolver.attach(controller)
+    control_server.close_circuit(first)
+    assert wait_until(lambda: resolver.current_exit_ip() is None)
+    resolver.detach()
+    assert resolver.wait_for_exit(1) is None
+
+def test_conflux_legs_carry_traffic(control_server, controller, wait_until):
+    resolver = ExitResolver()
+    resolver.attach(controller)
+    assert control_server.wait_for_subscriber('CIRC')
+    leg = build(control_server, wait_until, purpose='CONFLUX_LINKED')
+    assert wait_until(lambda: resolver.current_exit_ip() == exit_address(control_server, leg))
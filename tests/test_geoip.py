@@ -0,0 +1,39 @@
+import time
+from src.utils import geoip
+from src.utils.geoip import GeoIP, get_geoip, warm_geoip
+
+def write_geoip(directory):
+    path = directory / 'geoip'
+    # 198.51.100.0-198.51.100.255 and 203.0.113.0-203.0.113.127
+    path.write_text('# test ranges\n3325256704,3325256959,de\n3405803776,3405803903,NL\n')
+    path6 = directory / 'geoip6'
+    path6.write_text('2001:db8::,2001:db8::ffff,fr\n')
+    return str(path), str(path6)
+
+def test_lookups(tmp_path):
+    database = GeoIP(*write_geoip(tmp_path), cache_dir=str(tmp_path))
+    assert database.available
+    assert database.country('198.51.100.7') == 'DE'
+    assert database.country('203.0.113.127') == 'NL'
+    assert database.country('203.0.113.128') is None
+    assert database.country('[2001:db8::1]') == 'FR'
+    assert database.country('not an address') is None
+    database.close()
+
+    # The range table is cached next to the app data and reused as long as the source file is unchanged
+    reopened = GeoIP(*write_geoip(tmp_path), cache_dir=str(tmp_path))
+    assert reopened.country('198.51.100.7') == 'DE'
+    reopened.close()
+
+def test_non_blocking_access_waits_for_warm_up(tmp_path, monkeypatch):
+    paths = write_geoip(tmp_path)
+    monkeypatch.setattr(geoip, '_geoip', None)
+    monkeypatch.setattr(geoip, 'get_geoip_paths', lambda tor_path: paths)
+    assert get_geoip(block=False) is None
+
+    warm_geoip()
+    deadline = time.monotonic() + 5
+    while get_geoip(block=False) is None and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert get_geoip(block=False) is get_geoip()
+    assert get_geoip(block=False).country('198.51.100.7') == 'DE'
@@ -0,0 +1,39 @@
+from benchmarks.fake_control import make_relays, write_cached_consensus
+from src.utils.relay_index import ExitPolicySummary, RelayIndex
+
+# Tor's default exit policy, as summarized in the consensus
+DEFAULT_EXIT_POLICY = 'reject 25,119,135-139,445,563,1214,4661-4666,6346-6429,6699,6881-6999'
+
+def test_accept_summary():
+    policy = ExitPolicySummary('accept 80,443,6660-6669')
+    assert policy.allows_any()
+    assert policy.allows(443) and policy.allows(6665)
+    assert not policy.allows(25)
+
+def test_reject_summary():
+    policy = ExitPolicySummary(DEFAULT_EXIT_POLICY)
+    assert policy.allows_any()
+    assert policy.allows(443)
+    assert not policy.allows(25) and not policy.allows(137)
+
+def test_reject_everything():
+    assert not ExitPolicySummary('reject 1-65535').allows_any()
+    assert not ExitPolicySummary('reject 1-1000,1001-65535').allows_any()
+    assert ExitPolicySummary('reject 1-79,81-65535').allows_any()
+    assert not ExitPolicySummary('accept ').allows_any()
+
+def test_exits_with_reject_style_policies(tmp_path):
+    relays = make_relays(16)
+    exits = [relay for relay in relays if 'Exit' in relay['flags']]
+    for relay in exits[::2]:
+        relay['policy'] = DEFAULT_EXIT_POLICY
+    write_cached_consensus(str(tmp_path), relays)
+    countries = {relay['address']: relay['country'] for relay in relays}
+    index = RelayIndex(str(tmp_path), country_lookup=lambda addresses: [countries[address] for address in addresses])
+    assert index.refresh()
+
+    assert len(index.exits()) == len(exits)
+    assert sum(index.countries_with_exits().values()) == len(exits)
+    assert len(index.exits(port=6881)) == len(exits[1::2])
+    country = exits[0]['country'].upper()
+    assert index.pick_exit(country) in {relay['fingerprint'] for relay in exits if relay['country'].upper() == country}
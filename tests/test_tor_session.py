@@ -0,0 +1,74 @@
+import pytest
+
+@pytest.fixture
+def session(tor_session):
+    return tor_session(torrc_profile='balanced')
+
+def conf(session, *options):
+    """Ask Tor itself rather than stem's configuration cache"""
+    values = {}
+    for line in str(session.controller.msg(f"GETCONF {' '.join(options)}")).splitlines():
+        key, _, value = line.partition('=')
+        values[key] = value or None
+    return values
+
+def test_reconfigure_profile(session):
+    session.settings['torrc_profile'] = 'low-latency'
+    assert session.reconfigure({'torrc_profile': ('balanced', 'low-latency')})
+    # A fixed build timeout only applies while Tor isn't learning its own
+    assert conf(session, 'CircuitBuildTimeout', 'LearnCircuitBuildTimeout', 'ConfluxClientUX') == \
+        {'CircuitBuildTimeout': '15', 'LearnCircuitBuildTimeout': '0', 'ConfluxClientUX': 'latency'}
+
+    session.settings['torrc_profile'] = 'balanced'
+    assert session.reconfigure({'torrc_profile': ('low-latency', 'balanced')})
+    # Options the new profile doesn't set go back to Tor's defaults
+    assert conf(session, 'CircuitBuildTimeout', 'ConfluxClientUX', 'CircuitsAvailableTimeout') == \
+        {'CircuitBuildTimeout': '60', 'ConfluxClientUX': None, 'CircuitsAvailableTimeout': None}
+    assert session.instance.profile == 'balanced'
+
+def test_reconfigure_bandwidth_limit(session):
+    session.settings['bandwidth_limit'] = 512
+    assert session.reconfigure({'bandwidth_limit': (0, 512)})
+    assert conf(session, 'BandwidthRate', 'BandwidthBurst') == \
+        {'BandwidthRate': '512 KBytes', 'BandwidthBurst': '512 KBytes'}
+
+    session.settings['bandwidth_limit'] = 0
+    assert session.reconfigure({'bandwidth_limit': (512, 0)})
+    assert conf(session, 'BandwidthRate', 'BandwidthBurst') == {'BandwidthRate': None, 'BandwidthBurst': None}
+
+def test_reconfigure_exit_country(session):
+    session.settings['exit_country'] = 'DE'
+    assert session.reconfigure({'exit_country': ('', 'DE')})
+    assert conf(session, 'ExitNodes', 'StrictNodes') == {'ExitNodes': '{DE}', 'StrictNodes': '0'}
+    assert session.instance.exit_country == 'DE'
+
+    session.settings['exit_country'] = ''
+    assert session.reconfigure({'exit_country': ('DE', '')})
+    assert conf(session, 'ExitNodes', 'StrictNodes') == {'ExitNodes': None, 'StrictNodes': None}
+    assert session.instance.exit_country == ''
+
+def test_exit_country_switch_closes_conflux_legs(session):
+    controller = session.controller
+    legs = [controller.new_circuit(purpose='conflux_linked', await_build=True) for _ in range(4)]
+    session.settings['exit_country'] = 'DE'
+    assert session.reconfigure({'exit_country': ('', 'DE')})
+
+    remaining = {circuit.id: circuit.path[-1][0] for circuit in controller.get_circuits()}
+    assert any(circuit_id not in remaining for circuit_id in legs)
+    assert all(session._relay_country(controller, remaining[circuit_id]) == 'DE'
+               for circuit_id in legs if circuit_id in remaining)
+
+def test_reconfigure_needs_connection(session):
+    assert not session.reconfigure({'bridge_transport': ('', 'auto')})
+    session.disconnect()
+    assert not session.reconfigure({'bandwidth_limit': (0, 512)})
+
+def test_session_record_does_not_query_tor(session, monkeypatch):
+    country = session.exit_country()
+    assert country
+
+    def get_info(*args, **kwargs):
+        raise AssertionError('session_record() must not wait for the controller')
+    monkeypatch.setattr(session.controller, 'get_info', get_info)
+    record = session.session_record()
+    assert record['ip'] == session.exit_ip and record['exit_country'] == country